@@ -0,0 +1,33 @@
+import hmac
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException
+from app.api.search import get_search_service
+from app.core.config import settings
+from app.core.models import ProductUpdateRequest, ProductUpdateResponse
+from app.services.search_service import SearchService
+from app.services.updates import UpdateError
+
+router = APIRouter()
+
+def require_admin(x_admin_token: Optional[str] = Header(default=None)):
+    """Admin endpoints are off unless ADMIN_TOKEN is configured, and then require it."""
+    if not settings.ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin API is disabled; set ADMIN_TOKEN to enable it.")
+    if not x_admin_token or not hmac.compare_digest(x_admin_token, settings.ADMIN_TOKEN):
+        raise HTTPException(status_code=401, detail="Invalid or missing X-Admin-Token.")
+
+@router.post("/products", response_model=ProductUpdateResponse, dependencies=[Depends(require_admin)])
+async def update_products(
+    request: ProductUpdateRequest,
+    service: SearchService = Depends(get_search_service)
+):
+    """
+    Upserts and deletes products without a full rebuild. Only changed titles and
+    descriptions are re-embedded, and searches switch to the new snapshot atomically.
+    """
+    upserts = [product.model_dump(exclude_unset=True) for product in request.upserts]
+    try:
+        return await service.cpu_executor.run(service.apply_updates, upserts, request.deletes)
+    except UpdateError as e:
+        raise HTTPException(status_code=400, detail=str(e))
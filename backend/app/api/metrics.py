@@ -0,0 +1,12 @@
+from fastapi import APIRouter, Depends
+from fastapi.responses import PlainTextResponse
+from app.api.search import get_search_service
+from app.core import metrics
+from app.services.search_service import SearchService
+
+router = APIRouter()
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics(service: SearchService = Depends(get_search_service)):
+    """Stage latency histograms plus cache, queue and index gauges in the Prometheus text format."""
+    return PlainTextResponse(metrics.render(service.metric_families()), media_type="text/plain; version=0.0.4")
@@ -1,5 +1,11 @@
-from fastapi import APIRouter, Depends, Request
-from app.core.models import SearchRequest, SearchResponse
+import time
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
+from app.core.config import settings
+from app.core.metrics import STAGE_SECONDS
+from app.core.models import BatchSearchRequest, BatchSearchResponse, SearchRequest, SearchResponse
+from app.services.concurrency import ServiceOverloadedError
+from app.services.facets import FilterError
 from app.services.search_service import SearchService
 
 # --- FIX: Create an instance of the APIRouter ---
@@ -9,25 +15,88 @@ def get_search_service(request: Request) -> SearchService:
     """Dependency to get the search service instance from the app state."""
     # This is a placeholder for a more robust dependency injection system
     # In a real app, you might use a global state or a dependency management library.
-    # For now, we assume the service is initialized and attached in main.py
-    return request.app.state.search_service
+    # The service is loaded by the app's lifespan hook; until then searches get a 503.
+    service = getattr(request.app.state, 'search_service', None)
+    if service is None:
+        raise HTTPException(status_code=503, detail="Search service is starting", headers={"Retry-After": "1"})
+    return service
 
 # --- FIX: Use the router instance as a decorator for your endpoint ---
 @router.post("/search", response_model=SearchResponse)
-def perform_search(
+async def perform_search(
     request: SearchRequest,
     service: SearchService = Depends(get_search_service)
 ):
     """
     Performs a search request using the configured pipeline.
     """
-    # The service is now loaded once at startup and accessed via dependency injection
-    results = service.search(
-        query=request.query,
-        top_k=request.top_k,
-        rewrite_on=request.rewrite_on,
-        rerank_on=request.rerank_on,
-        filters=request.filters,
-        sort_by=request.sort_by
-    )
-    return results
\ No newline at end of file
+    # The service is now loaded once at startup and accessed via dependency injection.
+    # The endpoint is async so it never holds a threadpool worker; the heavy stages
+    # run on the service's own executor and micro-batchers.
+    try:
+        results = await service.search_async(
+            query=request.query,
+            top_k=request.top_k,
+            rewrite_on=request.rewrite_on,
+            rerank_on=request.rerank_on,
+            filters=request.filters,
+            sort_by=request.sort_by,
+            nprobe=request.nprobe,
+            ef_search=request.ef_search,
+            rerank_depth=request.rerank_depth,
+            latency_budget_ms=request.latency_budget_ms,
+            debug_timings=request.debug_timings
+        )
+    except ServiceOverloadedError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except FilterError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    # Serialized here rather than by FastAPI so the time it takes is measured too.
+    start = time.perf_counter()
+    body = SearchResponse.model_validate(results).model_dump_json()
+    STAGE_SECONDS.observe(time.perf_counter() - start, "serialize")
+    return Response(content=body, media_type="application/json")
+
+@router.post("/search/batch", response_model=BatchSearchResponse)
+async def perform_batch_search(
+    request: BatchSearchRequest,
+    service: SearchService = Depends(get_search_service)
+):
+    """
+    Runs many searches in shared model and FAISS calls, for bulk and offline jobs.
+    With `stream`, responses are sent as NDJSON as each chunk of the batch finishes.
+    """
+    if len(request.requests) > settings.SEARCH_BATCH_MAX_QUERIES:
+        raise HTTPException(status_code=413, detail=f"At most {settings.SEARCH_BATCH_MAX_QUERIES} requests per batch")
+    start = time.perf_counter()
+    chunks = service.search_batch_async([item.model_dump() for item in request.requests])
+    # The first chunk is awaited here so an overloaded service still answers 503
+    # (and invalid filters a 400).
+    try:
+        first = await anext(chunks)
+    except ServiceOverloadedError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except FilterError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if request.stream:
+        def ndjson(chunk) -> str:
+            return "".join(SearchResponse.model_validate(results).model_dump_json() + "\n" for results in chunk)
+
+        async def lines():
+            try:
+                yield ndjson(first)
+                async for chunk in chunks:
+                    yield ndjson(chunk)
+            finally:
+                await chunks.aclose()
+        return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+    responses = first + [results async for chunk in chunks for results in chunk]
+    body = BatchSearchResponse(responses=responses, search_time=round(time.perf_counter() - start, 4)).model_dump_json()
+    return Response(content=body, media_type="application/json")
+
+@router.get("/cache/stats")
+async def cache_stats(service: SearchService = Depends(get_search_service)):
+    """Hit/miss/eviction counters of the response, embedding and rewrite caches."""
+    return service.cache_stats()
\ No newline at end of file
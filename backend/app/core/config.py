@@ -1,8 +1,122 @@
 # This file is a placeholder for future configuration management.
 # For a production app, you would use Pydantic's BaseSettings
 # to load config from environment variables.
+import os
+from typing import List
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '..'))
 
 class Settings:
     PROJECT_NAME: str = "E-commerce Search API"
 
-settings = Settings()
\ No newline at end of file
+    # --- Paths ---
+    # Default to the repository layout. MODELS_DIR holds bi-encoder/, cross-encoder/
+    # and onnx/; INDEX_DIR is what training/build_index.py writes (its --index-dir).
+    DATA_PATH: str = os.getenv("DATA_PATH", os.path.join(PROJECT_ROOT, 'training', 'data', 'products.jsonl'))
+    MODELS_DIR: str = os.getenv("MODELS_DIR", os.path.join(PROJECT_ROOT, 'backend', 'models'))
+    INDEX_DIR: str = os.getenv("INDEX_DIR", os.path.join(PROJECT_ROOT, 'backend', 'index'))
+
+    # --- Inference ---
+    # "torch" runs the PyTorch models on TORCH_DEVICE (cpu, cuda, mps); "onnx" runs the
+    # models exported by training/export_onnx.py with ONNX Runtime on CPU, using the
+    # int8-quantized variants when ONNX_QUANTIZED is on and they were exported.
+    INFERENCE_BACKEND: str = os.getenv("INFERENCE_BACKEND", "torch")
+    TORCH_DEVICE: str = os.getenv("TORCH_DEVICE", "cpu")
+    TORCH_THREADS: int = int(os.getenv("TORCH_THREADS", "0"))
+    ONNX_QUANTIZED: bool = os.getenv("ONNX_QUANTIZED", "true").lower() in ("1", "true", "yes")
+    ONNX_INTRA_OP_THREADS: int = int(os.getenv("ONNX_INTRA_OP_THREADS", "0"))
+    NER_MODEL: str = os.getenv("NER_MODEL", "dslim/bert-base-NER")
+
+    # --- Query understanding ---
+    # Brands are matched against the catalog and prices with a pattern; the NER model
+    # only runs on queries where that finds no brand but words capitalized like names
+    # remain (not just a sentence-initial capital), and is not loaded at all with
+    # QUERY_NER_FALLBACK off.
+    QUERY_NER_FALLBACK: bool = os.getenv("QUERY_NER_FALLBACK", "true").lower() in ("1", "true", "yes")
+
+    # --- Micro-batching ---
+    # Concurrent requests are coalesced into shared model calls. A batch is run as
+    # soon as it holds MAX_BATCH_SIZE rows or MAX_WAIT_MS has passed since its first row.
+    ENCODE_MAX_BATCH_SIZE: int = int(os.getenv("ENCODE_MAX_BATCH_SIZE", "32"))
+    ENCODE_MAX_WAIT_MS: float = float(os.getenv("ENCODE_MAX_WAIT_MS", "5"))
+    RERANK_MAX_BATCH_SIZE: int = int(os.getenv("RERANK_MAX_BATCH_SIZE", "512"))
+    RERANK_MAX_WAIT_MS: float = float(os.getenv("RERANK_MAX_WAIT_MS", "5"))
+
+    # --- Reranking ---
+    # At most RERANK_DEPTH candidates (in ANN order) are scored by the cross-encoder;
+    # a request can lower or raise it with rerank_depth. With RERANK_LIGHT_MODEL set
+    # (a smaller cross-encoder; its ONNX export goes in models/onnx/cross-encoder-light),
+    # that model scores the RERANK_DEPTH candidates and the full cross-encoder only
+    # its best RERANK_FULL_DEPTH. Under a request's latency_budget_ms a stage that can
+    # no longer afford RERANK_MIN_DEPTH pairs (keeping RERANK_BUDGET_RESERVE_MS for
+    # building the response) is skipped.
+    RERANK_DEPTH: int = int(os.getenv("RERANK_DEPTH", "200"))
+    RERANK_LIGHT_MODEL: str = os.getenv("RERANK_LIGHT_MODEL", "")
+    RERANK_FULL_DEPTH: int = int(os.getenv("RERANK_FULL_DEPTH", "50"))
+    RERANK_MIN_DEPTH: int = int(os.getenv("RERANK_MIN_DEPTH", "10"))
+    RERANK_BUDGET_RESERVE_MS: float = float(os.getenv("RERANK_BUDGET_RESERVE_MS", "5"))
+
+    # --- Async pipeline & backpressure ---
+    # SEARCH_CPU_WORKERS sizes the pool for NER/FAISS/facets. Up to SEARCH_MAX_CONCURRENCY
+    # searches run at once and SEARCH_MAX_PENDING more may queue; the rest get a 503.
+    SEARCH_CPU_WORKERS: int = int(os.getenv("SEARCH_CPU_WORKERS", str(os.cpu_count() or 4)))
+    SEARCH_MAX_CONCURRENCY: int = int(os.getenv("SEARCH_MAX_CONCURRENCY", "64"))
+    SEARCH_MAX_PENDING: int = int(os.getenv("SEARCH_MAX_PENDING", "256"))
+
+    # --- Batch search ---
+    # /search/batch accepts up to SEARCH_BATCH_MAX_QUERIES requests and runs them
+    # SEARCH_BATCH_CHUNK_SIZE at a time: one NER, encode, FAISS and rerank call per
+    # chunk. A batch holds a single admission slot while it runs.
+    SEARCH_BATCH_MAX_QUERIES: int = int(os.getenv("SEARCH_BATCH_MAX_QUERIES", "10000"))
+    SEARCH_BATCH_CHUNK_SIZE: int = int(os.getenv("SEARCH_BATCH_CHUNK_SIZE", "64"))
+
+    # --- Hybrid retrieval ---
+    # With HYBRID_SEARCH on (and a BM25 index next to the catalog), the top
+    # LEXICAL_CANDIDATES BM25 matches are fused with the ANN candidates by reciprocal
+    # rank fusion, 1 / (RRF_K + rank), before reranking.
+    HYBRID_SEARCH: bool = os.getenv("HYBRID_SEARCH", "true").lower() in ("1", "true", "yes")
+    LEXICAL_CANDIDATES: int = int(os.getenv("LEXICAL_CANDIDATES", "100"))
+    RRF_K: int = int(os.getenv("RRF_K", "60"))
+
+    # --- ANN search defaults ---
+    # Used when a request does not set nprobe / ef_search; ignored for flat indexes.
+    FAISS_NPROBE: int = int(os.getenv("FAISS_NPROBE", "16"))
+    FAISS_EF_SEARCH: int = int(os.getenv("FAISS_EF_SEARCH", "64"))
+    # Indexes built with compressed vectors (--compression, --pca or ivf_pq) keep the
+    # float32 vectors in a memory-mapped file next to the catalog. With VECTOR_RESCORE
+    # the compressed index returns RESCORE_FACTOR times the candidates, which are
+    # re-scored exactly against those vectors and cut back down.
+    VECTOR_RESCORE: bool = os.getenv("VECTOR_RESCORE", "true").lower() in ("1", "true", "yes")
+    RESCORE_FACTOR: int = int(os.getenv("RESCORE_FACTOR", "2"))
+
+    # --- Serving ---
+    # `python -m app.serve` loads the service once and forks SERVE_WORKERS processes
+    # (0: one per core) that share it. FAISS_MMAP memory-maps the FAISS index so it
+    # lives in the page cache, shared by every worker, rather than in each heap.
+    SERVE_WORKERS: int = int(os.getenv("SERVE_WORKERS", "0"))
+    FAISS_MMAP: bool = os.getenv("FAISS_MMAP", "true").lower() in ("1", "true", "yes")
+
+    # --- Caches ---
+    # Sizes are entry counts (0 disables a cache); TTLs are in seconds.
+    RESPONSE_CACHE_SIZE: int = int(os.getenv("RESPONSE_CACHE_SIZE", "10000"))
+    RESPONSE_CACHE_TTL_S: float = float(os.getenv("RESPONSE_CACHE_TTL_S", "300"))
+    EMBEDDING_CACHE_SIZE: int = int(os.getenv("EMBEDDING_CACHE_SIZE", "50000"))
+    EMBEDDING_CACHE_TTL_S: float = float(os.getenv("EMBEDDING_CACHE_TTL_S", "3600"))
+    REWRITE_CACHE_SIZE: int = int(os.getenv("REWRITE_CACHE_SIZE", "50000"))
+    REWRITE_CACHE_TTL_S: float = float(os.getenv("REWRITE_CACHE_TTL_S", "3600"))
+
+    # --- Facets ---
+    # Bucket lower bounds; each bucket runs up to the next bound and the last one is open-ended.
+    PRICE_FACET_BOUNDARIES: List[float] = [float(v) for v in os.getenv("PRICE_FACET_BOUNDARIES", "0,50,100,250").split(",")]
+    RATING_FACET_BOUNDARIES: List[float] = [float(v) for v in os.getenv("RATING_FACET_BOUNDARIES", "0,3,4,4.5").split(",")]
+    BRAND_FACET_SIZE: int = int(os.getenv("BRAND_FACET_SIZE", "10"))
+
+    # --- Incremental updates ---
+    # The admin endpoints are disabled unless ADMIN_TOKEN is set (sent as X-Admin-Token).
+    # Workers poll for snapshots activated elsewhere every SNAPSHOT_POLL_S seconds, and
+    # the newest SNAPSHOT_RETENTION snapshots are kept on disk.
+    ADMIN_TOKEN: str = os.getenv("ADMIN_TOKEN", "")
+    SNAPSHOT_POLL_S: float = float(os.getenv("SNAPSHOT_POLL_S", "1"))
+    SNAPSHOT_RETENTION: int = int(os.getenv("SNAPSHOT_RETENTION", "2"))
+
+settings = Settings()
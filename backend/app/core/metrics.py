@@ -0,0 +1,116 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+# In-process metrics in the Prometheus text format, served on /metrics. Histograms
+# are recorded as requests run; gauges and counters that mirror service state
+# (caches, queues) are collected when the endpoint is scraped. Metrics are per
+# process, so each worker is scraped on its own.
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024)
+
+Sample = Tuple[Dict[str, str], float]
+
+
+def _labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for v in labels.values())
+    return "{" + ",".join(f'{k}="{v}"' for k, v in zip(labels, escaped)) + "}"
+
+
+def _value(value: float) -> str:
+    return "+Inf" if value == float('inf') else repr(float(value))
+
+
+def format_family(name: str, kind: str, help_text: str, samples: Iterable[Sample]) -> str:
+    """Renders one gauge or counter family."""
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+    lines.extend(f"{name}{_labels(labels)} {_value(value)}" for labels, value in samples)
+    return "\n".join(lines)
+
+
+class Histogram:
+    """
+    Cumulative-bucket histogram keyed by label values.
+
+    `observe` is a bisect and three additions under a lock, cheap enough to call
+    for every stage of every request.
+    """
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple[str, ...], List] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labelvalues: str):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                series = self._series[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {key: (list(counts), total, count) for key, (counts, total, count) in self._series.items()}
+        for labelvalues, (counts, total, count) in sorted(series.items()):
+            labels = dict(zip(self.labelnames, labelvalues))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{_labels({**labels, 'le': _value(bound)})} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(labels)} {_value(total)}")
+            lines.append(f"{self.name}_count{_labels(labels)} {count}")
+        return "\n".join(lines)
+
+
+STAGE_SECONDS = Histogram("search_stage_seconds", "Wall-clock time of each search pipeline stage.", ("stage",))
+REQUEST_SECONDS = Histogram("search_request_seconds", "End-to-end search time inside the service.", ("cache",))
+BATCH_ROWS = Histogram("batcher_batch_rows", "Rows per model call made by a micro-batcher.", ("batcher",), SIZE_BUCKETS)
+HISTOGRAMS = (STAGE_SECONDS, REQUEST_SECONDS, BATCH_ROWS)
+
+
+def render(families: Iterable[str] = ()) -> str:
+    """The full exposition: every histogram plus already formatted gauge/counter families."""
+    return "\n".join([h.render() for h in HISTOGRAMS] + list(families)) + "\n"
+
+
+class RequestTimings:
+    """
+    Per-request stage timer. Each `stage` block is added to this request's totals
+    and recorded in STAGE_SECONDS.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def record(self, name: str, seconds: float):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+        STAGE_SECONDS.observe(seconds, name)
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def milliseconds(self, total: Optional[float] = None) -> Dict[str, float]:
+        timings = {name: round(seconds * 1000, 3) for name, seconds in self.stages.items()}
+        timings["total"] = round((self.elapsed() if total is None else total) * 1000, 3)
+        return timings
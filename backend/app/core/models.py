@@ -10,6 +10,16 @@ class SearchRequest(BaseModel):
     # NEW: Add filters and sort_by to the request
     filters: Optional[Dict[str, Any]] = None
     sort_by: Optional[str] = 'relevance'
+    # ANN knobs for IVF (nprobe) and HNSW (ef_search) indexes; None uses the server default.
+    nprobe: Optional[int] = Field(default=None, ge=1)
+    ef_search: Optional[int] = Field(default=None, ge=1)
+    # Number of candidates scored by the cross-encoder; None uses RERANK_DEPTH.
+    rerank_depth: Optional[int] = Field(default=None, ge=1)
+    # Time budget for the whole search; reranking scores fewer candidates, or is
+    # skipped, when it would not fit. None means no budget.
+    latency_budget_ms: Optional[float] = Field(default=None, gt=0)
+    # Adds per-stage wall-clock times (ms) to the response.
+    debug_timings: bool = False
 
 # ... (RewrittenQuery and ProductResult remain the same) ...
 class RewrittenQuery(BaseModel):
@@ -36,4 +46,48 @@ class SearchResponse(BaseModel):
     rewritten_query: Optional[RewrittenQuery]
     results: List[ProductResult]
     # NEW: Add facets to the response
-    facets: List[Facet] = []
\ No newline at end of file
+    facets: List[Facet] = []
+    # Ranking stages in the order they ran: {"stage", "candidates"} for each stage
+    # that scored candidates (plus "cut": "latency_budget" when the budget made it
+    # score fewer), {"stage", "skipped"} with the reason otherwise.
+    rerank_stages: List[Dict[str, Any]] = []
+    # Seconds spent inside the service (serialization not included).
+    search_time: Optional[float] = None
+    # Per-stage milliseconds, only when the request set debug_timings.
+    timings: Optional[Dict[str, float]] = None
+
+# --- Batch search ---
+class BatchSearchRequest(BaseModel):
+    requests: List[SearchRequest] = Field(min_length=1)
+    # Stream the responses as NDJSON (one SearchResponse per line, in request order)
+    # instead of one JSON document.
+    stream: bool = False
+
+class BatchSearchResponse(BaseModel):
+    responses: List[SearchResponse]
+    # Seconds for the whole batch.
+    search_time: float
+
+# --- Admin: incremental catalog updates ---
+class ProductUpsert(BaseModel):
+    # Fields left out keep their current values when the product already exists.
+    product_id: str
+    title: Optional[str] = None
+    brand: Optional[str] = None
+    price: Optional[float] = None
+    rating: Optional[float] = None
+    image_url: Optional[str] = None
+    description: Optional[str] = None
+
+class ProductUpdateRequest(BaseModel):
+    upserts: List[ProductUpsert] = []
+    deletes: List[str] = []
+
+class ProductUpdateResponse(BaseModel):
+    snapshot: str
+    version: str
+    upserted: int
+    deleted: int
+    not_found: List[str]
+    embedded: int
+    num_products: int
@@ -1,26 +1,61 @@
-from fastapi import FastAPI
+import asyncio
+import os
+from contextlib import asynccontextmanager
+from typing import Optional
+
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware # <-- 1. IMPORT THIS
-from app.api import search
+from app.api import admin, metrics, search
 from app.services.search_service import SearchService
-import os
 
-# This is a placeholder for a more robust startup/shutdown event handler
-# In a real app, you would load the service during the startup event.
-search_service = SearchService(
-    data_path=None, # These paths are now calculated inside the service
-    bi_encoder_path=None,
-    cross_encoder_path=None,
-    faiss_index_path=None
-)
+# Set by app.serve in the parent process before it forks workers: each worker then
+# serves this already loaded service (models, catalog and index shared copy-on-write
+# or memory-mapped) instead of loading its own.
+preloaded_service: Optional[SearchService] = None
+
+
+def load_service() -> SearchService:
+    return SearchService(
+        data_path=None, # These paths are now calculated inside the service
+        bi_encoder_path=None,
+        cross_encoder_path=None,
+        faiss_index_path=None
+    )
+
+
+async def _start_service(app: FastAPI):
+    """Loads (or adopts) the service and warms it up off the event loop, then marks the app ready."""
+    try:
+        service = preloaded_service or await asyncio.to_thread(load_service)
+        await asyncio.to_thread(service.warmup)
+    except Exception as e:
+        app.state.startup_error = f"{type(e).__name__}: {e}"
+        print(f"❌ Search service failed to start: {app.state.startup_error}")
+        return
+    app.state.search_service = service
+    print(f"--- Worker {os.getpid()} ready ---")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Loading runs in the background so /health answers (and /ready reports 503)
+    # while the models and index load; search requests get a 503 until then.
+    app.state.search_service = None
+    app.state.startup_error = None
+    starting = asyncio.create_task(_start_service(app))
+    yield
+    if not starting.done():
+        starting.cancel()
+    if app.state.search_service is not None:
+        app.state.search_service.close()
+
 
 app = FastAPI(
     title="E-commerce Search API",
-    description="API for semantic product search and reranking."
+    description="API for semantic product search and reranking.",
+    lifespan=lifespan
 )
 
-# Store the service in the app state to be accessible in path operations
-app.state.search_service = search_service
-
 # --- 2. ADD THE CORS MIDDLEWARE ---
 # This is the crucial part that fixes the "Search failed" error.
 app.add_middleware(
@@ -33,7 +68,21 @@ app.add_middleware(
 
 # --- Routers ---
 app.include_router(search.router, prefix="/api/v1", tags=["Search"])
+app.include_router(admin.router, prefix="/api/v1/admin", tags=["Admin"])
+app.include_router(metrics.router, tags=["Metrics"])
 
 @app.get("/health", tags=["Health"])
-def health_check():
-    return {"status": "ok"}
\ No newline at end of file
+async def health_check():
+    """Liveness: the process is up, whether or not the service has finished loading."""
+    return {"status": "ok"}
+
+@app.get("/ready", tags=["Health"])
+async def readiness_check(response: Response):
+    """Readiness: 200 once this worker has loaded and warmed up the service, 503 before (or if loading failed)."""
+    service = app.state.search_service
+    if service is None:
+        response.status_code = 503
+        if app.state.startup_error:
+            return {"status": "failed", "error": app.state.startup_error}
+        return {"status": "starting"}
+    return {"status": "ready", "pid": os.getpid(), "snapshot": service.snapshot.name or "base", "version": service.snapshot.version}
@@ -0,0 +1,120 @@
+import argparse
+import gc
+import os
+import signal
+import socket
+import time
+import traceback
+
+import faiss
+import uvicorn
+
+from app.core.config import settings
+
+# Pre-fork server: `python -m app.serve --workers 8` (from backend/).
+#
+# The parent loads the search service once (models, catalog, filter and BM25
+# indexes, memory-mapped FAISS index), opens the listening socket and forks the
+# workers, which all accept on that socket. Workers share what the parent loaded:
+# memory-mapped files through the page cache, everything else copy-on-write, so
+# adding a worker costs its own request state rather than another copy of the
+# models and index. The parent never runs a model, because inference thread pools
+# (and ONNX Runtime sessions, which are created in each worker) do not survive a
+# fork. Each worker warms up in its lifespan hook before /ready reports 200.
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Serve the search API from several worker processes that share one loaded service.")
+    parser.add_argument('--host', default="0.0.0.0")
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--workers', type=int, default=settings.SERVE_WORKERS, help="Worker processes (default: SERVE_WORKERS, 0 = one per core).")
+    parser.add_argument('--backlog', type=int, default=2048)
+    parser.add_argument('--log-level', default="info")
+    return parser.parse_args()
+
+
+def configure_threads(workers: int):
+    """Splits the cores between workers for every thread pool not sized explicitly."""
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    if not settings.TORCH_THREADS:
+        settings.TORCH_THREADS = threads
+    if not settings.ONNX_INTRA_OP_THREADS:
+        settings.ONNX_INTRA_OP_THREADS = threads
+    faiss.omp_set_num_threads(threads)
+
+
+def bind_socket(host: str, port: int, backlog: int) -> socket.socket:
+    sock = socket.socket(socket.AF_INET6 if ':' in host else socket.AF_INET)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def spawn_worker(sock: socket.socket, log_level: str) -> int:
+    pid = os.fork()
+    if pid:
+        return pid
+    # Worker: uvicorn installs its own shutdown handlers.
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    status = 0
+    try:
+        from app.main import app
+        uvicorn.Server(uvicorn.Config(app, log_level=log_level, lifespan="on")).run(sockets=[sock])
+    except BaseException:
+        traceback.print_exc()
+        status = 1
+    finally:
+        os._exit(status)
+
+
+def main():
+    args = parse_args()
+    workers = args.workers or os.cpu_count() or 1
+    configure_threads(workers)
+
+    # --- 1. Load the service once, in the parent ---
+    print(f"--- Preloading the search service for {workers} workers ---")
+    from app import main as app_main
+    app_main.preloaded_service = app_main.load_service()
+    # Everything loaded so far lives as long as the workers do. Freezing it keeps the
+    # garbage collector in each worker from writing to, and so copying, its pages.
+    gc.freeze()
+
+    # --- 2. Fork the workers onto a shared socket ---
+    sock = bind_socket(args.host, args.port, args.backlog)
+    children = {spawn_worker(sock, args.log_level) for _ in range(workers)}
+    print(f"Serving on {args.host}:{args.port} with workers {sorted(children)}")
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    # --- 3. Supervise: replace workers that die until asked to stop ---
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        children.discard(pid)
+        if not stopping:
+            print(f"Worker {pid} exited with status {status}; starting a replacement.")
+            time.sleep(1)
+            children.add(spawn_worker(sock, args.log_level))
+    sock.close()
+    print("--- All workers stopped ---")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+
+from app.core.metrics import BATCH_ROWS
+
+_STOP = object()
+
+
+class MicroBatcher:
+    """
+    Coalesces concurrent calls into shared batches for a single batch function.
+
+    Each caller submits a list of rows (e.g. query strings or query/product pairs)
+    and gets back a Future for the matching slice of outputs. A background worker
+    collects submissions until either `max_batch_size` rows are queued or
+    `max_wait_ms` has elapsed since the first row arrived, runs `batch_fn` once on
+    the concatenated rows and fans the outputs back out to each caller.
+    """
+
+    def __init__(self, batch_fn: Callable[[List[Any]], Sequence[Any]], max_batch_size: int, max_wait_ms: float, name: str = "batcher"):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self.name = name
+        self._lock = threading.Lock()
+        self._queue: "queue.Queue[Any]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+
+    def submit(self, rows: List[Any]) -> Future:
+        """Queues `rows` for the next batch and returns a Future for their outputs."""
+        future: Future = Future()
+        if not rows:
+            future.set_result([])
+            return future
+        self._ensure_worker()
+        self._queue.put((list(rows), future))
+        return future
+
+    def __call__(self, rows: List[Any]) -> Sequence[Any]:
+        """Blocking helper: submits `rows` and waits for their outputs."""
+        return self.submit(rows).result()
+
+    @property
+    def pending(self) -> int:
+        """Submissions waiting for a batch."""
+        return self._queue.qsize()
+
+    def close(self):
+        """Stops the worker thread once the already queued batches are done."""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                self._queue.put(_STOP)
+                self._thread.join()
+            self._thread = None
+
+    def _ensure_worker(self):
+        # The worker is started lazily (and restarted after a fork) because threads
+        # do not survive os.fork() and the service may be built in a parent process.
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            if self._pid != os.getpid():
+                self._queue = queue.Queue()
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name=f"{self.name}-batcher", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        carry = None
+        while True:
+            first = carry if carry is not None else self._queue.get()
+            carry = None
+            if first is _STOP:
+                return
+            batch = [first]
+            size = len(first[0])
+            deadline = time.monotonic() + self.max_wait
+            while size < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is _STOP or size + len(item[0]) > self.max_batch_size:
+                    # Keep oversized or shutdown items for the next round so a batch
+                    # never grows past max_batch_size because of a late arrival.
+                    carry = item
+                    break
+                batch.append(item)
+                size += len(item[0])
+            self._dispatch(batch)
+
+    def _dispatch(self, batch: List[Tuple[List[Any], Future]]):
+        live = [(rows, future) for rows, future in batch if future.set_running_or_notify_cancel()]
+        if not live:
+            return
+        flat = [row for rows, _ in live for row in rows]
+        BATCH_ROWS.observe(len(flat), self.name)
+        try:
+            outputs = self.batch_fn(flat)
+            if len(outputs) != len(flat):
+                raise RuntimeError(f"{self.name}: batch function returned {len(outputs)} outputs for {len(flat)} rows")
+        except Exception as exc:
+            for _, future in live:
+                future.set_exception(exc)
+            return
+        offset = 0
+        for rows, future in live:
+            future.set_result(outputs[offset:offset + len(rows)])
+            offset += len(rows)
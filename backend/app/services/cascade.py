@@ -0,0 +1,171 @@
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from app.services.batching import MicroBatcher
+from app.services.inference import PairTemplate, cross_encoder_max_length, predict_features
+from app.services.rerank_tokens import tokenize_texts, tokenizer_fingerprint
+
+# Reranking runs as a cascade over the ANN candidates, which arrive ordered by FAISS
+# distance (stage 0): an optional light cross-encoder scores the first `rerank_depth`
+# of them, and the full cross-encoder scores only the best RERANK_FULL_DEPTH of
+# those. Each stage keeps a running estimate of its per-pair latency, so a request
+# with a latency budget scores fewer pairs, or skips a stage, when the remaining
+# budget would not cover it.
+
+COST_EWMA_ALPHA = 0.2
+
+
+class CostEstimator:
+    """Exponentially weighted moving average of a stage's observed seconds per pair."""
+
+    def __init__(self, alpha: float = COST_EWMA_ALPHA):
+        self.alpha = alpha
+        self.seconds_per_pair: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def observe(self, pairs: int, seconds: float):
+        if pairs <= 0:
+            return
+        rate = seconds / pairs
+        with self._lock:
+            if self.seconds_per_pair is None:
+                self.seconds_per_pair = rate
+            else:
+                self.seconds_per_pair += self.alpha * (rate - self.seconds_per_pair)
+
+    def seconds(self, pairs: int) -> float:
+        """Expected time to score `pairs` pairs (0 until the first observation)."""
+        return (self.seconds_per_pair or 0.0) * pairs
+
+    def affordable(self, wanted: int, remaining_seconds: Optional[float]) -> int:
+        """How many of `wanted` pairs fit in the remaining budget (all of them without a budget or an estimate yet)."""
+        if remaining_seconds is None or self.seconds_per_pair is None:
+            return wanted
+        if remaining_seconds <= 0:
+            return 0
+        return min(wanted, int(remaining_seconds / max(self.seconds_per_pair, 1e-9)))
+
+
+class RerankStage:
+    """
+    One cross-encoder of the cascade: frames (query, product row) pairs for it,
+    scores them through its own micro-batcher and tracks its per-pair cost.
+
+    The stage reuses a snapshot's pre-tokenized product texts when they were written
+    by the same tokenizer; otherwise it tokenizes the product texts per request.
+    """
+
+    def __init__(self, name: str, cross_encoder, max_batch_size: int, max_wait_ms: float):
+        self.name = name
+        self.cross_encoder = cross_encoder
+        self.tokenizer = cross_encoder.tokenizer
+        self.template = PairTemplate(self.tokenizer, cross_encoder_max_length(cross_encoder))
+        self.fingerprint = tokenizer_fingerprint(self.tokenizer)
+        self.cost = CostEstimator()
+        self.batcher = MicroBatcher(self._predict_batch, max_batch_size=max_batch_size, max_wait_ms=max_wait_ms, name=name)
+
+    def _predict_batch(self, pairs: List[Tuple[List[int], np.ndarray]]) -> np.ndarray:
+        """Scores a coalesced batch of (query ids, product ids) pairs in a single cross-encoder call."""
+        return predict_features(self.cross_encoder, self.template.features(pairs))
+
+    def pairs(self, snapshot, search_query: str, rows: np.ndarray) -> List[Tuple[List[int], np.ndarray]]:
+        max_length = self.template.max_length
+        query_ids = tokenize_texts(self.tokenizer, [search_query], max_length)[0]
+        tokens = snapshot.rerank_tokens
+        if tokens is not None and tokens.fingerprint == self.fingerprint:
+            products = [tokens[row] for row in rows]
+        else:
+            products = tokenize_texts(self.tokenizer, [snapshot.catalog.rerank_text(row) for row in rows], max_length)
+        return [(query_ids, product_ids) for product_ids in products]
+
+    def submit(self, pairs: List[Tuple[List[int], np.ndarray]]) -> Future:
+        """Queues pairs for scoring; the time until the scores arrive feeds the cost estimate."""
+        started = time.perf_counter()
+        future = self.batcher.submit(pairs)
+        if pairs:
+            future.add_done_callback(lambda f: self.cost.observe(len(pairs), time.perf_counter() - started))
+        return future
+
+    def __call__(self, pairs: List[Tuple[List[int], np.ndarray]]) -> np.ndarray:
+        return self.submit(pairs).result()
+
+    def score_many(self, pair_lists: List[List[Tuple[List[int], np.ndarray]]]) -> List[np.ndarray]:
+        """
+        Scores the pairs of several requests together and returns each request's
+        scores. The pairs are sorted by length and scored in batcher-sized calls, so
+        each call pads to similar lengths rather than to the longest pair of the whole
+        batch. Bypasses the batcher and the cost estimate, whose per-pair time is for
+        interactive batches.
+        """
+        pairs = [pair for pair_list in pair_lists for pair in pair_list]
+        scores = np.zeros(len(pairs), dtype=np.float32)
+        order = np.argsort([len(query_ids) + len(product_ids) for query_ids, product_ids in pairs], kind='stable')
+        batch_size = self.batcher.max_batch_size
+        for start in range(0, len(order), batch_size):
+            batch = order[start:start + batch_size]
+            scores[batch] = self._predict_batch([pairs[i] for i in batch])
+        return np.split(scores, np.cumsum([len(pair_list) for pair_list in pair_lists])[:-1])
+
+    def warmup(self, snapshot, rows: np.ndarray):
+        """Scores `rows` once, bypassing the batcher so the cost estimate only sees real traffic."""
+        if len(rows):
+            self._predict_batch(self.pairs(snapshot, "warmup", rows))
+
+    def close(self):
+        self.batcher.close()
+
+
+class RerankCascade:
+    """
+    Decides, stage by stage, how many of the current top candidates each rerank
+    stage scores.
+
+    The first stage that runs scores `rerank_depth` candidates; every later one
+    scores at most `full_depth` of the previous stage's best. A stage is skipped
+    when it would not narrow the candidates for the next one, or when the time
+    left before the request's deadline (minus `reserve_s`, and minus what the later
+    stages are expected to need) covers fewer than `min_depth` pairs.
+    """
+
+    def __init__(self, stages: List[RerankStage], full_depth: int, min_depth: int, reserve_s: float):
+        self.stages = stages
+        self.full_depth = full_depth
+        self.min_depth = min_depth
+        self.reserve_s = reserve_s
+
+    def plan(self, num_rows: int, rerank_depth: int, deadline: Optional[float], report: List[Dict[str, Any]]) -> Iterator[Tuple[RerankStage, int]]:
+        """
+        Yields (stage, number of top rows to score) for each stage that should run.
+
+        The caller scores and reorders the rows between steps, so each decision sees
+        the time actually spent so far. Every stage is recorded in `report`, and one
+        that scores fewer rows than it would without the budget is marked "cut".
+        """
+        depth = min(num_rows, rerank_depth)
+        for i, stage in enumerate(self.stages):
+            later = self.stages[i + 1:]
+            if later and depth <= self.full_depth:
+                report.append({"stage": stage.name, "skipped": "depth"})
+                continue
+            wanted = depth
+            if deadline is not None:
+                remaining = deadline - time.time() - self.reserve_s
+                remaining -= sum(s.cost.seconds(min(depth, self.full_depth)) for s in later)
+                wanted = stage.cost.affordable(depth, remaining)
+            if wanted < min(self.min_depth, depth) or wanted == 0:
+                report.append({"stage": stage.name, "skipped": "latency_budget" if depth else "no_candidates"})
+                continue
+            entry = {"stage": stage.name, "candidates": wanted}
+            if wanted < depth:
+                entry["cut"] = "latency_budget"
+            report.append(entry)
+            yield stage, wanted
+            depth = min(wanted, self.full_depth)
+
+    def close(self):
+        for stage in self.stages:
+            stage.close()
@@ -0,0 +1,208 @@
+import hashlib
+import json
+import mmap
+import os
+from array import array
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+
+# On-disk layout of a catalog directory (written once by build_index.py):
+#
+#   meta.json                  version, row count, field lists and the brand vocabulary
+#   ids.npy                    int64 FAISS id of each row (int(product_id))
+#   id_order.npy               argsort of ids.npy, used to map FAISS ids back to rows
+#   sorted_ids.npy             ids.npy in id_order, searched with np.searchsorted
+#   price.npy / rating.npy     float64 columns, NaN when missing
+#   brand.npy                  int32 code into meta["brands"], -1 when missing
+#   <field>.bin                UTF-8 strings of a text field, concatenated
+#   <field>.offsets.npy        int64 start offsets into <field>.bin (num_rows + 1 entries)
+#
+# Every file is memory-mapped by ProductCatalog, so startup does no parsing and
+# all worker processes share a single page-cache copy.
+
+STRING_FIELDS = ('product_id', 'title', 'image_url', 'description')
+NUMERIC_FIELDS = ('price', 'rating')
+FORMAT_VERSION = 1
+
+
+class CatalogWriter:
+    """Streams products into the columnar catalog format, one row at a time."""
+
+    def __init__(self, path: str, brands: Iterable[str] = ()):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self._ids = array('q')
+        self._numeric = {field: array('d') for field in NUMERIC_FIELDS}
+        self._brand_codes = array('i')
+        # Seeding the vocabulary with an existing catalog's brands keeps its brand codes valid.
+        self._brands: Dict[str, int] = {brand: code for code, brand in enumerate(brands)}
+        self._blobs = {field: open(os.path.join(path, f"{field}.bin"), 'wb') for field in STRING_FIELDS}
+        self._offsets = {field: array('q', [0]) for field in STRING_FIELDS}
+        self._digest = hashlib.sha1()
+
+    def append(self, product: Dict[str, Any]):
+        self._ids.append(int(product['product_id']))
+        for field in NUMERIC_FIELDS:
+            value = product.get(field)
+            self._numeric[field].append(float(value) if value is not None else float('nan'))
+        brand = product.get('brand')
+        self._brand_codes.append(self._brands.setdefault(brand, len(self._brands)) if brand else -1)
+        for field in STRING_FIELDS:
+            data = (product.get(field) or '').encode('utf-8')
+            self._blobs[field].write(data)
+            self._offsets[field].append(self._offsets[field][-1] + len(data))
+            self._digest.update(data)
+        self._digest.update(repr((product.get('brand'), product.get('price'), product.get('rating'))).encode('utf-8'))
+
+    def extend(self, products: Iterable[Dict[str, Any]]):
+        for product in products:
+            self.append(product)
+
+    def copy_rows(self, catalog: "ProductCatalog", rows: np.ndarray):
+        """
+        Appends rows of an existing catalog column by column, without decoding them.
+
+        `rows` must be ascending and the writer must have been seeded with the
+        catalog's brands. Text is copied as one blob slice per run of consecutive rows.
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        self._ids.frombytes(np.ascontiguousarray(catalog.ids[rows], dtype=np.int64).tobytes())
+        for field in NUMERIC_FIELDS:
+            self._numeric[field].frombytes(np.ascontiguousarray(getattr(catalog, field)[rows], dtype=np.float64).tobytes())
+        self._brand_codes.frombytes(np.ascontiguousarray(catalog.brand_codes[rows], dtype=np.int32).tobytes())
+        runs = np.split(rows, np.flatnonzero(np.diff(rows) != 1) + 1) if len(rows) else []
+        for field in STRING_FIELDS:
+            column = catalog._strings[field]
+            lengths = np.asarray(column.offsets[rows + 1]) - np.asarray(column.offsets[rows])
+            self._offsets[field].extend((self._offsets[field][-1] + np.cumsum(lengths)).tolist())
+            for run in runs:
+                self._blobs[field].write(column.raw(int(run[0]), int(run[-1]) + 1))
+        self._digest.update(catalog.version.encode('utf-8'))
+        self._digest.update(rows.tobytes())
+
+    def close(self) -> str:
+        """Writes the column files and meta.json; returns the catalog version."""
+        for blob in self._blobs.values():
+            blob.close()
+        ids = np.frombuffer(self._ids, dtype=np.int64) if len(self._ids) else np.zeros(0, dtype=np.int64)
+        np.save(os.path.join(self.path, 'ids.npy'), ids)
+        id_order = np.argsort(ids, kind='stable')
+        np.save(os.path.join(self.path, 'id_order.npy'), id_order)
+        np.save(os.path.join(self.path, 'sorted_ids.npy'), ids[id_order])
+        for field, values in self._numeric.items():
+            np.save(os.path.join(self.path, f"{field}.npy"), np.array(values, dtype=np.float64))
+        np.save(os.path.join(self.path, 'brand.npy'), np.array(self._brand_codes, dtype=np.int32))
+        for field, offsets in self._offsets.items():
+            np.save(os.path.join(self.path, f"{field}.offsets.npy"), np.array(offsets, dtype=np.int64))
+        version = self._digest.hexdigest()[:16]
+        with open(os.path.join(self.path, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump({
+                "format_version": FORMAT_VERSION,
+                "version": version,
+                "num_rows": len(self._ids),
+                "string_fields": list(STRING_FIELDS),
+                "numeric_fields": list(NUMERIC_FIELDS),
+                "brands": list(self._brands),
+            }, f)
+        return version
+
+
+def write_catalog(products: Iterable[Dict[str, Any]], path: str) -> str:
+    """Writes `products` as a columnar catalog at `path` and returns its version."""
+    writer = CatalogWriter(path)
+    writer.extend(products)
+    return writer.close()
+
+
+class _StringColumn:
+    def __init__(self, blob_path: str, offsets_path: str):
+        self.offsets = np.load(offsets_path, mmap_mode='r')
+        self._file = open(blob_path, 'rb')
+        size = os.fstat(self._file.fileno()).st_size
+        self._blob = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+
+    def __getitem__(self, row: int) -> str:
+        return self._blob[int(self.offsets[row]):int(self.offsets[row + 1])].decode('utf-8')
+
+    def raw(self, start_row: int, end_row: int) -> bytes:
+        """The encoded text of rows [start_row, end_row), back to back."""
+        return self._blob[int(self.offsets[start_row]):int(self.offsets[end_row])]
+
+
+class ProductCatalog:
+    """
+    Read-only, memory-mapped view of a columnar product catalog.
+
+    Numeric and brand columns are exposed as numpy arrays for vectorized
+    filtering, sorting and faceting; text fields are decoded lazily, only for
+    the rows that are actually returned.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, 'meta.json'), 'r', encoding='utf-8') as f:
+            self.meta = json.load(f)
+        self.version: str = self.meta['version']
+        self.brands: List[str] = self.meta['brands']
+        self.ids = np.load(os.path.join(path, 'ids.npy'), mmap_mode='r')
+        self.id_order = np.load(os.path.join(path, 'id_order.npy'), mmap_mode='r')
+        self._sorted_ids = np.load(os.path.join(path, 'sorted_ids.npy'), mmap_mode='r')
+        self.price = np.load(os.path.join(path, 'price.npy'), mmap_mode='r')
+        self.rating = np.load(os.path.join(path, 'rating.npy'), mmap_mode='r')
+        self.brand_codes = np.load(os.path.join(path, 'brand.npy'), mmap_mode='r')
+        self._strings = {
+            field: _StringColumn(os.path.join(path, f"{field}.bin"), os.path.join(path, f"{field}.offsets.npy"))
+            for field in self.meta['string_fields']
+        }
+
+    @classmethod
+    def open_or_build(cls, path: str, jsonl_path: str) -> "ProductCatalog":
+        """Opens the catalog at `path`, converting `jsonl_path` first if it was never built."""
+        if not os.path.exists(os.path.join(path, 'meta.json')):
+            if not os.path.exists(jsonl_path):
+                raise FileNotFoundError(f"Product data not found at the absolute path: {jsonl_path}")
+            print(f"No columnar catalog at {path}; building it from {jsonl_path}...")
+            with open(jsonl_path, 'r', encoding='utf-8') as f:
+                write_catalog((json.loads(line) for line in f if line.strip()), path)
+        return cls(path)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def rows_for_ids(self, faiss_ids: np.ndarray) -> np.ndarray:
+        """Maps FAISS ids to catalog rows; unknown ids map to -1."""
+        faiss_ids = np.asarray(faiss_ids, dtype=np.int64)
+        if len(self._sorted_ids) == 0:
+            return np.full(len(faiss_ids), -1, dtype=np.int64)
+        pos = np.clip(np.searchsorted(self._sorted_ids, faiss_ids), 0, len(self._sorted_ids) - 1)
+        found = self._sorted_ids[pos] == faiss_ids
+        return np.where(found, self.id_order[pos], -1).astype(np.int64)
+
+    def text(self, row: int, field: str) -> str:
+        return self._strings[field][row]
+
+    def rerank_text(self, row: int) -> str:
+        """The "title. description" text both encoders were trained on."""
+        return f"{self.text(row, 'title')}. {self.text(row, 'description')}"
+
+    def brand(self, row: int) -> Optional[str]:
+        code = int(self.brand_codes[row])
+        return self.brands[code] if code >= 0 else None
+
+    def get(self, row: int) -> Dict[str, Any]:
+        """Decodes a single row into the product dict shape used by the API."""
+        price = float(self.price[row])
+        rating = float(self.rating[row])
+        return {
+            "product_id": self.text(row, 'product_id'),
+            "title": self.text(row, 'title'),
+            "brand": self.brand(row),
+            "price": None if np.isnan(price) else price,
+            "rating": None if np.isnan(rating) else rating,
+            "image_url": self.text(row, 'image_url') or None,
+            "description": self.text(row, 'description') or None,
+        }
+
+    def products(self, rows: Iterable[int]) -> List[Dict[str, Any]]:
+        return [self.get(int(row)) for row in rows]
@@ -0,0 +1,78 @@
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Optional
+
+
+class ServiceOverloadedError(Exception):
+    """Raised when a request is rejected because the search queue is full."""
+
+
+class AdmissionGate:
+    """
+    Bounds the number of searches running at once and the number waiting behind them.
+
+    Up to `max_concurrency` requests run concurrently; up to `max_pending` more wait
+    for a slot. Anything beyond that is rejected straight away with
+    ServiceOverloadedError, so overload turns into fast 503s instead of an
+    unbounded queue that delays every request (including health checks).
+    """
+
+    def __init__(self, max_concurrency: int, max_pending: int):
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_pending = max(0, max_pending)
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._admitted = 0
+        self.rejected = 0
+
+    @property
+    def in_flight(self) -> int:
+        return self._admitted
+
+    @asynccontextmanager
+    async def admit(self):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        if self._admitted >= self.max_concurrency + self.max_pending:
+            self.rejected += 1
+            raise ServiceOverloadedError(f"Search queue is full ({self._admitted} requests in flight)")
+        self._admitted += 1
+        try:
+            async with self._semaphore:
+                yield
+        finally:
+            self._admitted -= 1
+
+
+class CpuExecutor:
+    """A dedicated, fixed-size thread pool for the CPU-heavy pipeline stages."""
+
+    def __init__(self, max_workers: int, name: str = "search-cpu"):
+        self.max_workers = max(1, max_workers)
+        self.name = name
+        self._lock = threading.Lock()
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._pid: Optional[int] = None
+
+    async def run(self, fn, *args):
+        """Runs `fn(*args)` on the pool and awaits its result."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._get_pool(), fn, *args)
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=True)
+            self._pool = None
+
+    def _get_pool(self) -> ThreadPoolExecutor:
+        # Created lazily (and again after a fork) since worker threads are per process.
+        if self._pool is not None and self._pid == os.getpid():
+            return self._pool
+        with self._lock:
+            if self._pool is None or self._pid != os.getpid():
+                self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=self.name)
+                self._pid = os.getpid()
+            return self._pool
@@ -0,0 +1,132 @@
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from app.services.filters import FilterIndex, Range
+
+
+def bucket_label(low: float, high: Optional[float]) -> str:
+    """Formats a bucket as "50-100" or, for the open-ended last bucket, "250+"."""
+    def fmt(v: float) -> str:
+        return str(int(v)) if float(v).is_integer() else str(float(v))
+    return f"{fmt(low)}+" if high is None else f"{fmt(low)}-{fmt(high)}"
+
+
+FACET_NAMES = ('Brand', 'Price', 'Rating')
+
+
+class FilterError(ValueError):
+    """Raised for sidebar filters that are not lists of valid facet values."""
+
+
+def parse_bucket(value: str) -> Range:
+    """Parses a facet value produced by bucket_label back into a (min, max) range."""
+    text = str(value).strip()
+    try:
+        if text.endswith('+'):
+            return float(text[:-1]), None
+        low, high = text.split('-', 1)
+        return float(low), float(high)
+    except ValueError:
+        raise FilterError(f"Invalid bucket {value!r}: expected a facet value such as \"50-100\" or \"250+\".")
+
+
+def validate_filters(filters: Optional[Dict[str, Any]]):
+    """Checks that each facet filter is a list of strings, and Price / Rating ones valid buckets; raises FilterError."""
+    for name in FACET_NAMES:
+        values = (filters or {}).get(name)
+        if values is None:
+            continue
+        if not isinstance(values, list) or not all(isinstance(value, str) for value in values):
+            raise FilterError(f"Filter {name!r} must be a list of facet values (strings), got {values!r}.")
+        if name != 'Brand':
+            for value in values:
+                try:
+                    parse_bucket(value)
+                except FilterError as e:
+                    raise FilterError(f"Filter {name!r}: {e}")
+
+
+def intersect_sorted(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Intersection of two sorted, duplicate-free row arrays, by binary search of the shorter in the longer."""
+    short, long = (a, b) if len(a) <= len(b) else (b, a)
+    if not len(short) or not len(long):
+        return np.zeros(0, dtype=np.int64)
+    positions = np.minimum(np.searchsorted(long, short), len(long) - 1)
+    return np.asarray(short[long[positions] == short], dtype=np.int64)
+
+
+class FacetEngine:
+    """
+    Counts Brand, Price and Rating facets over the full matching set, not just the
+    retrieved candidates.
+
+    The matching set is every catalog row that the query matched (given by the
+    caller) and that satisfies the query's constraints. Facets are disjunctive: each
+    facet is counted with every constraint except the sidebar's own selection for
+    it, so selecting one brand still shows the counts of the other brands;
+    constraints implied by the query ("query.*" keys) always apply. Counting is a
+    bincount / searchsorted over the selected rows and the unconstrained counts are
+    precomputed, so no per-request Python loop touches the products.
+    """
+
+    def __init__(self, filter_index: FilterIndex, price_boundaries: Sequence[float], rating_boundaries: Sequence[float], brand_facet_size: int = 10):
+        self.filter_index = filter_index
+        self.catalog = filter_index.catalog
+        self.price_boundaries = np.asarray(sorted(price_boundaries), dtype=np.float64)
+        self.rating_boundaries = np.asarray(sorted(rating_boundaries), dtype=np.float64)
+        self.brand_facet_size = brand_facet_size
+        codes = np.asarray(self.catalog.brand_codes)
+        self._all_brand_counts = np.bincount(codes[codes >= 0], minlength=len(self.catalog.brands))
+        self._all_price_counts = self._bucket_counts(filter_index.price_sorted, self.price_boundaries)
+        self._all_rating_counts = self._bucket_counts(filter_index.rating_sorted, self.rating_boundaries)
+
+    @staticmethod
+    def _bucket_counts(sorted_values: np.ndarray, boundaries: np.ndarray) -> np.ndarray:
+        # Bucket i is [boundaries[i], boundaries[i + 1]); the last bucket is open-ended.
+        edges = np.searchsorted(sorted_values, boundaries, side='left')
+        return np.diff(np.append(edges, len(sorted_values)))
+
+    def _range_facet(self, name: str, rows: Optional[np.ndarray], column: np.ndarray, boundaries: np.ndarray, all_counts: np.ndarray) -> Dict[str, Any]:
+        if rows is None:
+            counts = all_counts
+        else:
+            values = np.asarray(column[rows])
+            counts = self._bucket_counts(np.sort(values[~np.isnan(values)]), boundaries)
+        highs = list(boundaries[1:]) + [None]
+        return {
+            "name": name,
+            "buckets": [{"value": bucket_label(low, high), "count": int(count)} for low, high, count in zip(boundaries, highs, counts) if count > 0]
+        }
+
+    def _brand_facet(self, rows: Optional[np.ndarray], selected_codes: Optional[List[int]]) -> Dict[str, Any]:
+        if rows is None:
+            counts = self._all_brand_counts
+        else:
+            codes = np.asarray(self.catalog.brand_codes[rows])
+            counts = np.bincount(codes[codes >= 0], minlength=len(self.catalog.brands))
+        top = np.argsort(-counts, kind='stable')[:self.brand_facet_size]
+        shown = [int(c) for c in top if counts[c] > 0]
+        # Selected brands stay visible so they can be unticked, even outside the top N.
+        shown += [c for c in (selected_codes or []) if c not in shown]
+        return {
+            "name": "Brand",
+            "buckets": [{"value": self.catalog.brands[c], "count": int(counts[c])} for c in shown]
+        }
+
+    def facets(self, constraints: Dict[str, Optional[list]], matched: Optional[np.ndarray] = None) -> List[Dict[str, Any]]:
+        """
+        Computes the Brand, Price and Rating facets for a FilterIndex.select-style
+        constraint dict, counting only the `matched` rows (sorted; None for all).
+        """
+        def select(exclude: str) -> Optional[np.ndarray]:
+            rows = self.filter_index.select(constraints, exclude=exclude)
+            if matched is None:
+                return rows
+            return matched if rows is None else intersect_sorted(rows, matched)
+
+        return [
+            self._brand_facet(select('Brand'), constraints.get('Brand')),
+            self._range_facet("Price", select('Price'), self.catalog.price, self.price_boundaries, self._all_price_counts),
+            self._range_facet("Rating", select('Rating'), self.catalog.rating, self.rating_boundaries, self._all_rating_counts),
+        ]
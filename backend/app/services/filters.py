@@ -0,0 +1,139 @@
+import os
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import faiss
+import numpy as np
+
+from app.services.catalog import ProductCatalog
+
+# Inverted attribute index stored next to the catalog columns (written by build_index.py):
+#
+#   brand_postings.npy      catalog rows grouped by brand code, ascending within each brand
+#   brand_offsets.npy       int64 start of each brand's rows in brand_postings (len(brands) + 1)
+#   price_order.npy         catalog rows ordered by price (rows without a price are left out)
+#   price_sorted.npy        the matching prices, for np.searchsorted range lookups
+#   rating_order.npy        catalog rows ordered by rating (rows without a rating are left out)
+#   rating_sorted.npy       the matching ratings
+#
+# A brand filter is a concatenation of posting lists and a price or rating range is
+# one contiguous slice of the matching order array, so selecting candidates never
+# scans the catalog.
+
+FILTER_FILES = ('brand_postings', 'brand_offsets', 'price_order', 'price_sorted', 'rating_order', 'rating_sorted')
+
+# A range is (min, max) with min inclusive and max exclusive; None leaves a side open.
+Range = Tuple[Optional[float], Optional[float]]
+
+
+class FilterIndex:
+    """Precomputed brand postings and price/rating orderings used to restrict ANN search and count facets."""
+
+    def __init__(self, catalog: ProductCatalog, brand_postings: np.ndarray, brand_offsets: np.ndarray,
+                 price_order: np.ndarray, price_sorted: np.ndarray, rating_order: np.ndarray, rating_sorted: np.ndarray):
+        self.catalog = catalog
+        self.brand_postings = brand_postings
+        self.brand_offsets = brand_offsets
+        self.price_order = price_order
+        self.price_sorted = price_sorted
+        self.rating_order = rating_order
+        self.rating_sorted = rating_sorted
+        self._brand_lookup = {brand.lower(): code for code, brand in enumerate(catalog.brands)}
+        ids = np.asarray(catalog.ids)
+        self._max_id = int(ids.max()) if len(ids) else -1
+        self._dense_ids = len(ids) > 0 and int(ids.min()) >= 0
+
+    @classmethod
+    def from_catalog(cls, catalog: ProductCatalog) -> "FilterIndex":
+        codes = np.asarray(catalog.brand_codes)
+        has_brand = np.flatnonzero(codes >= 0)
+        brand_postings = has_brand[np.argsort(codes[has_brand], kind='stable')]
+        counts = np.bincount(codes[has_brand], minlength=len(catalog.brands))
+        brand_offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+        price_order, price_sorted = cls._value_order(np.asarray(catalog.price))
+        rating_order, rating_sorted = cls._value_order(np.asarray(catalog.rating))
+        return cls(catalog, brand_postings.astype(np.int64), brand_offsets, price_order, price_sorted, rating_order, rating_sorted)
+
+    @staticmethod
+    def _value_order(values: np.ndarray):
+        present = np.flatnonzero(~np.isnan(values))
+        order = present[np.argsort(values[present], kind='stable')].astype(np.int64)
+        return order, values[order]
+
+    @classmethod
+    def load(cls, catalog: ProductCatalog) -> "FilterIndex":
+        arrays = {name: np.load(os.path.join(catalog.path, f"{name}.npy"), mmap_mode='r') for name in FILTER_FILES}
+        return cls(catalog, **arrays)
+
+    @classmethod
+    def open_or_build(cls, catalog: ProductCatalog) -> "FilterIndex":
+        if all(os.path.exists(os.path.join(catalog.path, f"{name}.npy")) for name in FILTER_FILES):
+            return cls.load(catalog)
+        print("No filter index next to the catalog; building it in memory...")
+        return cls.from_catalog(catalog)
+
+    def save(self, path: str):
+        for name in FILTER_FILES:
+            np.save(os.path.join(path, f"{name}.npy"), np.asarray(getattr(self, name)))
+
+    def brand_codes(self, brands: Iterable[str]) -> list:
+        """Resolves brand names case-insensitively; unknown brands are dropped."""
+        codes = {self._brand_lookup.get(str(b).strip().lower()) for b in brands}
+        codes.discard(None)
+        return sorted(codes)
+
+    def rows_for_brands(self, codes: Iterable[int]) -> np.ndarray:
+        parts = [self.brand_postings[self.brand_offsets[c]:self.brand_offsets[c + 1]] for c in codes]
+        if not parts:
+            return np.zeros(0, dtype=np.int64)
+        return np.sort(np.concatenate(parts)) if len(parts) > 1 else np.asarray(parts[0])
+
+    @staticmethod
+    def _rows_in_ranges(order: np.ndarray, sorted_values: np.ndarray, ranges: List[Range]) -> np.ndarray:
+        parts = []
+        for low, high in ranges:
+            lo = 0 if low is None else np.searchsorted(sorted_values, low, side='left')
+            hi = len(sorted_values) if high is None else np.searchsorted(sorted_values, high, side='left')
+            if hi > lo:
+                parts.append(order[lo:hi])
+        if not parts:
+            return np.zeros(0, dtype=np.int64)
+        return np.unique(np.concatenate(parts)) if len(parts) > 1 else np.sort(parts[0])
+
+    def rows_in_price_ranges(self, ranges: List[Range]) -> np.ndarray:
+        return self._rows_in_ranges(self.price_order, self.price_sorted, ranges)
+
+    def rows_in_rating_ranges(self, ranges: List[Range]) -> np.ndarray:
+        return self._rows_in_ranges(self.rating_order, self.rating_sorted, ranges)
+
+    def select(self, constraints: Dict[str, Optional[list]], exclude: Optional[str] = None) -> Optional[np.ndarray]:
+        """
+        Returns the sorted catalog rows matching every constraint, or None when
+        nothing is constrained (i.e. the whole catalog is eligible).
+
+        Keys name the attribute, optionally behind a source prefix ("Brand",
+        "query.Brand", "Price", ...): Brand takes brand codes, Price and Rating take
+        lists of ranges. Values under one key are OR-ed and keys are AND-ed. A key set
+        to None is unconstrained, and `exclude` skips one key (used for facet counts).
+        """
+        rows_for = {'Brand': self.rows_for_brands, 'Price': self.rows_in_price_ranges, 'Rating': self.rows_in_rating_ranges}
+        rows = None
+        for key, values in constraints.items():
+            if values is None or key == exclude:
+                continue
+            matched = rows_for[key.rsplit('.', 1)[-1]](values)
+            rows = matched if rows is None else np.intersect1d(rows, matched, assume_unique=True)
+        return rows
+
+    def selector(self, rows: np.ndarray) -> faiss.IDSelector:
+        """Builds a FAISS ID selector admitting exactly the FAISS ids of `rows`."""
+        ids = np.ascontiguousarray(self.catalog.ids[rows], dtype=np.int64)
+        # A hash set is cheapest for small selections; for large ones over a dense
+        # id space a bitmap is much faster to build and to probe.
+        if not self._dense_ids or len(ids) * 64 < self._max_id:
+            return faiss.IDSelectorBatch(ids)
+        mask = np.zeros(self._max_id + 1, dtype=bool)
+        mask[ids] = True
+        bitmap = np.packbits(mask, bitorder='little')
+        sel = faiss.IDSelectorBitmap(bitmap)
+        sel.bitmap_ref = bitmap  # keep the buffer alive for as long as the selector
+        return sel
@@ -0,0 +1,280 @@
+import json
+import os
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Model loading for the two inference backends:
+#
+#   torch  sentence-transformers / transformers models on TORCH_DEVICE (cpu, cuda, mps)
+#   onnx   models exported by training/export_onnx.py, run with ONNX Runtime on CPU,
+#          optionally dynamically int8-quantized (model_quantized.onnx)
+#
+# Both expose the same small surface the search service uses: `encode(texts)` for
+# the bi-encoder, `predict(pairs)` for the cross-encoder and a transformers "ner"
+# pipeline, so the rest of the pipeline does not care which backend is active.
+
+ONNX_MODEL_FILE = "model.onnx"
+ONNX_QUANTIZED_MODEL_FILE = "model_quantized.onnx"
+
+
+def _onnx_file(model_dir: str, quantized: bool) -> str:
+    """Picks the int8 model when requested and exported, the float model otherwise."""
+    if quantized and os.path.exists(os.path.join(model_dir, ONNX_QUANTIZED_MODEL_FILE)):
+        return ONNX_QUANTIZED_MODEL_FILE
+    if not os.path.exists(os.path.join(model_dir, ONNX_MODEL_FILE)):
+        raise FileNotFoundError(f"ONNX model not found in {model_dir}. Run training/export_onnx.py first.")
+    return ONNX_MODEL_FILE
+
+
+def _session_options(intra_op_threads: int):
+    import onnxruntime as ort
+
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    if intra_op_threads > 0:
+        options.intra_op_num_threads = intra_op_threads
+    options.inter_op_num_threads = 1
+    return options
+
+
+def _onnx_session(model_dir: str, quantized: bool, intra_op_threads: int):
+    import onnxruntime as ort
+
+    path = os.path.join(model_dir, _onnx_file(model_dir, quantized))
+    print(f"Loading ONNX model {path}...")
+    return ort.InferenceSession(path, sess_options=_session_options(intra_op_threads), providers=["CPUExecutionProvider"])
+
+
+class PerProcess:
+    """
+    Builds an object on first use in each process. ONNX Runtime sessions own thread
+    pools that do not survive os.fork(), so a service loaded in a parent process
+    creates its sessions in each worker instead.
+    """
+
+    def __init__(self, factory):
+        self.factory = factory
+        self._lock = threading.Lock()
+        self._value = None
+        self._pid: Optional[int] = None
+
+    def get(self):
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._value = self.factory()
+                    self._pid = os.getpid()
+        return self._value
+
+    def __call__(self, *args, **kwargs):
+        return self.get()(*args, **kwargs)
+
+
+class _OnnxModel:
+    def __init__(self, model_dir: str, quantized: bool, intra_op_threads: int, max_length: int):
+        from transformers import AutoTokenizer
+
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self._session = PerProcess(lambda: _onnx_session(model_dir, quantized, intra_op_threads))
+        self.max_length = min(max_length, self.tokenizer.model_max_length)
+
+    @property
+    def session(self):
+        return self._session.get()
+
+    @property
+    def input_names(self):
+        return {i.name for i in self.session.get_inputs()}
+
+    def run(self, features) -> np.ndarray:
+        feeds = {name: np.asarray(value, dtype=np.int64) for name, value in features.items() if name in self.input_names}
+        return self.session.run(None, feeds)[0]
+
+
+class OnnxBiEncoder(_OnnxModel):
+    """ONNX Runtime replacement for SentenceTransformer.encode (transformer + pooling)."""
+
+    def __init__(self, model_dir: str, quantized: bool = True, intra_op_threads: int = 0):
+        st_config = self._read_json(os.path.join(model_dir, "sentence_bert_config.json"))
+        super().__init__(model_dir, quantized, intra_op_threads, st_config.get("max_seq_length", 512))
+        pooling = self._read_json(os.path.join(model_dir, "1_Pooling", "config.json"))
+        self.pooling = "cls" if pooling.get("pooling_mode_cls_token") else "max" if pooling.get("pooling_mode_max_tokens") else "mean"
+
+    @staticmethod
+    def _read_json(path: str) -> dict:
+        if not os.path.exists(path):
+            return {}
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return int(self.session.get_outputs()[0].shape[-1])
+
+    def encode(self, texts: Sequence[str], batch_size: int = 32, convert_to_numpy: bool = True, **kwargs) -> np.ndarray:
+        outputs = []
+        for start in range(0, len(texts), max(1, batch_size)):
+            features = self.tokenizer(list(texts[start:start + batch_size]), padding=True, truncation=True, max_length=self.max_length, return_tensors="np")
+            hidden = self.run(features)
+            mask = features["attention_mask"][..., None].astype(hidden.dtype)
+            if self.pooling == "cls":
+                pooled = hidden[:, 0]
+            elif self.pooling == "max":
+                pooled = np.where(mask > 0, hidden, -1e9).max(axis=1)
+            else:
+                pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            outputs.append(pooled.astype(np.float32))
+        return np.concatenate(outputs) if outputs else np.zeros((0, self.get_sentence_embedding_dimension()), dtype=np.float32)
+
+
+class OnnxCrossEncoder(_OnnxModel):
+    """ONNX Runtime replacement for CrossEncoder.predict, including its sigmoid for single-label models."""
+
+    def __init__(self, model_dir: str, quantized: bool = True, intra_op_threads: int = 0, max_length: int = 512):
+        super().__init__(model_dir, quantized, intra_op_threads, max_length)
+
+    def predict(self, pairs: Sequence[Sequence[str]], batch_size: int = 32, **kwargs) -> np.ndarray:
+        scores = []
+        for start in range(0, len(pairs), max(1, batch_size)):
+            batch = pairs[start:start + batch_size]
+            features = self.tokenizer([p[0] for p in batch], [p[1] for p in batch], padding=True, truncation="longest_first", max_length=self.max_length, return_tensors="np")
+            logits = self.run(features)
+            scores.append(1.0 / (1.0 + np.exp(-logits[:, 0])) if logits.shape[1] == 1 else logits)
+        return np.concatenate(scores).astype(np.float32) if scores else np.zeros(0, dtype=np.float32)
+
+
+def _find(sequence: List[int], sub: List[int], start: int) -> int:
+    for i in range(start, len(sequence) - len(sub) + 1):
+        if sequence[i:i + len(sub)] == sub:
+            return i
+    raise ValueError("The tokenizer's pair encoding does not contain its single-sequence encodings.")
+
+
+class PairTemplate:
+    """
+    How a tokenizer frames a (query, product) pair with special tokens, e.g.
+    [CLS] q [SEP] p [SEP] for BERT or <s> q </s></s> p </s> for RoBERTa.
+
+    The template is read off the tokenizer's own encoding of a probe pair, so
+    product texts tokenized ahead of time (without special tokens) can be framed
+    with a per-request query into exactly the inputs the tokenizer would produce.
+    """
+
+    def __init__(self, tokenizer, max_length: int):
+        query = tokenizer("query", add_special_tokens=False)["input_ids"]
+        product = tokenizer("product", add_special_tokens=False)["input_ids"]
+        encoded = tokenizer("query", "product", return_token_type_ids=True)
+        ids = list(encoded["input_ids"])
+        types = list(encoded.get("token_type_ids") or [0] * len(ids))
+        q = _find(ids, query, 0)
+        p = _find(ids, product, q + len(query))
+        self.prefix, self.middle, self.suffix = ids[:q], ids[q + len(query):p], ids[p + len(product):]
+        self.prefix_types, self.middle_types, self.suffix_types = types[:q], types[q + len(query):p], types[p + len(product):]
+        self.query_type, self.product_type = types[q], types[p]
+        self.pad_id = tokenizer.pad_token_id or 0
+        self.max_length = max_length
+        self.budget = max_length - len(self.prefix) - len(self.middle) - len(self.suffix)
+
+    def features(self, pairs: Sequence[Tuple[Sequence[int], Sequence[int]]]) -> Dict[str, np.ndarray]:
+        """Frames, truncates (longer side first) and pads (query ids, product ids) pairs into model inputs."""
+        trimmed = []
+        for query_ids, product_ids in pairs:
+            query_ids = query_ids[:max(self.budget - len(product_ids), self.budget // 2)]
+            trimmed.append((query_ids, product_ids[:self.budget - len(query_ids)]))
+        query_len = np.array([len(q) for q, _ in trimmed], dtype=np.int64)
+        product_len = np.array([len(p) for _, p in trimmed], dtype=np.int64)
+        n, p_len, m_len, s_len = len(trimmed), len(self.prefix), len(self.middle), len(self.suffix)
+        middle_start = p_len + query_len
+        suffix_start = middle_start + m_len + product_len
+        total = suffix_start + s_len
+        width = int(total.max()) if n else 0
+
+        input_ids = np.full((n, width), self.pad_id, dtype=np.int64)
+        token_type_ids = np.zeros((n, width), dtype=np.int64)
+        for i, (query_ids, product_ids) in enumerate(trimmed):
+            input_ids[i, p_len:middle_start[i]] = query_ids
+            input_ids[i, middle_start[i] + m_len:suffix_start[i]] = product_ids
+        # The special tokens sit at the same offsets in every row (prefix) or at per-row offsets.
+        rows = np.arange(n)[:, None]
+        for start, ids, types in ((np.zeros(n, dtype=np.int64), self.prefix, self.prefix_types),
+                                  (middle_start, self.middle, self.middle_types),
+                                  (suffix_start, self.suffix, self.suffix_types)):
+            if len(ids):
+                cols = start[:, None] + np.arange(len(ids))
+                input_ids[rows, cols] = ids
+                token_type_ids[rows, cols] = types
+        positions = np.arange(width)[None, :]
+        token_type_ids[(positions >= p_len) & (positions < middle_start[:, None])] = self.query_type
+        token_type_ids[(positions >= middle_start[:, None] + m_len) & (positions < suffix_start[:, None])] = self.product_type
+        attention_mask = (positions < total[:, None]).astype(np.int64)
+        return {"input_ids": input_ids, "token_type_ids": token_type_ids, "attention_mask": attention_mask}
+
+
+def cross_encoder_max_length(cross_encoder) -> int:
+    return min(getattr(cross_encoder, "max_length", None) or 512, cross_encoder.tokenizer.model_max_length, 512)
+
+
+def predict_features(cross_encoder, features: Dict[str, np.ndarray]) -> np.ndarray:
+    """Scores already-assembled pair inputs, with the same activation CrossEncoder.predict applies."""
+    if isinstance(cross_encoder, OnnxCrossEncoder):
+        logits = cross_encoder.run(features)
+        return (1.0 / (1.0 + np.exp(-logits[:, 0])) if logits.shape[1] == 1 else logits).astype(np.float32)
+
+    import torch
+
+    model = cross_encoder.model
+    accepted = set(cross_encoder.tokenizer.model_input_names)
+    inputs = {name: torch.from_numpy(value).to(model.device) for name, value in features.items() if name in accepted}
+    with torch.inference_mode():
+        logits = model(**inputs).logits
+        activation = getattr(cross_encoder, "activation_fn", None) or getattr(cross_encoder, "activation_fct", None)
+        if activation is not None:
+            scores = activation(logits)
+        else:
+            scores = torch.sigmoid(logits) if logits.shape[1] == 1 else logits
+    scores = scores.float().cpu().numpy()
+    return scores[:, 0] if scores.shape[1] == 1 else scores
+
+
+def load_bi_encoder(torch_path: str, onnx_path: str, backend: str, device: str, quantized: bool, intra_op_threads: int):
+    if backend == "onnx":
+        return OnnxBiEncoder(onnx_path, quantized=quantized, intra_op_threads=intra_op_threads)
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(torch_path, device=device)
+
+
+def load_cross_encoder(torch_path: str, onnx_path: str, backend: str, device: str, quantized: bool, intra_op_threads: int):
+    if backend == "onnx":
+        return OnnxCrossEncoder(onnx_path, quantized=quantized, intra_op_threads=intra_op_threads)
+    from sentence_transformers import CrossEncoder
+    return CrossEncoder(torch_path, device=device)
+
+
+def load_ner_pipeline(model_name: str, onnx_path: str, backend: str, device: str, quantized: bool, intra_op_threads: int):
+    from transformers import AutoTokenizer, pipeline
+
+    if backend == "onnx":
+        from optimum.onnxruntime import ORTModelForTokenClassification
+
+        file_name = _onnx_file(onnx_path, quantized)
+        tokenizer = AutoTokenizer.from_pretrained(onnx_path)
+        model = lambda: ORTModelForTokenClassification.from_pretrained(
+            onnx_path,
+            file_name=file_name,
+            session_options=_session_options(intra_op_threads),
+            provider="CPUExecutionProvider",
+        )
+        return PerProcess(lambda: pipeline("ner", model=model(), tokenizer=tokenizer, aggregation_strategy="simple"))
+    return pipeline("ner", model=model_name, aggregation_strategy="simple", device=device)
+
+
+def configure_torch_threads(threads: Optional[int]):
+    """Caps torch's intra-op threads; a no-op when unset or when torch is not installed."""
+    if not threads:
+        return
+    try:
+        import torch
+    except ImportError:
+        return
+    torch.set_num_threads(threads)
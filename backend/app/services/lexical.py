@@ -0,0 +1,559 @@
+import hashlib
+import json
+import os
+import re
+from collections import Counter
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.services.cache import LRUCache
+from app.services.catalog import ProductCatalog
+
+# BM25 inverted index over each product's "title. description", stored next to the
+# catalog columns (written by build_index.py, rebuilt by incremental updates):
+#
+#   lexical_terms.npy       uint64 hash of every vocabulary term, ascending
+#   lexical_offsets.npy     int64 start of each term's postings (len(terms) + 1)
+#   lexical_docs.npy        uint8 delta-encoded catalog rows, ascending within each term
+#   lexical_doc_offsets.npy int64 start of each term's encoded rows, in bytes
+#   lexical_skips.npy       uint32 first row of every block of POSTING_BLOCK postings
+#   lexical_skip_offsets.npy int64 start of each term's blocks in lexical_skips
+#   lexical_impacts.npy     uint8 quantized BM25 score of the term in that row
+#   lexical_max.npy         uint8 highest impact of each term (its MaxScore bound)
+#   lexical_df.npy          int64 document frequency of each term
+#   lexical.json            k1, b, the impact scale and the corpus statistics
+#
+# BM25 scores are computed at build time and stored as impacts, so a query only
+# sums postings; with the vocabulary kept as sorted hashes nothing has to be parsed
+# at startup and every array is memory-mapped.
+#
+# Rows are stored as the gap to the previous row of the term, in 1, 2 or 4 bytes
+# (the fewest that hold the term's largest gap), so the postings of frequent terms,
+# which dominate the index, take a byte per row. The gaps restart at every block of
+# POSTING_BLOCK postings from the block's first row, kept uncompressed in the skip
+# list: a lookup of a few rows in a long list decodes only the blocks they fall in.
+#
+# Incremental updates patch the index instead of rebuilding it: postings of kept
+# rows are carried over with their rows renumbered, and only removed and added
+# texts are tokenized. The statistics are updated exactly and added rows are scored
+# with them, but carried-over impacts keep the statistics they were scored with.
+# Once the patched rows exceed PATCH_LIMIT of the catalog, the next update rebuilds.
+
+LEXICAL_FILES = ('lexical_terms', 'lexical_offsets', 'lexical_docs', 'lexical_doc_offsets', 'lexical_skips', 'lexical_skip_offsets',
+                 'lexical_impacts', 'lexical_max')
+RAW_DOCS_FILE = 'lexical_docs.raw.npy'
+DF_FILE = 'lexical_df.npy'
+META_FILE = 'lexical.json'
+PATCH_LIMIT = 0.1
+POSTING_BLOCK = 128
+# Match sets (for facet counts) of the most recent multi-term queries, per index.
+MATCH_CACHE_SIZE = 256
+
+TOKEN_PATTERN = re.compile(r"\w+(?:[\-./]\w+)*")
+PART_PATTERN = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Case-folded word tokens; compounds such as "wh-1000xm4" are kept whole and also split into their parts."""
+    tokens = []
+    for match in TOKEN_PATTERN.finditer(text.casefold()):
+        token = match.group()
+        tokens.append(token)
+        parts = PART_PATTERN.findall(token)
+        if len(parts) > 1:
+            tokens.extend(parts)
+    return tokens
+
+
+def term_hash(term: str) -> int:
+    return int.from_bytes(hashlib.blake2b(term.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+def build_lexical_index(catalog: ProductCatalog, k1: float = 1.2, b: float = 0.75, chunk_size: int = 10_000):
+    """
+    Writes the BM25 index of `catalog` into its directory.
+
+    Two passes over the rows keep memory bounded by the vocabulary and one chunk:
+    the first counts document frequencies and lengths, the second scores each
+    chunk's postings and writes them straight into the memory-mapped arrays.
+    """
+    num_docs = len(catalog)
+    doc_freq: Dict[str, int] = {}
+    lengths = np.zeros(num_docs, dtype=np.float64)
+    for row in range(num_docs):
+        tokens = tokenize(catalog.rerank_text(row))
+        lengths[row] = len(tokens)
+        for term in set(tokens):
+            doc_freq[term] = doc_freq.get(term, 0) + 1
+
+    vocab = list(doc_freq)
+    hashes = np.array([term_hash(term) for term in vocab], dtype=np.uint64)
+    order = np.argsort(hashes, kind='stable')
+    term_index = {vocab[i]: position for position, i in enumerate(order)}
+    df = np.array([doc_freq[vocab[i]] for i in order], dtype=np.int64)
+    idf = np.log1p((num_docs - df + 0.5) / (df + 0.5))
+    avgdl = float(lengths.mean()) if num_docs else 0.0
+    # The largest possible BM25 term score is idf * (k1 + 1); impacts are in 1..255 units of it.
+    scale = float(idf.max() * (k1 + 1) / 255) if len(idf) else 1.0
+    # Terms in nearly every product (idf ~ 0) would round to a zero impact everywhere;
+    # they get no postings, which acts as a stopword list derived from the catalog.
+    indexed = idf * (k1 + 1) / scale >= 0.5
+    offsets = np.concatenate([[0], np.cumsum(np.where(indexed, df, 0))]).astype(np.int64)
+
+    path = catalog.path
+    np.save(os.path.join(path, 'lexical_terms.npy'), hashes[order])
+    np.save(os.path.join(path, 'lexical_offsets.npy'), offsets)
+    docs = np.lib.format.open_memmap(os.path.join(path, RAW_DOCS_FILE), mode='w+', dtype=np.uint32, shape=(int(offsets[-1]),))
+    impacts = np.lib.format.open_memmap(os.path.join(path, 'lexical_impacts.npy'), mode='w+', dtype=np.uint8, shape=(int(offsets[-1]),))
+    max_impact = np.zeros(len(vocab), dtype=np.uint8)
+    cursor = offsets[:-1].copy()
+    for start in range(0, num_docs, chunk_size):
+        terms, freqs, rows = [], [], []
+        for row in range(start, min(start + chunk_size, num_docs)):
+            counts = Counter(tokenize(catalog.rerank_text(row)))
+            terms.extend(term_index[term] for term in counts)
+            freqs.extend(counts.values())
+            rows.extend([row] * len(counts))
+        if not terms:
+            continue
+        terms = np.array(terms, dtype=np.int64)
+        keep = indexed[terms]
+        terms = terms[keep]
+        freqs = np.array(freqs, dtype=np.float64)[keep]
+        rows = np.array(rows, dtype=np.int64)[keep]
+        norm = k1 * (1 - b + b * lengths[rows] / max(avgdl, 1e-9))
+        quantized = np.clip(np.rint(idf[terms] * freqs * (k1 + 1) / (freqs + norm) / scale), 1, 255).astype(np.uint8)
+        np.maximum.at(max_impact, terms, quantized)
+        # Group the chunk's postings by term (stable, so rows stay ascending) and
+        # place each group after what earlier chunks wrote for that term.
+        by_term = np.argsort(terms, kind='stable')
+        sorted_terms = terms[by_term]
+        starts = np.flatnonzero(np.concatenate([[True], sorted_terms[1:] != sorted_terms[:-1]]))
+        rank = np.arange(len(sorted_terms)) - np.repeat(starts, np.diff(np.concatenate([starts, [len(sorted_terms)]])))
+        positions = cursor[sorted_terms] + rank
+        docs[positions] = rows[by_term]
+        impacts[positions] = quantized[by_term]
+        cursor += np.bincount(terms, minlength=len(vocab))
+    impacts.flush()
+    _encode_postings(path, offsets, docs)
+    del docs, impacts
+    os.remove(os.path.join(path, RAW_DOCS_FILE))
+    np.save(os.path.join(path, 'lexical_max.npy'), max_impact)
+    np.save(os.path.join(path, DF_FILE), df)
+    with open(os.path.join(path, META_FILE), 'w', encoding='utf-8') as f:
+        json.dump({"k1": k1, "b": b, "scale": scale, "num_docs": num_docs, "avgdl": avgdl, "total_length": float(lengths.sum()),
+                   "num_terms": len(vocab), "patched_rows": 0}, f)
+
+
+def _term_blocks(offsets: np.ndarray, max_postings: int):
+    """Splits the terms into consecutive ranges holding about `max_postings` postings each."""
+    t0, num_terms = 0, len(offsets) - 1
+    while t0 < num_terms:
+        t1 = int(np.searchsorted(offsets, offsets[t0] + max_postings, side='right')) - 1
+        t1 = min(max(t1, t0 + 1), num_terms)
+        yield t0, t1
+        t0 = t1
+
+
+def _rank_within(sorted_keys: np.ndarray) -> np.ndarray:
+    """Position of each element among the equal keys before it (keys sorted)."""
+    if not len(sorted_keys):
+        return np.zeros(0, dtype=np.int64)
+    starts = np.flatnonzero(np.concatenate([[True], sorted_keys[1:] != sorted_keys[:-1]]))
+    return np.arange(len(sorted_keys)) - np.repeat(starts, np.diff(np.concatenate([starts, [len(sorted_keys)]])))
+
+
+def _gaps(offsets: np.ndarray, t0: int, t1: int, docs: np.ndarray):
+    """Term, rank within the term and gap to the previous row (0 at a block start) of the postings of terms t0..t1 - 1."""
+    lo, hi = offsets[t0], offsets[t1]
+    rows = np.asarray(docs[lo:hi], dtype=np.int64)
+    term_of = np.repeat(np.arange(t0, t1), np.diff(offsets[t0:t1 + 1]))
+    rank = np.arange(lo, hi) - offsets[term_of]
+    gaps = rows - np.concatenate([[0], rows[:-1]])
+    gaps[rank % POSTING_BLOCK == 0] = 0
+    return term_of, rank, rows, gaps
+
+
+def _pack(data: np.ndarray, positions: np.ndarray, values: np.ndarray, widths: np.ndarray):
+    """Writes each value little-endian at its byte position, in its width (1, 2 or 4) of bytes."""
+    data[positions] = values & 0xFF
+    for byte in (1, 2, 3):
+        wide = widths > byte
+        data[positions[wide] + byte] = (values[wide] >> (8 * byte)) & 0xFF
+
+
+def _unpack(data: np.ndarray, positions: np.ndarray, widths) -> np.ndarray:
+    """Reads the little-endian values `_pack` wrote."""
+    widths = np.broadcast_to(widths, positions.shape)
+    values = data[positions].astype(np.int64)
+    for byte in (1, 2, 3):
+        wide = widths > byte
+        values[wide] |= data[positions[wide] + byte].astype(np.int64) << (8 * byte)
+    return values
+
+
+def _undelta(gaps: np.ndarray, starts: np.ndarray, firsts: np.ndarray) -> np.ndarray:
+    """Rows from gaps that restart (at 0) wherever `starts` is set, from the block's first row in `firsts`."""
+    sums = np.cumsum(gaps)
+    block = np.cumsum(starts) - 1
+    return sums - sums[starts][block] + np.asarray(firsts, dtype=np.int64)[block]
+
+
+def _encode_postings(path: str, offsets: np.ndarray, docs: np.ndarray, block_postings: int = 4_000_000):
+    """
+    Writes the rows of every term's postings (`docs`, uint32, ascending within each
+    term) delta-encoded, with their skip list. One pass picks each term's gap width
+    and a second one writes the gaps, a block of terms at a time.
+    """
+    counts = np.diff(offsets)
+    widths = np.ones(len(counts), dtype=np.int64)
+    for t0, t1 in _term_blocks(offsets, block_postings):
+        _, _, _, gaps = _gaps(offsets, t0, t1, docs)
+        present = np.flatnonzero(counts[t0:t1] > 0)
+        if len(present):
+            largest = np.maximum.reduceat(gaps, offsets[t0 + present] - offsets[t0])
+            widths[t0 + present] = np.where(largest < 1 << 8, 1, np.where(largest < 1 << 16, 2, 4))
+    doc_offsets = np.concatenate([[0], np.cumsum(counts * widths)]).astype(np.int64)
+    skip_offsets = np.concatenate([[0], np.cumsum(-(-counts // POSTING_BLOCK))]).astype(np.int64)
+    data = np.lib.format.open_memmap(os.path.join(path, 'lexical_docs.npy'), mode='w+', dtype=np.uint8, shape=(int(doc_offsets[-1]),))
+    skips = np.lib.format.open_memmap(os.path.join(path, 'lexical_skips.npy'), mode='w+', dtype=np.uint32, shape=(int(skip_offsets[-1]),))
+    for t0, t1 in _term_blocks(offsets, block_postings):
+        term_of, rank, rows, gaps = _gaps(offsets, t0, t1, docs)
+        starts = rank % POSTING_BLOCK == 0
+        skips[skip_offsets[term_of[starts]] + rank[starts] // POSTING_BLOCK] = rows[starts]
+        _pack(data, doc_offsets[term_of] + rank * widths[term_of], gaps, widths[term_of])
+    data.flush()
+    skips.flush()
+    del data, skips
+    np.save(os.path.join(path, 'lexical_doc_offsets.npy'), doc_offsets)
+    np.save(os.path.join(path, 'lexical_skip_offsets.npy'), skip_offsets)
+
+
+def patch_lexical_index(base: "LexicalIndex", base_catalog: ProductCatalog, catalog: ProductCatalog, kept: np.ndarray,
+                        moved_rows: np.ndarray, moved_to: np.ndarray, added_rows: np.ndarray, block_postings: int = 4_000_000):
+    """
+    Writes the BM25 index of `catalog`, an updated copy of `base_catalog`, into its
+    directory by patching `base`.
+
+    `kept` base rows (ascending) become rows 0..len(kept) - 1 and `moved_rows` keep
+    their text at rows `moved_to`; both keep their postings. `added_rows` of
+    `catalog` have new text and are tokenized, as are the base rows that are
+    neither kept nor moved. The postings are read a block of terms at a time.
+    """
+    k1, b, scale = base.meta['k1'], base.meta['b'], base.scale
+    kept = np.asarray(kept, dtype=np.int64)
+    row_map = np.full(base.num_docs, -1, dtype=np.int64)
+    row_map[kept] = np.arange(len(kept))
+    row_map[np.asarray(moved_rows, dtype=np.int64)] = moved_to
+    removed = np.flatnonzero(row_map < 0)
+
+    # --- Statistics: only removed and added texts are tokenized ---
+    removed_counts = [Counter(tokenize(base_catalog.rerank_text(int(row)))) for row in removed]
+    added_counts = [Counter(tokenize(catalog.rerank_text(int(row)))) for row in added_rows]
+    added_hashes = {term: term_hash(term) for counts in added_counts for term in counts}
+    terms = np.union1d(np.asarray(base.terms), np.array(list(added_hashes.values()), dtype=np.uint64))
+    old_to_new = np.searchsorted(terms, np.asarray(base.terms))
+    df = np.zeros(len(terms), dtype=np.int64)
+    df[old_to_new] = base.df
+    total_length = base.meta['total_length']
+    for counts in removed_counts:
+        df[np.searchsorted(terms, np.array([term_hash(term) for term in counts], dtype=np.uint64))] -= 1
+        total_length -= sum(counts.values())
+    added_terms = [np.searchsorted(terms, np.array([added_hashes[term] for term in counts], dtype=np.uint64)) for counts in added_counts]
+    for positions, counts in zip(added_terms, added_counts):
+        df[positions] += 1
+        total_length += sum(counts.values())
+    num_docs = len(catalog)
+    avgdl = total_length / num_docs if num_docs else 0.0
+    idf = np.log1p((num_docs - df + 0.5) / (df + 0.5))
+    indexed = idf * (k1 + 1) / scale >= 0.5
+
+    # --- Postings of added rows, scored with the updated statistics ---
+    app_terms, app_docs, app_impacts = [np.zeros(0, dtype=np.int64)], [np.zeros(0, dtype=np.int64)], [np.zeros(0, dtype=np.uint8)]
+    for row, positions, counts in zip(added_rows, added_terms, added_counts):
+        freqs = np.array(list(counts.values()), dtype=np.float64)
+        keep = indexed[positions]
+        norm = k1 * (1 - b + b * freqs.sum() / max(avgdl, 1e-9))
+        scores = idf[positions[keep]] * freqs[keep] * (k1 + 1) / (freqs[keep] + norm) / scale
+        app_terms.append(positions[keep])
+        app_docs.append(np.full(int(keep.sum()), row, dtype=np.int64))
+        app_impacts.append(np.clip(np.rint(scores), 1, 255).astype(np.uint8))
+
+    # --- Pass 1: count the kept postings per term and collect the moved ones ---
+    offsets = np.asarray(base.offsets)
+    stay_counts = np.zeros(len(base.terms), dtype=np.int64)
+    for t0, t1 in _term_blocks(offsets, block_postings):
+        lo, hi = offsets[t0], offsets[t1]
+        mapped = row_map[base._docs(t0, t1)]
+        term_of = np.repeat(np.arange(t0, t1), np.diff(offsets[t0:t1 + 1]))
+        stay = (mapped >= 0) & (mapped < len(kept))
+        stay_counts[t0:t1] = np.bincount(term_of[stay] - t0, minlength=t1 - t0)
+        moved = mapped >= len(kept)
+        if moved.any():
+            app_terms.append(old_to_new[term_of[moved]])
+            app_docs.append(mapped[moved])
+            app_impacts.append(np.asarray(base.impacts[lo:hi])[moved])
+    app_terms, app_docs, app_impacts = np.concatenate(app_terms), np.concatenate(app_docs), np.concatenate(app_impacts)
+    # Moved and added rows are numbered after every kept row, so they follow the
+    # kept postings of each term, ascending among themselves.
+    order = np.lexsort((app_docs, app_terms))
+    app_terms, app_docs, app_impacts = app_terms[order], app_docs[order], app_impacts[order]
+
+    stay_new = np.zeros(len(terms), dtype=np.int64)
+    stay_new[old_to_new] = stay_counts
+    new_offsets = np.concatenate([[0], np.cumsum(stay_new + np.bincount(app_terms, minlength=len(terms)))]).astype(np.int64)
+    max_impact = np.zeros(len(terms), dtype=np.uint8)
+    # The carried-over bounds stay valid upper bounds after rows are removed.
+    max_impact[old_to_new] = base.max
+    np.maximum.at(max_impact, app_terms, app_impacts)
+
+    # --- Pass 2: write the kept postings, then the moved and added ones ---
+    path = catalog.path
+    docs = np.lib.format.open_memmap(os.path.join(path, RAW_DOCS_FILE), mode='w+', dtype=np.uint32, shape=(int(new_offsets[-1]),))
+    impacts = np.lib.format.open_memmap(os.path.join(path, 'lexical_impacts.npy'), mode='w+', dtype=np.uint8, shape=(int(new_offsets[-1]),))
+    for t0, t1 in _term_blocks(offsets, block_postings):
+        lo, hi = offsets[t0], offsets[t1]
+        mapped = row_map[base._docs(t0, t1)]
+        term_of = np.repeat(np.arange(t0, t1), np.diff(offsets[t0:t1 + 1]))
+        stay = np.flatnonzero((mapped >= 0) & (mapped < len(kept)))
+        stay_terms = term_of[stay]
+        positions = new_offsets[old_to_new[stay_terms]] + _rank_within(stay_terms)
+        docs[positions] = mapped[stay]
+        impacts[positions] = np.asarray(base.impacts[lo:hi])[stay]
+    positions = new_offsets[app_terms] + stay_new[app_terms] + _rank_within(app_terms)
+    docs[positions] = app_docs
+    impacts[positions] = app_impacts
+    impacts.flush()
+    _encode_postings(path, new_offsets, docs, block_postings)
+    del docs, impacts
+    os.remove(os.path.join(path, RAW_DOCS_FILE))
+    np.save(os.path.join(path, 'lexical_terms.npy'), terms)
+    np.save(os.path.join(path, 'lexical_offsets.npy'), new_offsets)
+    np.save(os.path.join(path, 'lexical_max.npy'), max_impact)
+    np.save(os.path.join(path, DF_FILE), df)
+    with open(os.path.join(path, META_FILE), 'w', encoding='utf-8') as f:
+        json.dump({"k1": k1, "b": b, "scale": scale, "num_docs": num_docs, "avgdl": avgdl, "total_length": total_length,
+                   "num_terms": len(terms), "patched_rows": base.meta.get('patched_rows', 0) + len(removed) + len(added_rows)}, f)
+
+
+def _merge(rows: np.ndarray, scores: np.ndarray, docs: List[np.ndarray], impacts: List[np.ndarray], num_docs: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Adds postings to the scores of the sorted `rows`, returning the sorted union and
+    its scores: by sorting when they are few, else by summing over the whole catalog.
+    """
+    if not len(rows) and len(docs) == 1:
+        # A term's postings are already sorted and distinct.
+        return np.asarray(docs[0], dtype=np.int64), np.asarray(impacts[0], dtype=np.int64)
+    merged = np.concatenate([rows] + [np.asarray(part, dtype=np.int64) for part in docs])
+    weights = np.concatenate([scores] + [np.asarray(part, dtype=np.int64) for part in impacts])
+    if len(merged) * 4 < num_docs:
+        rows, inverse = np.unique(merged, return_inverse=True)
+        return rows, np.bincount(inverse, weights=weights, minlength=len(rows)).astype(np.int64)
+    # Every impact is at least 1, so the rows with a score are exactly the matched ones.
+    dense = np.bincount(merged, weights=weights, minlength=num_docs)
+    rows = np.flatnonzero(dense)
+    return rows, dense[rows].astype(np.int64)
+
+
+class LexicalIndex:
+    """
+    Memory-mapped BM25 index with MaxScore pruning.
+
+    Query terms are visited from the highest score bound down and their postings are
+    collected. Once the terms left could not lift a product that none of the visited
+    terms matched past the current k-th best score, the remaining (typically
+    frequent, low-idf) terms only need to be looked up for the products already
+    collected: in the skipped-to blocks of their postings, or the postings in the
+    collected rows, whichever side is shorter.
+    """
+
+    def __init__(self, path: str):
+        with open(os.path.join(path, META_FILE), 'r', encoding='utf-8') as f:
+            self.meta = json.load(f)
+        self.scale: float = self.meta['scale']
+        self.num_docs: int = self.meta['num_docs']
+        for name in LEXICAL_FILES:
+            setattr(self, name[len('lexical_'):], np.load(os.path.join(path, f"{name}.npy"), mmap_mode='r'))
+        # Indexes written before document frequencies were stored cannot be patched.
+        df_path = os.path.join(path, DF_FILE)
+        self.df = np.load(df_path, mmap_mode='r') if os.path.exists(df_path) else None
+        self._matches = LRUCache(MATCH_CACHE_SIZE, name="lexical_matches")
+
+    @classmethod
+    def open(cls, path: str) -> Optional["LexicalIndex"]:
+        """Opens the index if it was written next to the catalog, else returns None."""
+        if not os.path.exists(os.path.join(path, META_FILE)):
+            return None
+        if not os.path.exists(os.path.join(path, 'lexical_skips.npy')):
+            print(f"Lexical index in {path} predates compressed postings; rebuild it with build_index.py. Searching without it.")
+            return None
+        return cls(path)
+
+    def patchable(self, changed_rows: int) -> bool:
+        """Whether an update that re-tokenizes `changed_rows` rows may patch this index rather than rebuild it."""
+        if self.df is None or 'total_length' not in self.meta:
+            return False
+        return self.meta.get('patched_rows', 0) + changed_rows <= PATCH_LIMIT * max(self.num_docs, 1)
+
+    def _term_ids(self, query: str) -> np.ndarray:
+        hashes = np.array([term_hash(term) for term in dict.fromkeys(tokenize(query))], dtype=np.uint64)
+        if not len(hashes) or not len(self.terms):
+            return np.zeros(0, dtype=np.int64)
+        positions = np.minimum(np.searchsorted(self.terms, hashes), len(self.terms) - 1)
+        return positions[self.terms[positions] == hashes].astype(np.int64)
+
+    def _docs(self, t0: int, t1: int) -> np.ndarray:
+        """Decoded rows of the postings of terms t0..t1 - 1, in posting order."""
+        counts = np.diff(self.offsets[t0:t1 + 1])
+        term_of = np.repeat(np.arange(t0, t1), counts)
+        rank = np.arange(self.offsets[t0], self.offsets[t1]) - self.offsets[term_of]
+        widths = np.diff(self.doc_offsets[t0:t1 + 1]) // np.maximum(counts, 1)
+        first = self.doc_offsets[t0]
+        data = np.asarray(self.docs[first:self.doc_offsets[t1]])
+        positions = self.doc_offsets[term_of] - first + rank * widths[term_of - t0]
+        starts = rank % POSTING_BLOCK == 0
+        return _undelta(_unpack(data, positions, widths[term_of - t0]), starts, self.skips[self.skip_offsets[t0]:self.skip_offsets[t1]])
+
+    def _postings(self, term: int, blocks: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Decoded rows and impacts of a term's postings, or of the given (ascending) blocks of them."""
+        start, end = int(self.offsets[term]), int(self.offsets[term + 1])
+        count = end - start
+        first_byte = int(self.doc_offsets[term])
+        width = max((int(self.doc_offsets[term + 1]) - first_byte) // max(count, 1), 1)
+        gaps = np.asarray(self.docs[first_byte:first_byte + count * width]).view(f'<u{width}')
+        impacts = self.impacts[start:end]
+        firsts = np.asarray(self.skips[self.skip_offsets[term]:self.skip_offsets[term + 1]])
+        # A term's gaps all have the same width, so whole blocks decode as the rows
+        # of a (blocks, POSTING_BLOCK) matrix; only the last one can be shorter.
+        full = count // POSTING_BLOCK
+        if blocks is None:
+            head, tail = slice(None), full < len(firsts)
+        else:
+            head, tail = blocks[blocks < full], len(blocks) > 0 and blocks[-1] == full
+        docs = np.cumsum(gaps[:full * POSTING_BLOCK].reshape(full, POSTING_BLOCK)[head], axis=1, dtype=np.uint32)
+        docs += firsts[:full][head, None]
+        block_impacts = impacts[:full * POSTING_BLOCK].reshape(full, POSTING_BLOCK)[head]
+        if not tail:
+            return docs.ravel(), block_impacts.ravel()
+        last = np.cumsum(gaps[full * POSTING_BLOCK:], dtype=np.uint32) + firsts[full]
+        return np.concatenate([docs.ravel(), last]), np.concatenate([block_impacts.ravel(), impacts[full * POSTING_BLOCK:]])
+
+    def matching(self, query: str) -> np.ndarray:
+        """
+        Sorted catalog rows that contain at least one (indexed) term of `query`.
+
+        A single term's postings are returned as they are. Several are merged by
+        sorting when they are short, or through a row mask when they hold a sizeable
+        share of the catalog, so the work is bounded by the catalog size; the result
+        is cached per query.
+        """
+        terms = self._term_ids(query)
+        terms = terms[self.offsets[terms + 1] > self.offsets[terms]]
+        if len(terms) == 0:
+            return np.zeros(0, dtype=np.uint32)
+        if len(terms) == 1:
+            return self._postings(terms[0])[0]
+        key = tuple(sorted(terms.tolist()))
+        cached = self._matches.get(key)
+        if cached is not None:
+            return cached
+        total = int((self.offsets[terms + 1] - self.offsets[terms]).sum())
+        if total * 32 < self.num_docs:
+            rows = np.unique(np.concatenate([self._postings(term)[0] for term in terms]))
+        else:
+            mask = np.zeros(self.num_docs, dtype=bool)
+            for term in terms:
+                mask[self._postings(term)[0]] = True
+            rows = np.flatnonzero(mask).astype(np.uint32)
+        self._matches.set(key, rows)
+        return rows
+
+    def search(self, query: str, k: int, allowed: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Top-k catalog rows for `query` by BM25, best first, with their scores.
+        `allowed` (sorted rows, None for all) restricts the result like a filter.
+        """
+        terms = self._term_ids(query)
+        terms = terms[self.offsets[terms + 1] > self.offsets[terms]]
+        empty = np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float64)
+        if not len(terms) or k <= 0 or (allowed is not None and not len(allowed)):
+            return empty
+        bounds = np.asarray(self.max[terms], dtype=np.int64)
+        order = np.argsort(-bounds, kind='stable')
+        terms = terms[order]
+        # remaining[i]: the most that terms i.. can add to a product's score.
+        remaining = np.cumsum(bounds[order][::-1])[::-1]
+        if allowed is not None:
+            allowed = np.asarray(allowed, dtype=np.int64)
+
+        # Scores are kept only for the rows some visited term matched (`rows`,
+        # sorted), so a query costs its postings rather than the catalog size. The
+        # postings are collected and merged into them once after the loop. Testing
+        # whether the remaining terms can be skipped needs them merged earlier; as
+        # that re-sorts the rows merged before, it is done only when those are
+        # fewer than the next term's postings.
+        rows = np.zeros(0, dtype=np.int64)
+        scores = np.zeros(0, dtype=np.int64)
+        pending_docs: List[np.ndarray] = []
+        pending_impacts: List[np.ndarray] = []
+        pending = 0
+        frozen = False
+        for i, term in enumerate(terms):
+            count = int(self.offsets[term + 1] - self.offsets[term])
+            if not frozen and pending and len(rows) + pending >= k and count >= len(rows):
+                rows, scores = _merge(rows, scores, pending_docs, pending_impacts, self.num_docs)
+                pending_docs, pending_impacts, pending = [], [], 0
+                # Once k rows score more than the remaining terms could add up to for
+                # an unseen row, no unseen row can reach the top k.
+                frozen = np.count_nonzero(scores > remaining[i]) >= k
+            if frozen:
+                if len(rows) < count:
+                    # Decode only the blocks the collected rows fall in.
+                    firsts = self.skips[self.skip_offsets[term]:self.skip_offsets[term + 1]]
+                    blocks = np.unique(np.searchsorted(firsts, rows, side='right') - 1)
+                    blocks = blocks[blocks >= 0]
+                    if not len(blocks):
+                        continue
+                    docs, impacts = self._postings(term, blocks)
+                    positions = np.minimum(np.searchsorted(docs, rows), len(docs) - 1)
+                    hit = docs[positions] == rows
+                    scores[hit] += impacts[positions[hit]]
+                else:
+                    docs, impacts = self._postings(term)
+                    positions = np.minimum(np.searchsorted(rows, docs), len(rows) - 1)
+                    hit = rows[positions] == docs
+                    scores[positions[hit]] += impacts[hit]
+                continue
+            docs, impacts = self._postings(term)
+            if allowed is not None:
+                positions = np.minimum(np.searchsorted(allowed, docs), len(allowed) - 1)
+                keep = allowed[positions] == docs
+                docs, impacts = docs[keep], impacts[keep]
+            pending_docs.append(docs)
+            pending_impacts.append(impacts)
+            pending += len(docs)
+        if pending:
+            rows, scores = _merge(rows, scores, pending_docs, pending_impacts, self.num_docs)
+
+        # Ties at the cut go to the lowest rows, as they do within the top k.
+        if len(rows) > k:
+            keep = np.flatnonzero(scores >= np.partition(scores, len(rows) - k)[len(rows) - k])
+            rows, scores = rows[keep], scores[keep]
+        top = np.lexsort((rows, -scores))[:k]
+        return rows[top], scores[top] * self.scale
+
+
+def reciprocal_rank_fusion(rankings: Sequence[np.ndarray], k: int = 60, limit: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """Fuses ranked row lists by summing 1 / (k + rank); returns rows best first and their fused scores."""
+    rankings = [np.asarray(r, dtype=np.int64) for r in rankings if len(r)]
+    if not rankings:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float64)
+    rows, inverse = np.unique(np.concatenate(rankings), return_inverse=True)
+    weights = np.concatenate([1.0 / (k + np.arange(1, len(r) + 1)) for r in rankings])
+    fused = np.bincount(inverse, weights=weights, minlength=len(rows))
+    # Ties keep the order of the first ranking they appear in.
+    first_seen = np.full(len(rows), np.iinfo(np.int64).max)
+    np.minimum.at(first_seen, inverse, np.arange(len(inverse)))
+    order = np.lexsort((first_seen, -fused))[:limit]
+    return rows[order], fused[order]
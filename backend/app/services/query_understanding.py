@@ -0,0 +1,145 @@
+import re
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+PRICE_PATTERN = re.compile(r'(under|less than|below)\s*\$?(\d+\.?\d*)', flags=re.IGNORECASE)
+# Brand names and queries are split into the same word tokens, so "H&M" or
+# "levi's" stay one token and a brand only matches on word boundaries.
+TOKEN_PATTERN = re.compile(r"\w+(?:[&'.\-]\w+)*")
+WORD_PATTERN = re.compile(r'\S+')
+
+Span = Tuple[int, int]
+
+
+class BrandMatcher:
+    """
+    Finds catalog brand names in a query with a word-level trie.
+
+    Matching is case-insensitive and greedy: at each word the longest brand
+    starting there wins, and matches never overlap. Matches return the brand as
+    it is spelled in the catalog.
+    """
+
+    _END = ''
+
+    def __init__(self, brands: Iterable[str]):
+        self.root: Dict[str, Any] = {}
+        for brand in brands:
+            tokens = [m.group().casefold() for m in TOKEN_PATTERN.finditer(brand)]
+            if not tokens or (len(tokens) == 1 and len(tokens[0]) < 2):
+                continue
+            node = self.root
+            for token in tokens:
+                node = node.setdefault(token, {})
+            node.setdefault(self._END, brand)
+
+    def find(self, text: str) -> List[Tuple[int, int, str]]:
+        """(start, end, catalog brand) of every brand mention in `text`."""
+        tokens = list(TOKEN_PATTERN.finditer(text))
+        matches = []
+        i = 0
+        while i < len(tokens):
+            node, best = self.root, None
+            for j in range(i, len(tokens)):
+                node = node.get(tokens[j].group().casefold())
+                if node is None:
+                    break
+                if self._END in node:
+                    best = (j, node[self._END])
+            if best is None:
+                i += 1
+                continue
+            j, brand = best
+            matches.append((tokens[i].start(), tokens[j].end(), brand))
+            i = j + 1
+        return matches
+
+
+def _covered(start: int, end: int, spans: List[Span]) -> bool:
+    """Whether a word's midpoint falls inside one of the spans."""
+    mid = (start + end) // 2
+    return any(s <= mid < e for s, e in spans)
+
+
+class QueryUnderstanding:
+    """
+    Extracts a brand filter and a price ceiling from a query and rewrites it to the
+    remaining words.
+
+    The fast path is the price pattern plus the catalog brand matcher. The NER model
+    only runs when that is inconclusive: no catalog brand was found but the query
+    has words capitalized like names (see _looks_like_name) the model may tag. NER
+    organisations are snapped to catalog brands; ones that match no brand stay in
+    the rewritten query.
+    """
+
+    def __init__(self, ner_pipeline: Optional[Callable[[str], List[Dict[str, Any]]]], ner_fallback: bool = True):
+        self.ner_pipeline = ner_pipeline
+        self.ner_fallback = ner_fallback and ner_pipeline is not None
+
+    @staticmethod
+    def _looks_like_name(word: str, first: bool) -> bool:
+        """
+        A capital inside the word ("iPhone") or an all-caps word ("JBL") suggests a
+        name anywhere; a leading capital only after the first word, since queries
+        are often typed as sentences ("Headphones under 50").
+        """
+        letters = [c for c in word if c.isalpha()]
+        if any(c.isupper() for c in letters[1:]):
+            return True
+        return not first and bool(letters) and letters[0].isupper()
+
+    def _needs_ner(self, query: str, spans: List[Span], brands: List[str]) -> bool:
+        if not self.ner_fallback or brands:
+            return False
+        return any(self._looks_like_name(word.group(), i == 0) for i, word in enumerate(WORD_PATTERN.finditer(query))
+                   if not _covered(word.start(), word.end(), spans))
+
+    def _fast_path(self, query: str, matcher: BrandMatcher) -> Tuple[Dict[str, Any], List[Span], List[str]]:
+        """The price filter and catalog brands of a query, with the spans they cover."""
+        filters: Dict[str, Any] = {}
+        spans: List[Span] = []
+        price_match = PRICE_PATTERN.search(query)
+        if price_match:
+            filters['price_max'] = float(price_match.group(2))
+            spans.append(price_match.span())
+        brands = []
+        for start, end, brand in matcher.find(query):
+            if not _covered(start, end, spans):
+                brands.append(brand)
+                spans.append((start, end))
+        return filters, spans, brands
+
+    @staticmethod
+    def _finish(query: str, matcher: BrandMatcher, filters: Dict[str, Any], spans: List[Span], brands: List[str], entities: List[Dict[str, Any]]) -> Dict[str, Any]:
+        leading = []
+        for entity in entities:
+            group = entity['entity_group']
+            if group == 'ORG':
+                snapped = [brand for _, _, brand in matcher.find(entity['word'])]
+                if snapped:
+                    brands.extend(snapped)
+                    spans.append((entity['start'], entity['end']))
+            elif group == 'MISC':
+                leading.append(entity['word'])
+                spans.append((entity['start'], entity['end']))
+
+        if brands:
+            filters['brand'] = list(dict.fromkeys(brands))
+        words = [w.group() for w in WORD_PATTERN.finditer(query) if not _covered(w.start(), w.end(), spans)]
+        rewritten = " ".join(dict.fromkeys(leading + words))
+        return {"rewritten": rewritten.strip(), "filters": filters}
+
+    def __call__(self, query: str, matcher: BrandMatcher) -> Dict[str, Any]:
+        filters, spans, brands = self._fast_path(query, matcher)
+        entities = self.ner_pipeline(query) if self._needs_ner(query, spans, brands) else []
+        return self._finish(query, matcher, filters, spans, brands, entities)
+
+    def batch(self, queries: List[str], matcher: BrandMatcher) -> List[Dict[str, Any]]:
+        """Same as calling this on each query, but the queries that need NER share one pipeline call."""
+        fast = [self._fast_path(query, matcher) for query in queries]
+        needs_ner = [i for i, (query, (_, spans, brands)) in enumerate(zip(queries, fast)) if self._needs_ner(query, spans, brands)]
+        entities: Dict[int, List[Dict[str, Any]]] = {}
+        if needs_ner:
+            tagged = self.ner_pipeline([queries[i] for i in needs_ner], batch_size=len(needs_ner))
+            entities = dict(zip(needs_ner, tagged))
+        return [self._finish(query, matcher, *fast[i], entities.get(i, [])) for i, query in enumerate(queries)]
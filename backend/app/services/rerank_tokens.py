@@ -0,0 +1,109 @@
+import hashlib
+import json
+import os
+from typing import Iterable, List, Optional, Sequence
+
+import numpy as np
+
+# Cross-encoder tokens of each product's "title. description" text, stored next to
+# the catalog columns (written by build_index.py and by incremental updates):
+#
+#   rerank_tokens.bin           token ids of every row, without special tokens,
+#                               truncated to max_tokens, concatenated
+#   rerank_tokens.offsets.npy   int64 start of each row's tokens (num_rows + 1 entries)
+#   rerank_tokens.json          dtype, max_tokens and the fingerprint of the tokenizer
+#
+# Token ids are uint16 when the vocabulary fits, int32 otherwise. At query time
+# only the query is tokenized; the pairs are framed with PairTemplate.
+
+TOKENS_FILE = 'rerank_tokens.bin'
+OFFSETS_FILE = 'rerank_tokens.offsets.npy'
+META_FILE = 'rerank_tokens.json'
+
+
+def tokenizer_fingerprint(tokenizer) -> str:
+    """Identifies a tokenizer by its class, vocabulary and casing, not by where it was loaded from."""
+    digest = hashlib.sha1(type(tokenizer).__name__.encode('utf-8'))
+    digest.update(json.dumps(sorted(tokenizer.get_vocab().items())).encode('utf-8'))
+    digest.update(repr(tokenizer.init_kwargs.get('do_lower_case')).encode('utf-8'))
+    return digest.hexdigest()[:16]
+
+
+def tokenize_texts(tokenizer, texts: Sequence[str], max_tokens: int) -> List[List[int]]:
+    if not texts:
+        return []
+    return tokenizer(list(texts), add_special_tokens=False, truncation=True, max_length=max_tokens)["input_ids"]
+
+
+class RerankTokenWriter:
+    """Streams product token ids into the rerank token files of a catalog directory."""
+
+    def __init__(self, path: str, fingerprint: str, vocab_size: int, max_tokens: int):
+        self.path = path
+        self.fingerprint = fingerprint
+        self.max_tokens = max_tokens
+        self.dtype = np.dtype(np.uint16 if vocab_size <= np.iinfo(np.uint16).max else np.int32)
+        self._file = open(os.path.join(path, TOKENS_FILE), 'wb')
+        self._offsets = [np.zeros(1, dtype=np.int64)]
+        self._end = 0
+
+    def extend(self, token_lists: Iterable[Sequence[int]]):
+        token_lists = list(token_lists)
+        lengths = np.array([len(tokens) for tokens in token_lists], dtype=np.int64)
+        if len(token_lists):
+            np.concatenate([np.asarray(tokens, dtype=self.dtype) for tokens in token_lists]).tofile(self._file)
+        self._offsets.append(self._end + np.cumsum(lengths))
+        self._end += int(lengths.sum())
+
+    def copy_rows(self, tokens: "RerankTokens", rows: np.ndarray):
+        """Appends the tokens of existing rows (ascending) without re-tokenizing them."""
+        rows = np.asarray(rows, dtype=np.int64)
+        lengths = np.asarray(tokens.offsets[rows + 1]) - np.asarray(tokens.offsets[rows])
+        runs = np.split(rows, np.flatnonzero(np.diff(rows) != 1) + 1) if len(rows) else []
+        for run in runs:
+            np.asarray(tokens.data[tokens.offsets[run[0]]:tokens.offsets[run[-1] + 1]], dtype=self.dtype).tofile(self._file)
+        self._offsets.append(self._end + np.cumsum(lengths))
+        self._end += int(lengths.sum())
+
+    def close(self):
+        self._file.close()
+        np.save(os.path.join(self.path, OFFSETS_FILE), np.concatenate(self._offsets))
+        with open(os.path.join(self.path, META_FILE), 'w', encoding='utf-8') as f:
+            json.dump({"dtype": self.dtype.name, "max_tokens": self.max_tokens, "fingerprint": self.fingerprint}, f)
+
+
+def write_rerank_tokens(catalog, tokenizer, max_tokens: int, chunk_size: int = 10_000, fingerprint: Optional[str] = None):
+    """Tokenizes every catalog row's rerank text, a chunk of rows at a time, into the catalog directory."""
+    writer = RerankTokenWriter(catalog.path, fingerprint or tokenizer_fingerprint(tokenizer), len(tokenizer), max_tokens)
+    for start in range(0, len(catalog), chunk_size):
+        rows = range(start, min(start + chunk_size, len(catalog)))
+        writer.extend(tokenize_texts(tokenizer, [catalog.rerank_text(row) for row in rows], max_tokens))
+    writer.close()
+
+
+class RerankTokens:
+    """Memory-mapped product token ids; `tokens[row]` is that row's id array."""
+
+    def __init__(self, path: str):
+        with open(os.path.join(path, META_FILE), 'r', encoding='utf-8') as f:
+            self.meta = json.load(f)
+        self.fingerprint: str = self.meta['fingerprint']
+        self.max_tokens: int = self.meta['max_tokens']
+        self.offsets = np.load(os.path.join(path, OFFSETS_FILE), mmap_mode='r')
+        size = os.path.getsize(os.path.join(path, TOKENS_FILE))
+        dtype = np.dtype(self.meta['dtype'])
+        self.data = np.memmap(os.path.join(path, TOKENS_FILE), dtype=dtype, mode='r') if size else np.zeros(0, dtype=dtype)
+
+    @classmethod
+    def open(cls, path: str, fingerprint: Optional[str]) -> Optional["RerankTokens"]:
+        """Opens the token files if present and written by the same tokenizer, else returns None."""
+        if fingerprint is None or not os.path.exists(os.path.join(path, META_FILE)):
+            return None
+        tokens = cls(path)
+        if tokens.fingerprint != fingerprint:
+            print(f"Rerank tokens in {path} were written by a different tokenizer; tokenizing product texts per request.")
+            return None
+        return tokens
+
+    def __getitem__(self, row: int) -> np.ndarray:
+        return self.data[int(self.offsets[row]):int(self.offsets[row + 1])]
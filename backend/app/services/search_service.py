@@ -1,148 +1,670 @@
+import asyncio
 import faiss
-import numpy as np
 import json
-import re
+import numpy as np
 import os
+import threading
 import time
-from collections import Counter
-from sentence_transformers import SentenceTransformer, CrossEncoder
-from typing import List, Dict, Any
-from transformers import pipeline
+from typing import AsyncIterator, List, Dict, Any, Optional, Tuple
+from app.core.config import settings
+from app.core.metrics import REQUEST_SECONDS, STAGE_SECONDS, RequestTimings, format_family
+from app.services.batching import MicroBatcher
+from app.services.cache import LRUCache
+from app.services.cascade import RerankCascade, RerankStage
+from app.services.concurrency import AdmissionGate, CpuExecutor
+from app.services.facets import FilterError, parse_bucket, validate_filters
+from app.services.inference import configure_torch_threads, load_bi_encoder, load_cross_encoder, load_ner_pipeline
+from app.services.lexical import reciprocal_rank_fusion
+from app.services.query_understanding import QueryUnderstanding
+from app.services.snapshot import IndexSnapshot, SnapshotStore
+from app.services.updates import IndexUpdater
+
+# FAISS candidates retrieved per query, before BM25 fusion and reranking.
+ANN_CANDIDATES = 200
+# search_batch requests may leave out the `search` arguments that have defaults.
+BATCH_REQUEST_DEFAULTS = dict(filters=None, sort_by='relevance', nprobe=None, ef_search=None, rerank_depth=None, debug_timings=False)
 
 class SearchService:
     def __init__(self, data_path: str, bi_encoder_path: str, cross_encoder_path: str, faiss_index_path: str):
         print("--- Initializing Search Service ---")
 
-        # --- THIS IS THE FIX ---
-        # Build robust paths relative to THIS file's location, not the current working directory.
-        # This makes the service runnable from anywhere.
-        SERVICE_ROOT = os.path.dirname(__file__)
-        PROJECT_ROOT = os.path.abspath(os.path.join(SERVICE_ROOT, '..', '..', '..'))
-
-        # Construct the correct, absolute paths
-        abs_data_path = os.path.join(PROJECT_ROOT, 'training', 'data', 'products.jsonl')
-        abs_bi_encoder_path = os.path.join(PROJECT_ROOT, 'backend', 'models', 'bi-encoder')
-        abs_cross_encoder_path = os.path.join(PROJECT_ROOT, 'backend', 'models', 'cross-encoder')
-        abs_faiss_index_path = os.path.join(PROJECT_ROOT, 'backend', 'index', 'products.faiss')
-        
-        # Now, use these absolute paths to load everything
-        self.products = self._load_products(abs_data_path)
-        self.product_map = {p['product_id']: p for p in self.products}
-        
-        print("Loading models...")
-        self.bi_encoder = SentenceTransformer(abs_bi_encoder_path, device='mps')
-        self.cross_encoder = CrossEncoder(abs_cross_encoder_path, device='mps')
+        # Paths come from settings (the repository layout unless overridden), so the
+        # service is runnable from anywhere.
+        abs_data_path = os.path.abspath(settings.DATA_PATH)
+        abs_bi_encoder_path = os.path.abspath(os.path.join(settings.MODELS_DIR, 'bi-encoder'))
+        abs_cross_encoder_path = os.path.abspath(os.path.join(settings.MODELS_DIR, 'cross-encoder'))
+        abs_index_dir = os.path.abspath(settings.INDEX_DIR)
+        abs_onnx_dir = os.path.abspath(os.path.join(settings.MODELS_DIR, 'onnx'))
+
+        # Now, use these absolute paths to load everything.
+        print(f"Loading models ({settings.INFERENCE_BACKEND} backend)...")
+        configure_torch_threads(settings.TORCH_THREADS)
+        model_options = dict(
+            backend=settings.INFERENCE_BACKEND,
+            device=settings.TORCH_DEVICE,
+            quantized=settings.ONNX_QUANTIZED,
+            intra_op_threads=settings.ONNX_INTRA_OP_THREADS,
+        )
+        self.bi_encoder = load_bi_encoder(abs_bi_encoder_path, os.path.join(abs_onnx_dir, 'bi-encoder'), **model_options)
+        self.cross_encoder = load_cross_encoder(abs_cross_encoder_path, os.path.join(abs_onnx_dir, 'cross-encoder'), **model_options)
+        self.light_cross_encoder = None
+        if settings.RERANK_LIGHT_MODEL:
+            self.light_cross_encoder = load_cross_encoder(settings.RERANK_LIGHT_MODEL, os.path.join(abs_onnx_dir, 'cross-encoder-light'), **model_options)
+
+        # Concurrent requests share encode/predict calls through these batchers.
+        self.query_encoder = MicroBatcher(
+            self._encode_batch,
+            max_batch_size=settings.ENCODE_MAX_BATCH_SIZE,
+            max_wait_ms=settings.ENCODE_MAX_WAIT_MS,
+            name="bi-encoder",
+        )
+        # Reranking cascade: ANN order, then the optional light cross-encoder, then the
+        # full one. Product texts are tokenized at build time (rerank_tokens.* next to the
+        # catalog) with the full cross-encoder's tokenizer; per request only the query is.
+        self.reranker = RerankStage("cross-encoder", self.cross_encoder, settings.RERANK_MAX_BATCH_SIZE, settings.RERANK_MAX_WAIT_MS)
+        stages = [self.reranker]
+        if self.light_cross_encoder is not None:
+            stages.insert(0, RerankStage("light-cross-encoder", self.light_cross_encoder, settings.RERANK_MAX_BATCH_SIZE, settings.RERANK_MAX_WAIT_MS))
+        self.cascade = RerankCascade(stages, settings.RERANK_FULL_DEPTH, settings.RERANK_MIN_DEPTH, settings.RERANK_BUDGET_RESERVE_MS / 1000.0)
+        self.token_fingerprint = self.reranker.fingerprint
+
+        # Async path: CPU-bound stages get their own pool and admission is bounded.
+        self.cpu_executor = CpuExecutor(settings.SEARCH_CPU_WORKERS)
+        self.admission = AdmissionGate(settings.SEARCH_MAX_CONCURRENCY, settings.SEARCH_MAX_PENDING)
         
-        print("Loading NER pipeline...")
-        self.ner_pipeline = pipeline("ner", model="dslim/bert-base-NER", grouped_entities=True, device=0)
+        # The NER model is only needed as the query-understanding fallback.
+        self.ner_pipeline = None
+        if settings.QUERY_NER_FALLBACK:
+            print("Loading NER pipeline...")
+            self.ner_pipeline = load_ner_pipeline(settings.NER_MODEL, os.path.join(abs_onnx_dir, 'ner'), **model_options)
+        self.query_understanding = QueryUnderstanding(self.ner_pipeline, settings.QUERY_NER_FALLBACK)
         
-        print("Loading FAISS index...")
-        self.faiss_index = faiss.read_index(abs_faiss_index_path)
+        # The catalog, filter index, facets and FAISS index live in one snapshot that
+        # is replaced as a whole when updates are applied (here, or by another process
+        # or the batch CLI, which is noticed by polling the store). The catalog is
+        # memory-mapped; rows are only decoded when they are returned.
+        print("Loading index snapshot...")
+        self.facet_options = dict(
+            price_boundaries=settings.PRICE_FACET_BOUNDARIES,
+            rating_boundaries=settings.RATING_FACET_BOUNDARIES,
+            brand_facet_size=settings.BRAND_FACET_SIZE,
+        )
+        self.snapshot_store = SnapshotStore(abs_index_dir, abs_data_path, settings.SNAPSHOT_RETENTION, mmap=settings.FAISS_MMAP)
+        self.snapshot: IndexSnapshot = self.snapshot_store.load(self.facet_options, self.token_fingerprint)
+        if self.snapshot.rerank_tokens is None:
+            print("No matching rerank tokens next to the catalog; product texts will be tokenized per request.")
+        self.updater = IndexUpdater(self.snapshot_store, self._encode_products, self.facet_options, self.reranker.tokenizer)
+        self._snapshot_lock = threading.Lock()
+        self._snapshot_checked_at = time.monotonic()
+        print(f"Loaded '{self.snapshot.index_kind}' index with {self.snapshot.faiss_index.ntotal} vectors.")
+
+        self.response_cache = LRUCache(settings.RESPONSE_CACHE_SIZE, settings.RESPONSE_CACHE_TTL_S, name="response")
+        self.embedding_cache = LRUCache(settings.EMBEDDING_CACHE_SIZE, settings.EMBEDDING_CACHE_TTL_S, name="embedding")
+        self.rewrite_cache = LRUCache(settings.REWRITE_CACHE_SIZE, settings.REWRITE_CACHE_TTL_S, name="rewrite")
         print("--- Search Service Initialized Successfully ---")
 
-    def _load_products(self, path: str) -> List[Dict[str, Any]]:
-        """Loads product data from a .jsonl file."""
-        if not os.path.exists(path):
-            # The error message now shows the absolute path, which is much better for debugging
-            raise FileNotFoundError(f"Product data not found at the absolute path: {path}")
-        
-        products = []
-        with open(path, 'r', encoding='utf-8') as f:
-            for line in f:
-                products.append(json.loads(line))
-        return products
-
-    # ... (The rest of the file: understand_query, _calculate_facets, search) ...
-    # ... (NO OTHER CHANGES ARE NEEDED IN THE REST OF THE FILE) ...
-    def understand_query(self, query: str) -> Dict[str, Any]:
-        entities = self.ner_pipeline(query)
-        rewritten_parts = []
-        filters = {}
-        processed_indices = set()
-        price_match = re.search(r'(under|less than|below)\s*\$?(\d+\.?\d*)', query, flags=re.IGNORECASE)
-        if price_match:
-            filters['price_max'] = float(price_match.group(2))
-            for i in range(price_match.start(), price_match.end()):
-                processed_indices.add(i)
-        for entity in entities:
-            if entity['entity_group'] == 'ORG':
-                filters.setdefault('brand', []).append(entity['word'])
-            elif entity['entity_group'] == 'MISC':
-                rewritten_parts.append(entity['word'])
-            for i in range(entity['start'], entity['end']):
-                processed_indices.add(i)
-        words = query.split()
-        current_pos = 0
-        unprocessed_words = []
-        for word in words:
-            word_start = query.find(word, current_pos)
-            word_end = word_start + len(word)
-            if (word_start + word_end) // 2 not in processed_indices:
-                unprocessed_words.append(word)
-            current_pos = word_end
-        final_rewritten_parts = rewritten_parts + unprocessed_words
-        rewritten_query = " ".join(sorted(set(final_rewritten_parts), key=final_rewritten_parts.index))
-        return {"rewritten": rewritten_query.strip(), "filters": filters}
-
-    def _calculate_facets(self, products: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-        if not products:
-            return []
-        brand_counts = Counter(p['brand'] for p in products if p.get('brand'))
-        brand_facet = {
-            "name": "Brand",
-            "buckets": [{"value": brand, "count": count} for brand, count in brand_counts.most_common(10)]
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        """Encodes a coalesced batch of query texts in a single bi-encoder call."""
+        return self.bi_encoder.encode(texts, batch_size=len(texts), convert_to_numpy=True).astype('float32')
+
+    def _encode_products(self, texts: List[str]) -> np.ndarray:
+        """Embeds product texts for index updates (bypasses the query micro-batcher)."""
+        return self.bi_encoder.encode(texts, batch_size=64, convert_to_numpy=True).astype('float32')
+
+    def warmup(self):
+        """
+        Runs every model once in the calling process, so session creation and thread
+        pool start-up are not paid by the first request. Served workers call this
+        before reporting ready; a parent that forks workers must not.
+        """
+        self.query_encoder(["warmup"])
+        if self.ner_pipeline is not None:
+            self.ner_pipeline("Warmup")
+        rows = np.arange(min(1, len(self.snapshot.catalog)))
+        for stage in self.cascade.stages:
+            stage.warmup(self.snapshot, rows)
+
+    def close(self):
+        """Stops this process's micro-batcher threads and CPU pool."""
+        self.query_encoder.close()
+        self.cascade.close()
+        self.cpu_executor.shutdown()
+
+    def understand_query(self, query: str, snapshot: Optional[IndexSnapshot] = None) -> Dict[str, Any]:
+        """Brand and price filters plus the rewritten query; NER only runs when the fast path is inconclusive."""
+        return self.query_understanding(query, (snapshot or self.snapshot).brand_matcher)
+
+    def _snapshot_poll_due(self) -> bool:
+        """Whether SNAPSHOT_POLL_S has passed since the store was last polled (starting the next interval if so)."""
+        now = time.monotonic()
+        if now - self._snapshot_checked_at < settings.SNAPSHOT_POLL_S:
+            return False
+        self._snapshot_checked_at = now
+        return True
+
+    def _reload_snapshot(self):
+        """Switches to the store's live snapshot if another process activated or rebuilt one (reads the store)."""
+        # Checked before taking the lock, which apply_updates holds for a whole update.
+        if self._snapshot_is_current():
+            return
+        with self._snapshot_lock:
+            if not self._snapshot_is_current():
+                self.snapshot = self.snapshot_store.load(self.facet_options, self.token_fingerprint)
+
+    def _snapshot_is_current(self) -> bool:
+        # Versions rather than names, so a rebuilt base index is noticed as well.
+        version = self.snapshot_store.current_version()
+        return version is None or version == self.snapshot.version
+
+    def apply_updates(self, upserts: List[Dict[str, Any]], deletes: List[str]) -> Dict[str, Any]:
+        """
+        Upserts and deletes products and swaps in the resulting snapshot.
+
+        Searches already running finish on the snapshot they started with. Raises
+        UpdateError for batches that cannot be applied.
+        """
+        with self.snapshot_store.lock(), self._snapshot_lock:
+            # Build on the latest snapshot, which the batch CLI may have advanced.
+            if not self._snapshot_is_current():
+                self.snapshot = self.snapshot_store.load(self.facet_options, self.token_fingerprint)
+            self.snapshot, summary = self.updater.apply(self.snapshot, upserts, deletes)
+        return summary
+
+    @staticmethod
+    def _search_params(snapshot: IndexSnapshot, nprobe: int = None, ef_search: int = None, selector: faiss.IDSelector = None, selectivity: float = 1.0):
+        """
+        Builds per-query FAISS search parameters for the loaded index type.
+
+        With a filter admitting only `selectivity` of the catalog, IVF probes
+        proportionally more lists so it still meets as many eligible vectors.
+        """
+        if snapshot.index_kind == 'ivf':
+            nprobe = nprobe or settings.FAISS_NPROBE
+            if selectivity < 1.0:
+                nprobe = int(np.ceil(nprobe / max(selectivity, 1e-9)))
+            return faiss.SearchParametersIVF(nprobe=min(nprobe, snapshot.ivf_nlist), sel=selector)
+        if snapshot.index_kind == 'hnsw':
+            return faiss.SearchParametersHNSW(efSearch=ef_search or settings.FAISS_EF_SEARCH, sel=selector)
+        if selector is not None:
+            return faiss.SearchParameters(sel=selector)
+        return None
+
+    @staticmethod
+    def _rewrite_key(snapshot: IndexSnapshot, query: str):
+        # Rewrites depend on the snapshot's brands and on the exact query text (NER
+        # keys on capitalization and the rewritten query keeps it).
+        return (snapshot.version, query)
+
+    def _rewrite(self, snapshot: IndexSnapshot, query: str, rewrite_on: bool) -> Dict[str, Any]:
+        if not rewrite_on:
+            return {"rewritten": query, "filters": {}}
+        rewritten_info = self.understand_query(query, snapshot)
+        self.rewrite_cache.set(self._rewrite_key(snapshot, query), rewritten_info)
+        return rewritten_info
+
+    def _cached_rewrite(self, snapshot: IndexSnapshot, query: str, rewrite_on: bool) -> Optional[Dict[str, Any]]:
+        if not rewrite_on:
+            return {"rewritten": query, "filters": {}}
+        return self.rewrite_cache.get(self._rewrite_key(snapshot, query))
+
+    def _cached_embedding(self, search_query: str) -> Optional[np.ndarray]:
+        return self.embedding_cache.get(search_query)
+
+    def _encode_query(self, search_query: str) -> np.ndarray:
+        query_embedding = np.asarray(self.query_encoder([search_query]))
+        self.embedding_cache.set(search_query, query_embedding)
+        return query_embedding
+
+    @staticmethod
+    def _response_key(snapshot: IndexSnapshot, query: str, top_k: int, rewrite_on: bool, rerank_on: bool, filters: Dict, sort_by: str, nprobe: int, ef_search: int, rerank_depth: int, latency_budget_ms: float):
+        filters_key = json.dumps(filters, sort_keys=True) if filters else None
+        return (snapshot.version, query, top_k, rewrite_on, rerank_on, filters_key, sort_by, nprobe, ef_search, rerank_depth, latency_budget_ms)
+
+    def _cached_response(self, key, timings: RequestTimings, debug_timings: bool) -> Optional[Dict[str, Any]]:
+        cached = self.response_cache.get(key)
+        if cached is None:
+            return None
+        elapsed = timings.elapsed()
+        REQUEST_SECONDS.observe(elapsed, "hit")
+        response = {**cached, "search_time": round(elapsed, 4)}
+        if debug_timings:
+            response["timings"] = timings.milliseconds(elapsed)
+        return response
+
+    def _cache_response(self, key, response: Dict[str, Any]):
+        """
+        Caches a response unless the latency budget skipped or cut a rerank stage:
+        that ranking reflects the load at the time, and a later identical request
+        should get the full one.
+        """
+        if any(stage.get("skipped") == "latency_budget" or stage.get("cut") == "latency_budget" for stage in response["rerank_stages"]):
+            return
+        self.response_cache.set(key, response)
+
+    def _finish(self, key, response: Dict[str, Any], timings: RequestTimings, debug_timings: bool) -> Dict[str, Any]:
+        """Stamps the search time on a freshly computed response and caches it (without the timings)."""
+        elapsed = timings.elapsed()
+        REQUEST_SECONDS.observe(elapsed, "miss")
+        response["search_time"] = round(elapsed, 4)
+        self._cache_response(key, response)
+        if debug_timings:
+            response = {**response, "timings": timings.milliseconds(elapsed)}
+        return response
+
+    def cache_stats(self) -> Dict[str, Any]:
+        return {
+            "version": self.snapshot.version,
+            "caches": {cache.name: cache.stats() for cache in (self.response_cache, self.embedding_cache, self.rewrite_cache)},
         }
-        prices = [p['price'] for p in products if p.get('price')]
-        price_buckets = [
-            {"value": "0-50", "count": sum(1 for p in prices if 0 <= p < 50)},
-            {"value": "50-100", "count": sum(1 for p in prices if 50 <= p < 100)},
-            {"value": "100-250", "count": sum(1 for p in prices if 100 <= p < 250)},
-            {"value": "250+", "count": sum(1 for p in prices if p >= 250)},
+
+    def metric_families(self) -> List[str]:
+        """Cache, queue and index state as Prometheus gauge/counter families (collected per scrape)."""
+        caches = {cache.name: cache.stats() for cache in (self.response_cache, self.embedding_cache, self.rewrite_cache)}
+        batchers = [self.query_encoder] + [stage.batcher for stage in self.cascade.stages]
+        families = [
+            format_family(f"search_cache_{key}_total", "counter", f"Cache {key} since start.", [({"cache": name}, stats[key]) for name, stats in caches.items()])
+            for key in ("hits", "misses", "evictions", "expirations")
         ]
-        price_facet = {
-            "name": "Price",
-            "buckets": [b for b in price_buckets if b['count'] > 0]
-        }
-        return [brand_facet, price_facet]
+        families += [
+            format_family("search_cache_entries", "gauge", "Entries held by each cache.", [({"cache": name}, stats["size"]) for name, stats in caches.items()]),
+            format_family("search_in_flight", "gauge", "Searches admitted and not yet finished (running or waiting).", [({}, self.admission.in_flight)]),
+            format_family("search_rejected_total", "counter", "Searches rejected because the admission queue was full.", [({}, self.admission.rejected)]),
+            format_family("batcher_pending", "gauge", "Submissions waiting for a micro-batch.", [({"batcher": b.name}, b.pending) for b in batchers]),
+            format_family("rerank_seconds_per_pair", "gauge", "Running per-pair cost estimate of each rerank stage.",
+                          [({"stage": stage.name}, stage.cost.seconds_per_pair or 0.0) for stage in self.cascade.stages]),
+            format_family("index_products", "gauge", "Products in the live snapshot.", [({"snapshot": self.snapshot.name or "base"}, len(self.snapshot.catalog))]),
+        ]
+        return families
+
+    @staticmethod
+    def _constraints(snapshot: IndexSnapshot, filters: Dict = None, query_filters: Dict = None) -> Dict[str, Optional[list]]:
+        """
+        Turns the sidebar filters (Brand / Price / Rating facet values) and the filters
+        understand_query extracted (brand / price_max) into FilterIndex.select
+        constraints. Query brands are matched against the catalog and ignored when
+        unknown; the query's price_max is kept under its own key so it also bounds
+        the Price facet.
+        """
+        filters = filters or {}
+        query_filters = query_filters or {}
+        constraints: Dict[str, Optional[list]] = {}
+        if filters.get('Brand'):
+            constraints['Brand'] = snapshot.filter_index.brand_codes(filters['Brand'])
+        for name in ('Price', 'Rating'):
+            if filters.get(name):
+                constraints[name] = [parse_bucket(value) for value in filters[name]]
+        if query_filters.get('brand'):
+            codes = snapshot.filter_index.brand_codes(query_filters['brand'])
+            if codes:
+                constraints['query.Brand'] = codes
+        if query_filters.get('price_max') is not None:
+            constraints['query.Price'] = [(None, float(query_filters['price_max']))]
+        return constraints
+
+    @staticmethod
+    def _ann_rows(snapshot: IndexSnapshot, distances: np.ndarray, ids: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Catalog rows in rank order and their ANN scores (higher is better) for one row of FAISS results."""
+        found = ids != -1
+        scores = distances[found].astype(np.float64)
+        if snapshot.faiss_index.metric_type == faiss.METRIC_L2:
+            scores = -scores
+        # Ids without a catalog row belong to products deleted from an HNSW index.
+        rows = snapshot.catalog.rows_for_ids(ids[found])
+        return rows[rows >= 0], scores[rows >= 0]
+
+    @staticmethod
+    def _fetch_size(snapshot: IndexSnapshot, num_candidates: int) -> int:
+        """Candidates to take from FAISS: RESCORE_FACTOR times more when they are re-scored."""
+        if snapshot.vectors is not None and settings.VECTOR_RESCORE:
+            return num_candidates * max(1, settings.RESCORE_FACTOR)
+        return num_candidates
+
+    @staticmethod
+    def _rescore(snapshot: IndexSnapshot, query_embedding: np.ndarray, rows: np.ndarray, scores: np.ndarray, num_candidates: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Re-ranks the shortlist of a compressed index by exact similarity to the full
+        float32 vectors and keeps the best `num_candidates`. A no-op for indexes
+        without exact vectors.
+        """
+        if snapshot.vectors is None or not settings.VECTOR_RESCORE or not len(rows):
+            return rows, scores
+        exact = snapshot.vectors.scores(query_embedding, rows, snapshot.faiss_index.metric_type)
+        order = np.argsort(-exact, kind='stable')[:num_candidates]
+        return rows[order], exact[order]
+
+    def _ann_search(self, snapshot: IndexSnapshot, query_embedding: np.ndarray, allowed: Optional[np.ndarray], num_candidates: int, nprobe: int = None, ef_search: int = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Searches FAISS restricted to the `allowed` rows (None for all), so a selective
+        filter still yields a full candidate list. Returns catalog rows in rank order
+        and their ANN scores (higher is better).
+        """
+        if allowed is not None and len(allowed) == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float64)
+        selector = snapshot.filter_index.selector(allowed) if allowed is not None else None
+        selectivity = len(allowed) / max(len(snapshot.catalog), 1) if allowed is not None else 1.0
+        params = self._search_params(snapshot, nprobe, ef_search, selector, selectivity)
+        fetch = self._fetch_size(snapshot, num_candidates)
+        if params is not None:
+            distances, ids = snapshot.faiss_index.search(query_embedding, fetch, params=params)
+        else:
+            distances, ids = snapshot.faiss_index.search(query_embedding, fetch)
+        return self._rescore(snapshot, query_embedding, *self._ann_rows(snapshot, distances[0], ids[0]), num_candidates)
+
+    def _ann_search_many(self, snapshot: IndexSnapshot, query_embeddings: np.ndarray, num_candidates: int, nprobe: int = None, ef_search: int = None) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """Unfiltered ANN search for several queries in one multi-row FAISS call; (rows, scores) per query."""
+        params = self._search_params(snapshot, nprobe, ef_search)
+        fetch = self._fetch_size(snapshot, num_candidates)
+        if params is not None:
+            distances, ids = snapshot.faiss_index.search(query_embeddings, fetch, params=params)
+        else:
+            distances, ids = snapshot.faiss_index.search(query_embeddings, fetch)
+        return [self._rescore(snapshot, query_embeddings[i], *self._ann_rows(snapshot, distances[i], ids[i]), num_candidates) for i in range(len(ids))]
 
-    def search(self, query: str, top_k: int, rewrite_on: bool, rerank_on: bool, filters: Dict = None, sort_by: str = 'relevance') -> Dict[str, Any]:
+    def _select(self, snapshot: IndexSnapshot, filters: Dict = None, query_filters: Dict = None) -> Tuple[Dict[str, Optional[list]], Optional[np.ndarray]]:
+        """The filter constraints of a request and the catalog rows they admit (None for all)."""
+        constraints = self._constraints(snapshot, filters, query_filters)
+        return constraints, snapshot.filter_index.select(constraints)
+
+    def _retrieve(self, snapshot: IndexSnapshot, search_query: str, query_embedding: np.ndarray, filters: Dict = None, query_filters: Dict = None, nprobe: int = None, ef_search: int = None, timings: Optional[RequestTimings] = None) -> Tuple[np.ndarray, np.ndarray, List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """
+        Runs the filtered FAISS search and, when the snapshot has a BM25 index, the
+        filtered lexical search, fusing both rankings with reciprocal rank fusion.
+        Counts facets over every product the query matched. Returns catalog rows, their
+        retrieval scores, the facets and the retrieval stages that ran.
+        """
+        timings = timings or RequestTimings()
+        with timings.stage('filter'):
+            constraints, allowed = self._select(snapshot, filters, query_filters)
+        with timings.stage('faiss'):
+            rows, scores = self._ann_search(snapshot, query_embedding, allowed, ANN_CANDIDATES, nprobe, ef_search)
+        return self._fuse(snapshot, search_query, rows, scores, constraints, allowed, timings)
+
+    def _fuse(self, snapshot: IndexSnapshot, search_query: str, rows: np.ndarray, scores: np.ndarray, constraints: Dict[str, Optional[list]], allowed: Optional[np.ndarray], timings: RequestTimings) -> Tuple[np.ndarray, np.ndarray, List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """Adds the BM25 candidates to the ANN ones and counts the facets (the retrieval steps after FAISS)."""
+        stages = [{"stage": "ann", "candidates": len(rows)}]
+        if settings.HYBRID_SEARCH and snapshot.lexical_index is not None:
+            with timings.stage('bm25'):
+                lexical_rows, _ = snapshot.lexical_index.search(search_query, settings.LEXICAL_CANDIDATES, allowed)
+            stages.append({"stage": "bm25", "candidates": len(lexical_rows)})
+            if len(lexical_rows):
+                with timings.stage('fusion'):
+                    rows, scores = reciprocal_rank_fusion([rows, lexical_rows], settings.RRF_K, max(ANN_CANDIDATES, len(rows)))
+                stages.append({"stage": "rrf", "candidates": len(rows)})
+        with timings.stage('facets'):
+            # Facets count what the query matched: the products containing one of its
+            # terms and the retrieved candidates, so every result shown is counted.
+            matched = np.unique(rows)
+            if snapshot.lexical_index is not None:
+                lexical = np.asarray(snapshot.lexical_index.matching(search_query), dtype=np.int64)
+                # The few candidates are merged in by binary search rather than by
+                # sorting the (possibly large) match set again.
+                positions = np.searchsorted(lexical, matched)
+                missing = positions >= len(lexical)
+                missing[~missing] = lexical[positions[~missing]] != matched[~missing]
+                matched = np.insert(lexical, positions[missing], matched[missing])
+            facets = snapshot.facet_engine.facets(constraints, matched)
+        return rows, scores, facets, stages
+
+    @staticmethod
+    def _should_rerank(rerank_on: bool, sort_by: str) -> bool:
+        return rerank_on and sort_by == 'relevance'
+
+    def _rerank_plan(self, rows: np.ndarray, rerank_depth: int, start_time: float, latency_budget_ms: float, stages: List[Dict[str, Any]]):
+        """The cascade's (stage, rows to score) steps for this request, within its latency budget if it has one."""
+        deadline = start_time + latency_budget_ms / 1000.0 if latency_budget_ms else None
+        return self.cascade.plan(len(rows), rerank_depth or settings.RERANK_DEPTH, deadline, stages)
+
+    @staticmethod
+    def _rank(snapshot: IndexSnapshot, rows: np.ndarray, scores, rerank: bool, sort_by: str) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        """
+        Orders candidate rows; returns (rows, scores) with scores aligned to rows when
+        reranked. Only the first len(scores) rows were scored by the stage; the rest
+        keep their current order behind them, with NaN scores.
+        """
+        if rerank:
+            scores = np.asarray(scores, dtype=np.float64)
+            order = np.argsort(-scores, kind='stable')
+            depth = len(scores)
+            return np.concatenate([rows[:depth][order], rows[depth:]]), np.concatenate([scores[order], np.full(len(rows) - depth, np.nan)])
+        if sort_by == 'price_asc':
+            prices = np.nan_to_num(snapshot.catalog.price[rows], nan=np.inf)
+            return rows[np.argsort(prices, kind='stable')], None
+        if sort_by == 'price_desc':
+            prices = np.nan_to_num(snapshot.catalog.price[rows], nan=-np.inf)
+            return rows[np.argsort(-prices, kind='stable')], None
+        return rows, None
+
+    @staticmethod
+    def _results(snapshot: IndexSnapshot, rows: np.ndarray, scores: Optional[np.ndarray], top_k: int) -> List[Dict[str, Any]]:
+        """Decodes only the top_k rows that are returned to the caller."""
+        results = snapshot.catalog.products(rows[:top_k])
+        if scores is not None:
+            for product, score in zip(results, scores[:top_k]):
+                product['score'] = None if np.isnan(score) else float(score)
+        return results
+
+    def search(self, query: str, top_k: int, rewrite_on: bool, rerank_on: bool, filters: Dict = None, sort_by: str = 'relevance', nprobe: int = None, ef_search: int = None, rerank_depth: int = None, latency_budget_ms: float = None, debug_timings: bool = False) -> Dict[str, Any]:
+        validate_filters(filters)
+        timings = RequestTimings()
         start_time = time.time()
-        rewritten_info = self.understand_query(query) if rewrite_on else {"rewritten": query, "filters": {}}
+        if self._snapshot_poll_due():
+            self._reload_snapshot()
+        snapshot = self.snapshot
+        response_key = self._response_key(snapshot, query, top_k, rewrite_on, rerank_on, filters, sort_by, nprobe, ef_search, rerank_depth, latency_budget_ms)
+        cached = self._cached_response(response_key, timings, debug_timings)
+        if cached is not None:
+            return cached
+        with timings.stage('rewrite'):
+            rewritten_info = self._cached_rewrite(snapshot, query, rewrite_on) or self._rewrite(snapshot, query, rewrite_on)
         search_query = rewritten_info['rewritten'] or query
-        query_embedding = self.bi_encoder.encode([search_query], convert_to_numpy=True).astype('float32')
-        num_candidates = 200
-        distances, ids = self.faiss_index.search(query_embedding, num_candidates)
-        retrieved_pids = [str(pid) for pid in ids[0] if pid != -1]
-        candidate_products = [self.product_map[pid] for pid in retrieved_pids if pid in self.product_map]
-        facets = self._calculate_facets(candidate_products)
-        if filters:
-            if 'Brand' in filters and filters['Brand']:
-                candidate_products = [p for p in candidate_products if p.get('brand') in filters['Brand']]
-            if 'Price' in filters and filters['Price']:
-                min_price, max_price = filters['Price'][0].split('-')
-                max_price = float(max_price) if max_price != '+' else float('inf')
-                candidate_products = [p for p in candidate_products if p.get('price') and float(min_price) <= p['price'] < max_price]
-        if rerank_on and sort_by == 'relevance':
-            if candidate_products:
-                pairs = [[search_query, f"{p['title']}. {p.get('description', '')}"] for p in candidate_products]
-                scores = self.cross_encoder.predict(pairs)
-                for product, score in zip(candidate_products, scores):
-                    product['score'] = float(score)
-                final_products = sorted(candidate_products, key=lambda x: x['score'], reverse=True)
-            else:
-                final_products = []
-        else:
-            if sort_by == 'price_asc':
-                final_products = sorted(candidate_products, key=lambda x: x.get('price', float('inf')))
-            elif sort_by == 'price_desc':
-                final_products = sorted(candidate_products, key=lambda x: x.get('price', float('-inf')), reverse=True)
-            else:
-                final_products = candidate_products
-        end_time = time.time()
-        return {
+        with timings.stage('encode'):
+            query_embedding = self._cached_embedding(search_query)
+            if query_embedding is None:
+                query_embedding = self._encode_query(search_query)
+        rows, retrieval_scores, facets, stages = self._retrieve(snapshot, search_query, query_embedding, filters, rewritten_info['filters'], nprobe, ef_search, timings)
+        rerank = self._should_rerank(rerank_on, sort_by)
+        rows, scores = self._rank(snapshot, rows, retrieval_scores if rerank else None, rerank, sort_by)
+        if rerank:
+            for stage, n in self._rerank_plan(rows, rerank_depth, start_time, latency_budget_ms, stages):
+                with timings.stage(stage.name):
+                    stage_scores = stage(stage.pairs(snapshot, search_query, rows[:n]))
+                rows, scores = self._rank(snapshot, rows, stage_scores, rerank, sort_by)
+        with timings.stage('results'):
+            results = self._results(snapshot, rows, scores, top_k)
+        response = {
             "original_query": query,
             "rewritten_query": rewritten_info,
-            "results": final_products[:top_k],
+            "results": results,
             "facets": facets,
-            "search_time": round(end_time - start_time, 2)
-        }
\ No newline at end of file
+            "rerank_stages": stages,
+        }
+        return self._finish(response_key, response, timings, debug_timings)
+
+    async def search_async(self, query: str, top_k: int, rewrite_on: bool, rerank_on: bool, filters: Dict = None, sort_by: str = 'relevance', nprobe: int = None, ef_search: int = None, rerank_depth: int = None, latency_budget_ms: float = None, debug_timings: bool = False) -> Dict[str, Any]:
+        """
+        Same pipeline as `search`, but every stage is awaited so the event loop is never blocked.
+
+        Snapshot polling, NER, retrieval, rerank pair building, ranking and result
+        decoding run on the dedicated CPU executor, while encoding and reranking are
+        awaited on the micro-batchers. Raises ServiceOverloadedError
+        when the admission queue is full and FilterError for invalid filters.
+        """
+        validate_filters(filters)
+        timings = RequestTimings()
+        start_time = time.time()
+        if self._snapshot_poll_due():
+            await self.cpu_executor.run(self._reload_snapshot)
+        snapshot = self.snapshot
+        # Cache hits are answered before admission, so they are served even under overload.
+        response_key = self._response_key(snapshot, query, top_k, rewrite_on, rerank_on, filters, sort_by, nprobe, ef_search, rerank_depth, latency_budget_ms)
+        cached = self._cached_response(response_key, timings, debug_timings)
+        if cached is not None:
+            return cached
+        queued = time.perf_counter()
+        async with self.admission.admit():
+            timings.record('admission', time.perf_counter() - queued)
+            with timings.stage('rewrite'):
+                rewritten_info = self._cached_rewrite(snapshot, query, rewrite_on)
+                if rewritten_info is None:
+                    rewritten_info = await self.cpu_executor.run(self._rewrite, snapshot, query, rewrite_on)
+            search_query = rewritten_info['rewritten'] or query
+            with timings.stage('encode'):
+                query_embedding = self._cached_embedding(search_query)
+                if query_embedding is None:
+                    query_embedding = np.asarray(await asyncio.wrap_future(self.query_encoder.submit([search_query])))
+                    self.embedding_cache.set(search_query, query_embedding)
+            rows, retrieval_scores, facets, stages = await self.cpu_executor.run(self._retrieve, snapshot, search_query, query_embedding, filters, rewritten_info['filters'], nprobe, ef_search, timings)
+            rerank = self._should_rerank(rerank_on, sort_by)
+            rows, scores = await self.cpu_executor.run(self._rank, snapshot, rows, retrieval_scores if rerank else None, rerank, sort_by)
+            if rerank:
+                for stage, n in self._rerank_plan(rows, rerank_depth, start_time, latency_budget_ms, stages):
+                    with timings.stage(stage.name):
+                        pairs = await self.cpu_executor.run(stage.pairs, snapshot, search_query, rows[:n])
+                        stage_scores = await asyncio.wrap_future(stage.submit(pairs))
+                    rows, scores = await self.cpu_executor.run(self._rank, snapshot, rows, stage_scores, rerank, sort_by)
+            with timings.stage('results'):
+                results = await self.cpu_executor.run(self._results, snapshot, rows, scores, top_k)
+            response = {
+                "original_query": query,
+                "rewritten_query": rewritten_info,
+                "results": results,
+                "facets": facets,
+                "rerank_stages": stages,
+            }
+            return self._finish(response_key, response, timings, debug_timings)
+
+    def search_batch(self, requests: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Runs many searches together and returns their responses in request order.
+
+        Each request holds the keyword arguments of `search`. The queries share one
+        NER call, one bi-encoder call, one multi-row FAISS search for the unfiltered
+        queries (filtered ones are searched with their own selector) and one
+        cross-encoder call per rerank stage; identical requests are only computed
+        once. latency_budget_ms does not apply to bulk work and is ignored. Every
+        response's search_time (and timings, with debug_timings) is the batch's.
+        """
+        for request in requests:
+            validate_filters(request.get('filters'))
+        timings = RequestTimings()
+        if self._snapshot_poll_due():
+            self._reload_snapshot()
+        snapshot = self.snapshot
+        requests = [{**BATCH_REQUEST_DEFAULTS, **request, 'latency_budget_ms': None} for request in requests]
+        keys = [self._response_key(snapshot, r['query'], r['top_k'], r['rewrite_on'], r['rerank_on'], r['filters'], r['sort_by'], r['nprobe'], r['ef_search'], r['rerank_depth'], None)
+                for r in requests]
+        responses: Dict[Any, Dict[str, Any]] = {}
+        todo: Dict[Any, Dict[str, Any]] = {}
+        for key, request in zip(keys, requests):
+            if key in responses or key in todo:
+                continue
+            cached = self.response_cache.get(key)
+            if cached is not None:
+                responses[key] = cached
+            else:
+                todo[key] = request
+
+        # --- Rewrite: cached rewrites, then query understanding with one NER call ---
+        rewrites: Dict[Any, Dict[str, Any]] = {}
+        with timings.stage('rewrite'):
+            for key, r in todo.items():
+                rewritten_info = self._cached_rewrite(snapshot, r['query'], r['rewrite_on'])
+                if rewritten_info is not None:
+                    rewrites[key] = rewritten_info
+            missing = [key for key in todo if key not in rewrites]
+            understood = self.query_understanding.batch([todo[key]['query'] for key in missing], snapshot.brand_matcher) if missing else []
+            for key, rewritten_info in zip(missing, understood):
+                self.rewrite_cache.set(self._rewrite_key(snapshot, todo[key]['query']), rewritten_info)
+                rewrites[key] = rewritten_info
+        search_queries = {key: rewrites[key]['rewritten'] or r['query'] for key, r in todo.items()}
+
+        # --- Encode: every query not in the embedding cache in one bi-encoder call ---
+        with timings.stage('encode'):
+            embeddings = {text: self._cached_embedding(text) for text in search_queries.values()}
+            missing = [text for text, embedding in embeddings.items() if embedding is None]
+            if missing:
+                encoded = self._encode_batch(missing)
+                for i, text in enumerate(missing):
+                    embeddings[text] = encoded[i:i + 1]
+                    self.embedding_cache.set(text, embeddings[text])
+
+        # --- Retrieve: unfiltered queries with the same ANN knobs share a FAISS search ---
+        with timings.stage('filter'):
+            selections = {key: self._select(snapshot, r['filters'], rewrites[key]['filters']) for key, r in todo.items()}
+        candidates: Dict[Any, Tuple[np.ndarray, np.ndarray]] = {}
+        with timings.stage('faiss'):
+            groups: Dict[Tuple, List[Any]] = {}
+            for key, r in todo.items():
+                if selections[key][1] is None:
+                    groups.setdefault((r['nprobe'], r['ef_search']), []).append(key)
+                else:
+                    candidates[key] = self._ann_search(snapshot, embeddings[search_queries[key]], selections[key][1], ANN_CANDIDATES, r['nprobe'], r['ef_search'])
+            for (nprobe, ef_search), group in groups.items():
+                query_embeddings = np.vstack([embeddings[search_queries[key]] for key in group])
+                candidates.update(zip(group, self._ann_search_many(snapshot, query_embeddings, ANN_CANDIDATES, nprobe, ef_search)))
+        ranked: Dict[Any, Tuple[np.ndarray, Optional[np.ndarray]]] = {}
+        retrieved: Dict[Any, Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]] = {}
+        plans = {}
+        for key, r in todo.items():
+            constraints, allowed = selections[key]
+            rows, retrieval_scores, facets, stages = self._fuse(snapshot, search_queries[key], *candidates[key], constraints, allowed, timings)
+            retrieved[key] = facets, stages
+            rerank = self._should_rerank(r['rerank_on'], r['sort_by'])
+            ranked[key] = self._rank(snapshot, rows, retrieval_scores if rerank else None, rerank, r['sort_by'])
+            if rerank:
+                plans[key] = self._rerank_plan(ranked[key][0], r['rerank_depth'], 0.0, None, stages)
+
+        # --- Rerank: the cascade plans advance in step, one cross-encoder call per stage ---
+        while plans:
+            steps = {}
+            for key, plan in list(plans.items()):
+                step = next(plan, None)
+                if step is None:
+                    del plans[key]
+                else:
+                    steps[key] = step
+            for stage in self.cascade.stages:
+                members = [key for key, (step_stage, _) in steps.items() if step_stage is stage]
+                if not members:
+                    continue
+                with timings.stage(stage.name):
+                    stage_scores = stage.score_many([stage.pairs(snapshot, search_queries[key], ranked[key][0][:steps[key][1]]) for key in members])
+                for key, scores in zip(members, stage_scores):
+                    ranked[key] = self._rank(snapshot, ranked[key][0], scores, True, todo[key]['sort_by'])
+
+        with timings.stage('results'):
+            for key, r in todo.items():
+                rows, scores = ranked[key]
+                facets, stages = retrieved[key]
+                responses[key] = {
+                    "original_query": r['query'],
+                    "rewritten_query": rewrites[key],
+                    "results": self._results(snapshot, rows, scores, r['top_k']),
+                    "facets": facets,
+                    "rerank_stages": stages,
+                }
+                self._cache_response(key, responses[key])
+        elapsed = timings.elapsed()
+        batch_timings = timings.milliseconds(elapsed)
+        return [{**responses[key], "search_time": round(elapsed, 4), **({"timings": batch_timings} if r['debug_timings'] else {})}
+                for key, r in zip(keys, requests)]
+
+    async def search_batch_async(self, requests: List[Dict[str, Any]], chunk_size: int = None) -> AsyncIterator[List[Dict[str, Any]]]:
+        """
+        Runs `search_batch` on the CPU executor `chunk_size` requests at a time and
+        yields each chunk's responses as soon as it is done, so a large batch is never
+        held in memory as a whole. The batch takes one admission slot for its whole
+        run; raises ServiceOverloadedError when the admission queue is full, and
+        FilterError before any work when a request's filters are invalid.
+        """
+        for i, request in enumerate(requests):
+            try:
+                validate_filters(request.get('filters'))
+            except FilterError as e:
+                raise FilterError(f"requests[{i}]: {e}")
+        chunk_size = max(1, chunk_size or settings.SEARCH_BATCH_CHUNK_SIZE)
+        queued = time.perf_counter()
+        async with self.admission.admit():
+            STAGE_SECONDS.observe(time.perf_counter() - queued, 'admission')
+            for start in range(0, len(requests), chunk_size):
+                yield await self.cpu_executor.run(self.search_batch, requests[start:start + chunk_size])
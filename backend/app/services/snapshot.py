@@ -0,0 +1,188 @@
+import fcntl
+import json
+import os
+import shutil
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+import faiss
+import numpy as np
+
+from app.services.catalog import ProductCatalog
+from app.services.facets import FacetEngine
+from app.services.filters import FilterIndex
+from app.services.lexical import LexicalIndex
+from app.services.query_understanding import BrandMatcher
+from app.services.rerank_tokens import RerankTokens
+from app.services.vectors import ExactVectors
+
+# Live index layout under backend/index/:
+#
+#   products.faiss, catalog/        the base index, used until a snapshot exists (on
+#                                   first start its catalog is built from products.jsonl)
+#   snapshots/<name>/               one directory per full build (build_index.py) and
+#                                   per applied update batch, holding its own
+#                                   products.faiss and catalog/ (with filters)
+#   CURRENT                         name of the live snapshot; absent means the base
+#
+# A snapshot directory is never modified once installed. Builds and updates write a
+# new one and then replace CURRENT, so readers (including other worker processes,
+# which poll the live version) only ever switch between complete snapshots.
+
+INDEX_FILE = 'products.faiss'
+CATALOG_DIR = 'catalog'
+POINTER_FILE = 'CURRENT'
+SNAPSHOTS_DIR = 'snapshots'
+
+
+def ann_index(index: faiss.Index) -> faiss.Index:
+    """
+    The ANN index itself, unwrapped from the IDMap that flat and HNSW indexes are
+    built with and from the PCA transform of indexes built with --pca.
+    """
+    index = faiss.downcast_index(index.index) if hasattr(index, 'id_map') else faiss.downcast_index(index)
+    if isinstance(index, faiss.IndexPreTransform):
+        index = faiss.downcast_index(index.index)
+    return index
+
+
+def index_kind(index: faiss.Index) -> str:
+    """Identifies the ANN family behind an index built by build_index.py."""
+    inner = ann_index(index)
+    if isinstance(inner, faiss.IndexIVF):
+        return 'ivf'
+    if isinstance(inner, faiss.IndexHNSW):
+        return 'hnsw'
+    return 'flat'
+
+
+def snapshot_version(path: str) -> str:
+    """Version of the index in `path`: its catalog version and the FAISS file's mtime."""
+    with open(os.path.join(path, CATALOG_DIR, 'meta.json'), 'r', encoding='utf-8') as f:
+        catalog_version = json.load(f)['version']
+    return f"{catalog_version}-{os.stat(os.path.join(path, INDEX_FILE)).st_mtime_ns:x}"
+
+
+class IndexSnapshot:
+    """
+    One consistent version of everything a search reads: catalog, filter index,
+    facet counts, brand matcher, BM25 index, rerank tokens, FAISS index and, for
+    compressed indexes, the exact vectors. The service swaps the whole object at
+    once, and a request holds on to the snapshot it started with.
+    """
+
+    def __init__(self, catalog: ProductCatalog, faiss_index: faiss.Index, faiss_path: str, facet_options: Dict[str, Any], name: Optional[str] = None, token_fingerprint: Optional[str] = None):
+        self.name = name
+        self.catalog = catalog
+        self.rerank_tokens = RerankTokens.open(catalog.path, token_fingerprint)
+        self.lexical_index = LexicalIndex.open(catalog.path)
+        self.vectors = ExactVectors.open(catalog.path)
+        if self.vectors is not None and len(self.vectors) != len(catalog):
+            print(f"Exact vectors in {catalog.path} do not match the catalog rows; results will not be re-scored.")
+            self.vectors = None
+        self.filter_index = FilterIndex.open_or_build(catalog)
+        self.facet_engine = FacetEngine(self.filter_index, **facet_options)
+        # Only brands that still have products are recognised in queries.
+        live = np.diff(self.filter_index.brand_offsets) > 0
+        self.brand_matcher = BrandMatcher(brand for brand, has_rows in zip(catalog.brands, live) if has_rows)
+        self.faiss_index = faiss_index
+        self.faiss_path = faiss_path
+        self.index_kind = index_kind(faiss_index)
+        self.ivf_nlist = faiss.extract_index_ivf(faiss_index).nlist if self.index_kind == 'ivf' else 0
+        # Every cache key starts with this version, so a rebuild or an applied update
+        # invalidates the cached responses
+        # (the same as snapshot_version of its directory).
+        self.version = f"{catalog.version}-{os.stat(faiss_path).st_mtime_ns:x}"
+
+
+class SnapshotStore:
+    """
+    Locates, installs and activates index snapshots in an index directory.
+
+    With `mmap`, FAISS indexes are memory-mapped read-only instead of read into
+    the heap, so processes serving the same snapshot share its pages.
+    """
+
+    def __init__(self, index_dir: str, jsonl_path: Optional[str] = None, retention: int = 2, mmap: bool = False):
+        self.index_dir = index_dir
+        self.jsonl_path = jsonl_path
+        self.retention = max(1, retention)
+        self.mmap = mmap
+        self.pointer_path = os.path.join(index_dir, POINTER_FILE)
+        self.snapshots_dir = os.path.join(index_dir, SNAPSHOTS_DIR)
+
+    def current_name(self) -> Optional[str]:
+        try:
+            with open(self.pointer_path, 'r', encoding='utf-8') as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def current_version(self) -> Optional[str]:
+        """Version of the live snapshot (None while it is missing or being replaced)."""
+        try:
+            return snapshot_version(self.snapshot_dir(self.current_name()))
+        except FileNotFoundError:
+            return None
+
+    def snapshot_dir(self, name: Optional[str]) -> str:
+        return os.path.join(self.snapshots_dir, name) if name else self.index_dir
+
+    def load(self, facet_options: Dict[str, Any], token_fingerprint: Optional[str] = None) -> IndexSnapshot:
+        name = self.current_name()
+        path = self.snapshot_dir(name)
+        if name is None:
+            # Only the base catalog may be converted from products.jsonl on first start.
+            catalog = ProductCatalog.open_or_build(os.path.join(path, CATALOG_DIR), self.jsonl_path)
+        else:
+            catalog = ProductCatalog(os.path.join(path, CATALOG_DIR))
+        faiss_path = os.path.join(path, INDEX_FILE)
+        print(f"Loading snapshot '{name or 'base'}' (catalog {catalog.version}, {len(catalog)} products)...")
+        faiss_index = faiss.read_index(faiss_path, faiss.IO_FLAG_MMAP if self.mmap else 0)
+        return IndexSnapshot(catalog, faiss_index, faiss_path, facet_options, name, token_fingerprint)
+
+    @contextmanager
+    def lock(self):
+        """Serializes writers across processes (the API and the batch CLI)."""
+        os.makedirs(self.index_dir, exist_ok=True)
+        with open(os.path.join(self.index_dir, '.update.lock'), 'w') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def stage(self) -> str:
+        """Creates an empty staging directory for a new snapshot."""
+        os.makedirs(self.snapshots_dir, exist_ok=True)
+        path = os.path.join(self.snapshots_dir, f".staging-{os.getpid()}-{time.time_ns():x}")
+        os.makedirs(path)
+        return path
+
+    def install(self, staging_dir: str, version: str) -> str:
+        """Moves a fully written staging directory into place; returns the snapshot name."""
+        name = f"{time.time_ns():x}-{version}"
+        os.replace(staging_dir, os.path.join(self.snapshots_dir, name))
+        return name
+
+    def activate(self, name: str):
+        """Points CURRENT at an installed snapshot and prunes the oldest ones."""
+        tmp_path = self.pointer_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(name)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.pointer_path)
+        # Older snapshots stay readable by processes that still have them mapped;
+        # removing the files only drops the directory entries.
+        installed = sorted(n for n in os.listdir(self.snapshots_dir) if not n.startswith('.'))
+        for old in installed[:-self.retention]:
+            if old != name:
+                shutil.rmtree(os.path.join(self.snapshots_dir, old), ignore_errors=True)
+
+    def remove_base(self):
+        """Deletes the base index once a snapshot has superseded it."""
+        if os.path.exists(os.path.join(self.index_dir, INDEX_FILE)):
+            os.remove(os.path.join(self.index_dir, INDEX_FILE))
+        shutil.rmtree(os.path.join(self.index_dir, CATALOG_DIR), ignore_errors=True)
@@ -0,0 +1,193 @@
+import os
+import shutil
+from typing import Any, Callable, Dict, Iterable, List, Tuple
+
+import faiss
+import numpy as np
+
+from app.services.catalog import CatalogWriter, ProductCatalog
+from app.services.filters import FilterIndex
+from app.services.lexical import build_lexical_index, patch_lexical_index
+from app.services.rerank_tokens import RerankTokenWriter, tokenize_texts, tokenizer_fingerprint
+from app.services.snapshot import CATALOG_DIR, INDEX_FILE, IndexSnapshot, SnapshotStore
+from app.services.vectors import VectorWriter
+
+# Fields whose change alters the embedded "title. description" text.
+TEXT_FIELDS = ('title', 'description')
+
+
+class UpdateError(ValueError):
+    """Raised when an update batch cannot be applied to the live index."""
+
+
+class IndexUpdater:
+    """
+    Applies product upserts and deletes to an index snapshot without a full rebuild.
+
+    Only products whose title or description changed (or that are new) are
+    re-embedded; price, rating, brand and image changes just rewrite catalog rows.
+    The result is a new snapshot: the FAISS index is copied from its file before it
+    is modified (and reused as is when no vector changed), the catalog is copied
+    column-wise minus the replaced rows, and the filter index is rebuilt from it.
+    Rerank tokens are carried over the same way when a cross-encoder `tokenizer` is
+    given, and so are the exact vectors of a compressed index. The BM25 index, if
+    the base has one, is patched for the rows whose text changed (see lexical.py)
+    and rebuilt once too many rows have been patched since the last build.
+    """
+
+    def __init__(self, store: SnapshotStore, encode: Callable[[List[str]], np.ndarray], facet_options: Dict[str, Any], tokenizer=None):
+        self.store = store
+        self.encode = encode
+        self.facet_options = facet_options
+        self.tokenizer = tokenizer
+        self.token_fingerprint = tokenizer_fingerprint(tokenizer) if tokenizer is not None else None
+
+    @staticmethod
+    def _product_ids(values: Iterable[Any], what: str) -> List[str]:
+        ids = []
+        for value in values:
+            pid = str(value).strip()
+            try:
+                int(pid)
+            except ValueError:
+                raise UpdateError(f"{what}: product_id must be an integer, got {value!r}.")
+            ids.append(pid)
+        return ids
+
+    def apply(self, base: IndexSnapshot, upserts: List[Dict[str, Any]], deletes: List[str]) -> Tuple[IndexSnapshot, Dict[str, Any]]:
+        """
+        Builds, installs and activates the snapshot `base` + changes; returns it and a summary.
+
+        Upserts may be partial: fields left out keep their current values. Within a
+        batch the last upsert of a product wins, and a product cannot be both
+        upserted and deleted.
+        """
+        catalog = base.catalog
+        pending = {}
+        for update in upserts:
+            if 'product_id' not in update:
+                raise UpdateError("Every upsert needs a product_id.")
+            pid = self._product_ids([update['product_id']], "upsert")[0]
+            pending[pid] = {**pending.get(pid, {}), **update, 'product_id': pid}
+        delete_ids = list(dict.fromkeys(self._product_ids(deletes, "delete")))
+        both = set(pending) & set(delete_ids)
+        if both:
+            raise UpdateError(f"Products both upserted and deleted in one batch: {sorted(both)[:10]}")
+
+        delete_rows = catalog.rows_for_ids(np.array([int(pid) for pid in delete_ids], dtype=np.int64))
+        not_found = [pid for pid, row in zip(delete_ids, delete_rows) if row < 0]
+        delete_rows = delete_rows[delete_rows >= 0]
+
+        upsert_rows = catalog.rows_for_ids(np.array([int(pid) for pid in pending], dtype=np.int64))
+        products, texts, embed_ids, embed_texts = [], [], [], []
+        # Base row whose text (so vector, tokens and postings) an upserted product
+        # keeps, or -1 when it is (re-)embedded.
+        text_rows = []
+        for (pid, update), row in zip(pending.items(), upsert_rows):
+            if row >= 0:
+                current = catalog.get(int(row))
+                product = {**current, **update}
+                changed = any((product.get(f) or '') != (current.get(f) or '') for f in TEXT_FIELDS)
+            else:
+                if not update.get('title'):
+                    raise UpdateError(f"New product {pid} needs a title.")
+                product, changed = update, True
+            products.append(product)
+            texts.append(f"{product['title']}. {product.get('description') or ''}")
+            if changed:
+                embed_ids.append(int(pid))
+                embed_texts.append(texts[-1])
+            text_rows.append(-1 if changed else int(row))
+        embed_ids = np.array(embed_ids, dtype=np.int64)
+        replaced_ids = embed_ids[np.isin(embed_ids, catalog.ids[upsert_rows[upsert_rows >= 0]])]
+
+        index, embedded = self._update_index(base, np.asarray(catalog.ids[delete_rows], dtype=np.int64), replaced_ids, embed_ids, embed_texts)
+
+        staging = self.store.stage()
+        try:
+            catalog_dir = os.path.join(staging, CATALOG_DIR)
+            writer = CatalogWriter(catalog_dir, brands=catalog.brands)
+            dropped = np.concatenate([delete_rows, upsert_rows[upsert_rows >= 0]])
+            kept = np.setdiff1d(np.arange(len(catalog), dtype=np.int64), dropped)
+            writer.copy_rows(catalog, kept)
+            writer.extend(products)
+            version = writer.close()
+            FilterIndex.from_catalog(ProductCatalog(catalog_dir)).save(catalog_dir)
+            text_rows = np.array(text_rows, dtype=np.int64)
+            lexical = base.lexical_index
+            if lexical is not None:
+                new_rows = len(kept) + np.arange(len(products), dtype=np.int64)
+                added_rows = new_rows[text_rows < 0]
+                removed = len(catalog) - len(kept) - int((text_rows >= 0).sum())
+                if lexical.patchable(removed + len(added_rows)):
+                    patch_lexical_index(lexical, catalog, ProductCatalog(catalog_dir), kept, text_rows[text_rows >= 0], new_rows[text_rows >= 0], added_rows)
+                else:
+                    build_lexical_index(ProductCatalog(catalog_dir), lexical.meta['k1'], lexical.meta['b'])
+            if base.rerank_tokens is not None and self.tokenizer is not None:
+                max_tokens = base.rerank_tokens.max_tokens
+                token_writer = RerankTokenWriter(catalog_dir, self.token_fingerprint, len(self.tokenizer), max_tokens)
+                token_writer.copy_rows(base.rerank_tokens, kept)
+                token_writer.extend(tokenize_texts(self.tokenizer, texts, max_tokens))
+                token_writer.close()
+            if base.vectors is not None:
+                vector_writer = VectorWriter(catalog_dir, base.vectors.dim)
+                vector_writer.copy_rows(base.vectors, kept)
+                product_vectors = np.empty((len(products), base.vectors.dim), dtype=np.float32)
+                product_vectors[text_rows >= 0] = base.vectors.data[text_rows[text_rows >= 0]]
+                product_vectors[text_rows < 0] = embedded
+                vector_writer.extend(product_vectors)
+                vector_writer.close()
+            if index is base.faiss_index:
+                # Unchanged vectors: share the file instead of writing a copy.
+                os.link(base.faiss_path, os.path.join(staging, INDEX_FILE))
+            else:
+                faiss.write_index(index, os.path.join(staging, INDEX_FILE))
+        except BaseException:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+        name = self.store.install(staging, version)
+        path = self.store.snapshot_dir(name)
+        snapshot = IndexSnapshot(ProductCatalog(os.path.join(path, CATALOG_DIR)), index, os.path.join(path, INDEX_FILE), self.facet_options, name, self.token_fingerprint)
+        self.store.activate(name)
+        summary = {
+            "snapshot": name,
+            "version": snapshot.version,
+            "upserted": len(products),
+            "deleted": len(delete_rows),
+            "not_found": not_found,
+            "embedded": len(embed_ids),
+            "num_products": len(snapshot.catalog),
+        }
+        return snapshot, summary
+
+    def _update_index(self, base: IndexSnapshot, deleted_ids: np.ndarray, replaced_ids: np.ndarray, embed_ids: np.ndarray, embed_texts: List[str]) -> Tuple[faiss.Index, np.ndarray]:
+        """
+        Returns a modified copy of the base FAISS index (or the base itself when no
+        vector changes) and the float32 vectors of `embed_texts`.
+        """
+        if base.index_kind == 'ivf' and hasattr(base.faiss_index, 'id_map'):
+            raise UpdateError("This IVF index wraps its ids in an IDMap, which cannot remove vectors correctly; rebuild it with build_index.py.")
+        if base.index_kind == 'hnsw':
+            # HNSW cannot remove vectors. Deleted products are dropped from the catalog,
+            # which already discards FAISS hits without a catalog row, but a product's
+            # vector can never be replaced and an id can never be reused.
+            if len(replaced_ids):
+                raise UpdateError("The HNSW index cannot replace vectors; changing a product's title or description needs a rebuild (or an IVF/flat index).")
+            reused = np.isin(embed_ids, faiss.vector_to_array(base.faiss_index.id_map))
+            if reused.any():
+                raise UpdateError(f"The HNSW index cannot reuse deleted product ids: {embed_ids[reused][:10].tolist()}")
+            removed = np.zeros(0, dtype=np.int64)
+        else:
+            removed = np.concatenate([deleted_ids, replaced_ids])
+        vectors = np.zeros((0, base.faiss_index.d), dtype=np.float32)
+        if not len(removed) and not len(embed_ids):
+            return base.faiss_index, vectors
+
+        # A private, writable copy: the live index may be memory-mapped read-only.
+        index = faiss.read_index(base.faiss_path)
+        if len(removed):
+            index.remove_ids(removed)
+        if len(embed_ids):
+            vectors = np.ascontiguousarray(self.encode(embed_texts), dtype=np.float32)
+            index.add_with_ids(vectors, embed_ids)
+        return index, vectors
@@ -0,0 +1,83 @@
+import json
+import os
+from typing import Optional
+
+import faiss
+import numpy as np
+
+# Full-precision product embeddings, stored next to the catalog columns when the
+# FAISS index holds compressed vectors (written by build_index.py and by
+# incremental updates):
+#
+#   vectors.f32     float32 embedding of every row, row-major, in catalog row order
+#   vectors.json    dimension
+#
+# The file is memory-mapped; only the rows of a query's shortlist are read when
+# it is re-scored, so it takes disk and page cache rather than heap.
+
+VECTORS_FILE = 'vectors.f32'
+META_FILE = 'vectors.json'
+
+
+class VectorWriter:
+    """Streams float32 embeddings into the vector file of a catalog directory."""
+
+    def __init__(self, path: str, dim: int):
+        self.path = path
+        self.dim = dim
+        self._file = open(os.path.join(path, VECTORS_FILE), 'wb')
+
+    def extend(self, vectors: np.ndarray):
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if len(vectors) and vectors.shape[1] != self.dim:
+            raise ValueError(f"Expected {self.dim}-dimensional vectors, got {vectors.shape[1]}.")
+        vectors.tofile(self._file)
+
+    def copy_rows(self, vectors: "ExactVectors", rows: np.ndarray):
+        """Appends the vectors of existing rows (ascending), one slice per run of consecutive rows."""
+        rows = np.asarray(rows, dtype=np.int64)
+        runs = np.split(rows, np.flatnonzero(np.diff(rows) != 1) + 1) if len(rows) else []
+        for run in runs:
+            self.extend(vectors.data[run[0]:run[-1] + 1])
+
+    def close(self):
+        self._file.close()
+        with open(os.path.join(self.path, META_FILE), 'w', encoding='utf-8') as f:
+            json.dump({"dim": self.dim}, f)
+
+
+def write_vectors(path: str, embeddings: np.ndarray, chunk_size: int = 10_000):
+    """Copies (memory-mapped) embeddings into the catalog directory a chunk at a time."""
+    writer = VectorWriter(path, embeddings.shape[1])
+    for start in range(0, len(embeddings), chunk_size):
+        writer.extend(embeddings[start:start + chunk_size])
+    writer.close()
+
+
+class ExactVectors:
+    """Memory-mapped float32 embeddings by catalog row, for exact re-scoring."""
+
+    def __init__(self, path: str):
+        with open(os.path.join(path, META_FILE), 'r', encoding='utf-8') as f:
+            self.dim: int = json.load(f)['dim']
+        size = os.path.getsize(os.path.join(path, VECTORS_FILE))
+        rows = size // (4 * self.dim)
+        self.data = np.memmap(os.path.join(path, VECTORS_FILE), dtype=np.float32, mode='r', shape=(rows, self.dim)) if rows else np.zeros((0, self.dim), dtype=np.float32)
+
+    @classmethod
+    def open(cls, path: str) -> Optional["ExactVectors"]:
+        """Opens the vector file if the catalog has one, else returns None."""
+        if not os.path.exists(os.path.join(path, META_FILE)):
+            return None
+        return cls(path)
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    def scores(self, query: np.ndarray, rows: np.ndarray, metric_type: int) -> np.ndarray:
+        """Exact similarity (higher is better) of `query` to each row: inner product, or negated squared L2."""
+        vectors = np.asarray(self.data[rows], dtype=np.float32)
+        query = np.asarray(query, dtype=np.float32).reshape(-1)
+        if metric_type == faiss.METRIC_INNER_PRODUCT:
+            return (vectors @ query).astype(np.float64)
+        return -((vectors - query) ** 2).sum(axis=1).astype(np.float64)
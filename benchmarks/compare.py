@@ -0,0 +1,86 @@
+import argparse
+import json
+import sys
+from typing import Dict, Optional
+
+# Diffs two run_benchmark.py result files metric by metric. Latencies, times and
+# memory are better when lower, throughput, recall and hit rates when higher; a
+# change in the wrong direction larger than --threshold is flagged as a regression.
+
+SKIPPED_SECTIONS = ('meta',)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files.")
+    parser.add_argument('baseline')
+    parser.add_argument('candidate')
+    parser.add_argument('--threshold', type=float, default=0.10, help="Relative change counted as a regression (default 10%%).")
+    parser.add_argument('--all', action='store_true', help="Also list metrics without a better/worse direction.")
+    parser.add_argument('--fail-on-regression', action='store_true', help="Exit with status 1 if anything regressed.")
+    return parser.parse_args()
+
+
+def flatten(value, prefix: str = "") -> Dict[str, float]:
+    """Dotted paths of every number; report rows are keyed by their setting."""
+    metrics = {}
+    if isinstance(value, dict):
+        for key, item in value.items():
+            metrics.update(flatten(item, f"{prefix}.{key}" if prefix else str(key)))
+    elif isinstance(value, list):
+        for i, item in enumerate(value):
+            key = item.get("setting", i) if isinstance(item, dict) else i
+            metrics.update(flatten(item, f"{prefix}[{key}]"))
+    elif isinstance(value, (int, float)) and not isinstance(value, bool):
+        metrics[prefix] = float(value)
+    return metrics
+
+
+def direction(metric: str) -> Optional[int]:
+    """+1 if higher is better, -1 if lower is better, None for counts and settings."""
+    name = metric.rsplit(".", 1)[-1]
+    if "qps" in name or "recall" in metric or "hit@" in metric:
+        return 1
+    if name.endswith("_ms") or name == "errors" or "rss_mb" in name or name == "index_mb":
+        return -1
+    # A load level's wall time only reflects how many requests were sent.
+    if name == "seconds" and not metric.startswith("load."):
+        return -1
+    return None
+
+
+def main():
+    args = parse_args()
+    with open(args.baseline, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    with open(args.candidate, 'r', encoding='utf-8') as f:
+        candidate = json.load(f)
+    if baseline.get("meta", {}).get("dataset") != candidate.get("meta", {}).get("dataset"):
+        print("⚠️  The runs used different datasets; differences are not only due to the code.")
+
+    before = flatten({k: v for k, v in baseline.items() if k not in SKIPPED_SECTIONS})
+    after = flatten({k: v for k, v in candidate.items() if k not in SKIPPED_SECTIONS})
+    regressions = 0
+    print(f"{'metric':<52} {'baseline':>12} {'candidate':>12} {'change':>9}")
+    for metric in sorted(set(before) | set(after)):
+        sign = direction(metric)
+        if sign is None and not args.all:
+            continue
+        old, new = before.get(metric), after.get(metric)
+        if old is None or new is None:
+            print(f"{metric:<52} {old if old is not None else '-':>12} {new if new is not None else '-':>12}")
+            continue
+        change = (new - old) / abs(old) if old else (0.0 if new == old else float('inf'))
+        flag = ""
+        if sign is not None and change * sign < -args.threshold:
+            flag = "  REGRESSION"
+            regressions += 1
+        elif sign is not None and change * sign > args.threshold:
+            flag = "  improved"
+        print(f"{metric:<52} {old:>12.4g} {new:>12.4g} {change:>+8.1%}{flag}")
+    print(f"{regressions} regression(s) beyond {args.threshold:.0%}.")
+    if regressions and args.fail_on_regression:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+import argparse
+import asyncio
+import json
+import os
+import resource
+import sys
+import time
+from typing import Dict, List
+
+import numpy as np
+
+# Measures one configuration of the search API in-process: startup time, per-stage
+# latency (from debug_timings), end-to-end QPS at several concurrency levels and
+# peak RSS. Requests go through the FastAPI app over httpx's ASGI transport, so
+# routing, validation and serialization are included but no network is, and the
+# client shares the process (and its CPU) with the service.
+#
+# The service is configured from the environment as usual (DATA_PATH, MODELS_DIR,
+# INDEX_DIR, NER_MODEL, ...); run_benchmark.py sets these for a synthetic dataset.
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend')
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Latency and throughput of the search API for the configured index and models.")
+    parser.add_argument('--queries', required=True, help="queries.jsonl written by synthetic.py (query, kind, product_id).")
+    parser.add_argument('--output', required=True, help="Where the JSON results are written.")
+    parser.add_argument('--top-k', type=int, default=20)
+    parser.add_argument('--warmup', type=int, default=20, help="Requests sent before anything is measured.")
+    parser.add_argument('--stage-requests', type=int, default=200, help="Sequential requests used for per-stage latency.")
+    parser.add_argument('--concurrency', default="1,4,16,64", help="Comma-separated client concurrency levels.")
+    parser.add_argument('--requests', type=int, default=400, help="Requests sent at each concurrency level.")
+    return parser.parse_args()
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS.
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def summarize(values_ms: List[float]) -> Dict[str, float]:
+    values = np.asarray(values_ms, dtype=np.float64)
+    if not len(values):
+        return {"count": 0}
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {"count": int(len(values)), "mean_ms": round(float(values.mean()), 3), "p50_ms": round(float(p50), 3),
+            "p95_ms": round(float(p95), 3), "p99_ms": round(float(p99), 3), "max_ms": round(float(values.max()), 3)}
+
+
+def request_body(query: Dict, top_k: int, debug_timings: bool = False) -> Dict:
+    return {"query": query["query"], "top_k": top_k, "debug_timings": debug_timings}
+
+
+async def stage_latency(client, queries: List[Dict], count: int, top_k: int) -> Dict:
+    """Sequential requests with debug_timings: the stage breakdown without queueing, plus target hit rate."""
+    stages: Dict[str, List[float]] = {}
+    client_ms, hits, kinds = [], 0, {}
+    for i in range(count):
+        query = queries[i % len(queries)]
+        start = time.perf_counter()
+        response = await client.post("/api/v1/search", json=request_body(query, top_k, debug_timings=True))
+        client_ms.append((time.perf_counter() - start) * 1000)
+        response.raise_for_status()
+        body = response.json()
+        for stage, ms in (body.get("timings") or {}).items():
+            stages.setdefault(stage, []).append(ms)
+        hit = any(r["product_id"] == query["product_id"] for r in body["results"])
+        hits += hit
+        kind = kinds.setdefault(query["kind"], [0, 0])
+        kind[0] += hit
+        kind[1] += 1
+    return {
+        "stages": {stage: summarize(values) for stage, values in sorted(stages.items())},
+        "client": summarize(client_ms),
+        f"target_hit@{top_k}": round(hits / max(count, 1), 4),
+        f"target_hit@{top_k}_by_kind": {kind: round(h / n, 4) for kind, (h, n) in sorted(kinds.items())},
+    }
+
+
+async def load_level(client, queries: List[Dict], concurrency: int, total: int, top_k: int) -> Dict:
+    """`total` requests sent by `concurrency` clients that each wait for a response before sending the next."""
+    latencies, statuses = [], {}
+    next_index = iter(range(total))
+
+    async def worker():
+        for i in next_index:
+            start = time.perf_counter()
+            response = await client.post("/api/v1/search", json=request_body(queries[i % len(queries)], top_k))
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+            if response.status_code == 200:
+                latencies.append((time.perf_counter() - start) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall = time.perf_counter() - started
+    return {"requests": total, "seconds": round(wall, 3), "qps": round(len(latencies) / wall, 2),
+            "errors": total - statuses.get(200, 0), "status_codes": {str(k): v for k, v in sorted(statuses.items())},
+            **summarize(latencies)}
+
+
+async def run(app, args, queries: List[Dict]) -> Dict:
+    import httpx
+
+    # The ASGI transport does not run the lifespan, which is where the service is
+    # loaded; startup is the time until /ready answers 200.
+    transport = httpx.ASGITransport(app=app)
+    started = time.perf_counter()
+    async with app.router.lifespan_context(app), httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=None) as client:
+        while (await client.get("/ready")).status_code != 200:
+            if app.state.startup_error:
+                raise RuntimeError(app.state.startup_error)
+            await asyncio.sleep(0.05)
+        startup = {"seconds": round(time.perf_counter() - started, 3), "rss_mb": peak_rss_mb()}
+        print(f"Service ready after {startup['seconds']} s ({startup['rss_mb']} MB RSS)")
+        for i in range(args.warmup):
+            await client.post("/api/v1/search", json=request_body(queries[i % len(queries)], args.top_k))
+        results = {"startup": startup, "latency": await stage_latency(client, queries, args.stage_requests, args.top_k), "load": {}}
+        for level in [int(c) for c in args.concurrency.split(",") if c.strip()]:
+            print(f"Concurrency {level}: {args.requests} requests...")
+            results["load"][str(level)] = await load_level(client, queries, level, args.requests, args.top_k)
+            print(f"  {results['load'][str(level)]['qps']} req/s, p95 {results['load'][str(level)].get('p95_ms')} ms")
+        snapshot = app.state.search_service.snapshot
+        results["index"] = {"kind": snapshot.index_kind, "products": len(snapshot.catalog), "version": snapshot.version}
+    return results
+
+
+def main():
+    args = parse_args()
+    from synthetic import read_queries
+    queries = read_queries(args.queries)
+
+    # --- 1. Startup, latency and throughput ---
+    sys.path.insert(0, BACKEND_DIR)
+    start = time.perf_counter()
+    from app.main import app
+    import_seconds = time.perf_counter() - start
+    results = asyncio.run(run(app, args, queries))
+    results["startup"]["import_seconds"] = round(import_seconds, 3)
+    results["peak_rss_mb"] = peak_rss_mb()
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    print(f"Peak RSS {results['peak_rss_mb']} MB; results written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
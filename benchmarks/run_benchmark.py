@@ -0,0 +1,144 @@
+import argparse
+import datetime
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+
+from synthetic import write_dataset, write_models
+
+# End-to-end offline benchmark: generates a synthetic catalog, query set and
+# stand-in models, builds the index with training/build_index.py, then runs
+# load_test.py against it in a fresh process. Everything lands in --work-dir
+# (reused by later runs with the same arguments) and the measurements in one JSON
+# file that compare.py can diff against another run.
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Reproducible latency, throughput, memory and recall benchmark of the search pipeline.")
+    parser.add_argument('--products', type=int, default=10_000, help="Synthetic catalog size (10k to 5M).")
+    parser.add_argument('--queries', type=int, default=2_000, help="Synthetic queries, each built from one sampled product.")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--index-type', default='flat', help="Passed to build_index.py (flat, ivf_flat, ivf_pq, hnsw).")
+    parser.add_argument('--build-args', default="", help="Extra build_index.py arguments, e.g. \"--nlist 1024 --workers 4\".")
+    parser.add_argument('--eval-k', type=int, default=10, help="k of the recall@k report, measured against exact (flat) search.")
+    parser.add_argument('--models-dir', default=None, help="Use these models (bi-encoder/, cross-encoder/) instead of generated stand-ins.")
+    parser.add_argument('--ner-model', default=None, help="NER model for the service (default: the stand-in, or NER_MODEL with --models-dir).")
+    parser.add_argument('--work-dir', default=None, help="Dataset, models and index location (default: benchmarks/work/<products>-<seed>).")
+    parser.add_argument('--rebuild', action='store_true', help="Rebuild the index even if one from an earlier run exists.")
+    parser.add_argument('--keep-caches', action='store_true', help="Leave the response/embedding/rewrite caches on (off by default, so every request runs the pipeline).")
+    parser.add_argument('--top-k', type=int, default=20)
+    parser.add_argument('--stage-requests', type=int, default=200)
+    parser.add_argument('--concurrency', default="1,4,16,64")
+    parser.add_argument('--requests', type=int, default=400, help="Requests per concurrency level.")
+    parser.add_argument('--output', default=None, help="Results file (default: benchmarks/results/<timestamp>-<products>.json).")
+    return parser.parse_args()
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def children_peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def main():
+    args = parse_args()
+    print("--- Starting Search Benchmark ---")
+
+    # --- 1. Configuration ---
+    WORK_DIR = os.path.abspath(args.work_dir or os.path.join(BENCHMARK_DIR, 'work', f"{args.products}-{args.seed}"))
+    DATA_DIR = os.path.join(WORK_DIR, 'data')
+    MODELS_DIR = os.path.abspath(args.models_dir) if args.models_dir else os.path.join(WORK_DIR, 'models')
+    INDEX_DIR = os.path.join(WORK_DIR, f"index-{args.index_type}")
+    DATASET_META = os.path.join(DATA_DIR, 'dataset.json')
+    OUTPUT = args.output or os.path.join(BENCHMARK_DIR, 'results', f"{datetime.datetime.now():%Y%m%d-%H%M%S}-{args.products}.json")
+    dataset = {"products": args.products, "queries": args.queries, "seed": args.seed}
+
+    # --- 2. Synthetic Dataset and Models ---
+    existing = None
+    if os.path.exists(DATASET_META):
+        with open(DATASET_META, 'r', encoding='utf-8') as f:
+            existing = json.load(f)
+    generate_seconds = 0.0
+    if existing != dataset:
+        print(f"Generating {args.products} products and {args.queries} queries...")
+        start = time.perf_counter()
+        write_dataset(DATA_DIR, args.products, args.queries, args.seed)
+        generate_seconds = time.perf_counter() - start
+        with open(DATASET_META, 'w', encoding='utf-8') as f:
+            json.dump(dataset, f)
+        args.rebuild = True
+    if not args.models_dir and not os.path.isdir(os.path.join(MODELS_DIR, 'bi-encoder')):
+        print("Writing stand-in models...")
+        write_models(MODELS_DIR, args.products, args.seed)
+        args.rebuild = True
+
+    # --- 3. Build the Index ---
+    build = {}
+    meta_file = os.path.join(INDEX_DIR, 'products.index.json')
+    if args.rebuild or not os.path.exists(meta_file):
+        command = [sys.executable, os.path.join(ROOT, 'training', 'build_index.py'),
+                   '--data', os.path.join(DATA_DIR, 'products.jsonl'), '--models-dir', MODELS_DIR, '--index-dir', INDEX_DIR,
+                   '--index-type', args.index_type, '--eval-k', str(args.eval_k), '--seed', str(args.seed), '--restart'] + args.build_args.split()
+        print(f"Building the {args.index_type} index...")
+        start = time.perf_counter()
+        subprocess.run(command, check=True)
+        build = {"seconds": round(time.perf_counter() - start, 3), "peak_rss_mb": children_peak_rss_mb()}
+    else:
+        print(f"Reusing the index in {INDEX_DIR} (--rebuild to rebuild it).")
+    with open(meta_file, 'r', encoding='utf-8') as f:
+        index_meta = json.load(f)
+
+    # --- 4. Load Test ---
+    env = dict(os.environ, DATA_PATH=os.path.join(DATA_DIR, 'products.jsonl'), MODELS_DIR=MODELS_DIR, INDEX_DIR=INDEX_DIR, PYTHONPATH=BENCHMARK_DIR)
+    env['NER_MODEL'] = args.ner_model or (os.environ.get('NER_MODEL', 'dslim/bert-base-NER') if args.models_dir else os.path.join(MODELS_DIR, 'ner'))
+    if not args.keep_caches:
+        env.update(RESPONSE_CACHE_SIZE='0', EMBEDDING_CACHE_SIZE='0', REWRITE_CACHE_SIZE='0')
+    serve_output = os.path.join(WORK_DIR, 'load_test.json')
+    subprocess.run([sys.executable, os.path.join(BENCHMARK_DIR, 'load_test.py'), '--queries', os.path.join(DATA_DIR, 'queries.jsonl'),
+                    '--output', serve_output, '--top-k', str(args.top_k), '--stage-requests', str(args.stage_requests),
+                    '--concurrency', args.concurrency, '--requests', str(args.requests)], check=True, env=env)
+    with open(serve_output, 'r', encoding='utf-8') as f:
+        serving = json.load(f)
+
+    # --- 5. Save Results ---
+    settings = {name: env[name] for name in sorted(env) if name.startswith(('INFERENCE_', 'TORCH_', 'ONNX_', 'RERANK_', 'ENCODE_', 'SEARCH_', 'FAISS_', 'VECTOR_', 'RESCORE_', 'HYBRID_', 'LEXICAL_', 'QUERY_', 'RESPONSE_CACHE', 'EMBEDDING_CACHE', 'REWRITE_CACHE'))}
+    results = {
+        "meta": {
+            "timestamp": datetime.datetime.now().isoformat(timespec='seconds'),
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "dataset": dataset,
+            "index_type": args.index_type,
+            "stand_in_models": not args.models_dir,
+            "settings": settings,
+            "args": vars(args),
+        },
+        "dataset": {"generate_seconds": round(generate_seconds, 3)},
+        "build": build,
+        "recall": index_meta.get("report", []),
+        "index_memory": index_meta.get("memory", {}),
+        **serving,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(OUTPUT)), exist_ok=True)
+    with open(OUTPUT, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    print(f"✅ Results saved to {OUTPUT}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,168 @@
+import json
+import os
+from typing import Dict, Iterator, List
+
+import numpy as np
+
+# Synthetic catalog, query set and stand-in models for the benchmarks. Everything
+# is derived from a seed, so two runs with the same arguments see the same data.
+# The stand-in models are tiny, randomly initialised BERTs with the production
+# architectures: they exercise every stage at realistic shapes, but their
+# relevance is meaningless and their latency is a lower bound for real models.
+
+NOUNS = [
+    "headphones", "earbuds", "speaker", "soundbar", "laptop", "tablet", "monitor", "keyboard", "mouse", "webcam",
+    "router", "charger", "cable", "smartwatch", "camera", "lens", "tripod", "microphone", "printer", "scanner",
+    "backpack", "jacket", "sneakers", "boots", "t-shirt", "hoodie", "jeans", "sunglasses", "wallet", "watch",
+    "blender", "toaster", "kettle", "coffee maker", "air fryer", "vacuum", "lamp", "desk", "chair", "mattress",
+]
+ADJECTIVES = [
+    "wireless", "bluetooth", "portable", "compact", "premium", "budget", "ergonomic", "waterproof", "lightweight", "heavy-duty",
+    "noise-cancelling", "rechargeable", "smart", "foldable", "adjustable", "slim", "rugged", "classic", "vintage", "modern",
+    "organic", "stainless", "leather", "cotton", "mechanical", "gaming", "professional", "outdoor", "travel", "kids",
+]
+COLORS = ["black", "white", "silver", "red", "blue", "green", "grey", "gold", "pink", "navy"]
+FEATURES = [
+    "long battery life", "fast charging", "deep bass", "usb-c", "4k resolution", "touch controls", "voice assistant",
+    "memory foam", "quick release", "anti-slip grip", "dual band", "hd audio", "led display", "eco-friendly materials",
+    "two year warranty", "magnetic mount", "low latency", "high refresh rate", "extra storage", "soft lining",
+]
+SYLLABLES = ["ka", "lo", "mi", "zen", "tor", "vex", "ari", "no", "bel", "qu", "sio", "rax", "ul", "pra", "dy", "fen", "gro", "hal", "jin", "wex"]
+BASE_PRICE = {noun: 10 + 15 * (i % 13) for i, noun in enumerate(NOUNS)}
+PRICE_CEILINGS = [25, 50, 100, 150, 250, 500]
+
+
+def brand_names(num_products: int, seed: int) -> List[str]:
+    """About one brand per 500 products (20 to 2000), capitalized like real brand names."""
+    rng = np.random.default_rng(seed)
+    count = int(np.clip(num_products // 500, 20, 2000))
+    names = set()
+    while len(names) < count:
+        word = "".join(rng.choice(SYLLABLES, size=rng.integers(2, 4)))
+        names.add(word.capitalize() if rng.random() < 0.8 else word.upper())
+    return sorted(names)
+
+
+def iter_products(num_products: int, seed: int, chunk_size: int = 50_000) -> Iterator[Dict]:
+    """Yields products in catalog order; fields are drawn a chunk at a time to keep large catalogs fast."""
+    brands = brand_names(num_products, seed)
+    rng = np.random.default_rng(seed + 1)
+    # Brand popularity is Zipf-like, as in real catalogs.
+    brand_weights = 1.0 / np.arange(1, len(brands) + 1)
+    brand_weights /= brand_weights.sum()
+    for start in range(0, num_products, chunk_size):
+        n = min(chunk_size, num_products - start)
+        brand = rng.choice(len(brands), size=n, p=brand_weights)
+        noun = rng.integers(len(NOUNS), size=n)
+        adj = rng.integers(len(ADJECTIVES), size=(n, 2))
+        color = rng.integers(len(COLORS), size=n)
+        feature = rng.integers(len(FEATURES), size=(n, 2))
+        multiplier = rng.lognormal(0.0, 0.5, size=n)
+        rating = np.clip(rng.normal(4.1, 0.5, size=n), 1.0, 5.0)
+        for i in range(n):
+            row = start + i
+            name = NOUNS[noun[i]]
+            title = f"{ADJECTIVES[adj[i, 0]].capitalize()} {COLORS[color[i]]} {name} {brands[brand[i]][:2].upper()}-{row % 9000 + 1000}"
+            yield {
+                "product_id": str(row + 1),
+                "title": title,
+                "brand": brands[brand[i]],
+                "price": round(BASE_PRICE[name] * float(multiplier[i]), 2),
+                "rating": round(float(rating[i]), 1),
+                "image_url": f"https://via.placeholder.com/200x150?text={name.replace(' ', '+')}",
+                "description": f"{ADJECTIVES[adj[i, 1]].capitalize()} {name} from {brands[brand[i]]} with {FEATURES[feature[i, 0]]} and {FEATURES[feature[i, 1]]}.",
+            }
+
+
+def query_for(product: Dict, kind: str, rng: np.random.Generator) -> str:
+    words = product["title"].split()
+    adjective, color, code = words[0].lower(), words[1], words[-1]
+    name = " ".join(words[2:-1])
+    if kind == "category":
+        return name
+    if kind == "attribute":
+        return f"{adjective} {color} {name}"
+    if kind == "brand":
+        return f"{product['brand']} {name}"
+    if kind == "price":
+        ceiling = next((c for c in PRICE_CEILINGS if c >= product["price"]), PRICE_CEILINGS[-1])
+        return f"{adjective} {name} under ${ceiling}"
+    if kind == "sku":
+        return code.lower()
+    return f"{product['brand']} {adjective} {name} {FEATURES[rng.integers(len(FEATURES))]}"
+
+
+QUERY_KINDS = ["category", "attribute", "brand", "price", "sku", "long"]
+QUERY_WEIGHTS = [0.15, 0.25, 0.2, 0.2, 0.1, 0.1]
+
+
+def write_dataset(directory: str, num_products: int, num_queries: int, seed: int) -> Dict[str, str]:
+    """
+    Streams products.jsonl and queries.jsonl into `directory`. Each query is built
+    from a sampled product, whose id is kept as the query's target.
+    """
+    os.makedirs(directory, exist_ok=True)
+    paths = {"products": os.path.join(directory, "products.jsonl"), "queries": os.path.join(directory, "queries.jsonl")}
+    rng = np.random.default_rng(seed + 2)
+    targets = np.sort(rng.choice(num_products, size=min(num_queries, num_products), replace=False))
+    kinds = rng.choice(QUERY_KINDS, size=len(targets), p=QUERY_WEIGHTS)
+    queries = []
+    cursor = 0
+    with open(paths["products"], "w", encoding="utf-8") as f:
+        for row, product in enumerate(iter_products(num_products, seed)):
+            f.write(json.dumps(product) + "\n")
+            while cursor < len(targets) and targets[cursor] == row:
+                queries.append({"query": query_for(product, kinds[cursor], rng), "kind": str(kinds[cursor]), "product_id": product["product_id"]})
+                cursor += 1
+    order = rng.permutation(len(queries))
+    with open(paths["queries"], "w", encoding="utf-8") as f:
+        for i in order:
+            f.write(json.dumps(queries[i]) + "\n")
+    return paths
+
+
+def read_queries(path: str) -> List[Dict]:
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _vocabulary(brands: List[str]) -> List[str]:
+    """WordPiece vocabulary covering the synthetic texts: whole words, plus characters for codes and prices."""
+    words = set()
+    for phrase in NOUNS + ADJECTIVES + COLORS + FEATURES + brands + ["from", "with", "and", "under"]:
+        words.update(phrase.lower().replace("-", " - ").split())
+    chars = [chr(c) for c in range(ord("a"), ord("z") + 1)] + [str(d) for d in range(10)]
+    return ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]"] + sorted(set(chars) | {"-", ".", "$", ","}) + [f"##{c}" for c in chars] + sorted(words - set(chars))
+
+
+def write_models(models_dir: str, num_products: int, seed: int, hidden_size: int = 64, layers: int = 2):
+    """Writes stand-in bi-encoder/, cross-encoder/ and ner/ models in the layout the service loads."""
+    import torch
+    from sentence_transformers import SentenceTransformer, models
+    from transformers import BertConfig, BertForSequenceClassification, BertForTokenClassification, BertModel, BertTokenizerFast
+
+    torch.manual_seed(seed)
+    os.makedirs(models_dir, exist_ok=True)
+    vocab_file = os.path.join(models_dir, "vocab.txt")
+    with open(vocab_file, "w", encoding="utf-8") as f:
+        f.write("\n".join(_vocabulary(brand_names(num_products, seed))) + "\n")
+    tokenizer = BertTokenizerFast(vocab_file=vocab_file, do_lower_case=True)
+    config = dict(vocab_size=tokenizer.vocab_size, hidden_size=hidden_size, num_hidden_layers=layers,
+                  num_attention_heads=max(1, hidden_size // 32), intermediate_size=hidden_size * 4, max_position_embeddings=256)
+
+    transformer_dir = os.path.join(models_dir, "bi-encoder-transformer")
+    BertModel(BertConfig(**config)).save_pretrained(transformer_dir)
+    tokenizer.save_pretrained(transformer_dir)
+    word_embedding_model = models.Transformer(transformer_dir, max_seq_length=128)
+    pooling_model = models.Pooling(hidden_size)
+    SentenceTransformer(modules=[word_embedding_model, pooling_model]).save(os.path.join(models_dir, "bi-encoder"))
+
+    cross_encoder_dir = os.path.join(models_dir, "cross-encoder")
+    BertForSequenceClassification(BertConfig(num_labels=1, **config)).save_pretrained(cross_encoder_dir)
+    tokenizer.save_pretrained(cross_encoder_dir)
+
+    labels = ["O", "B-ORG", "I-ORG", "B-MISC", "I-MISC"]
+    ner_dir = os.path.join(models_dir, "ner")
+    ner_config = BertConfig(id2label=dict(enumerate(labels)), label2id={label: i for i, label in enumerate(labels)}, **config)
+    BertForTokenClassification(ner_config).save_pretrained(ner_dir)
+    tokenizer.save_pretrained(ner_dir)
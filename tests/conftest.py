@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The service code is imported as the `app` package from backend/, as uvicorn does.
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
@@ -0,0 +1,159 @@
+import os
+
+import numpy as np
+import pytest
+
+from app.services.catalog import CatalogWriter, ProductCatalog, write_catalog
+from app.services.lexical import (POSTING_BLOCK, LexicalIndex, _encode_postings, build_lexical_index,
+                                  patch_lexical_index, tokenize)
+
+WORDS = [f"w{i}" for i in range(150)]
+
+
+def make_products(rng: np.random.Generator, count: int, first_id: int = 1):
+    """Products whose words follow a Zipf-like law, so some terms span many posting blocks."""
+    weights = 1.0 / np.arange(1, len(WORDS) + 1)
+    weights /= weights.sum()
+    def text(length):
+        return " ".join(WORDS[i] for i in rng.choice(len(WORDS), length, p=weights))
+    return [{"product_id": str(first_id + i), "title": f"{text(4)} sku-{first_id + i}", "description": text(12),
+             "brand": f"brand{i % 5}", "price": float(i % 90), "rating": 4.0} for i in range(count)]
+
+
+def brute_force(index: LexicalIndex, query: str, k: int, allowed=None):
+    """Top k by summing every query term's full postings over the whole catalog."""
+    dense = np.zeros(index.num_docs, dtype=np.int64)
+    for term in index._term_ids(query):
+        docs, impacts = index._postings(term)
+        dense[docs] += impacts
+    rows = np.flatnonzero(dense)
+    if allowed is not None:
+        rows = rows[np.isin(rows, allowed)]
+    top = np.lexsort((rows, -dense[rows]))[:k]
+    return rows[top], dense[rows[top]] * index.scale
+
+
+@pytest.fixture(scope="module")
+def catalog(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("catalog"))
+    write_catalog(make_products(np.random.default_rng(0), 3000), path)
+    build_lexical_index(ProductCatalog(path), chunk_size=700)
+    return ProductCatalog(path)
+
+
+def test_encoded_postings_round_trip(tmp_path):
+    rng = np.random.default_rng(1)
+    # Gaps that need 1, 2 and 4 bytes, lists shorter and longer than a block, and an empty one.
+    lists = [np.sort(rng.choice(limit, size, replace=False)) for limit, size in
+             [(300, 200), (5_000_000, 1000), (200_000, 700), (10, 0), (1000, POSTING_BLOCK), (1 << 31, 3)]]
+    offsets = np.concatenate([[0], np.cumsum([len(docs) for docs in lists])]).astype(np.int64)
+    raw = np.concatenate(lists).astype(np.uint32)
+    _encode_postings(str(tmp_path), offsets, raw, block_postings=500)
+    for name in ('lexical_terms', 'lexical_impacts', 'lexical_max'):
+        np.save(os.path.join(tmp_path, f"{name}.npy"), np.zeros(len(raw) if name == 'lexical_impacts' else len(lists), dtype=np.uint8))
+    np.save(os.path.join(tmp_path, 'lexical_offsets.npy'), offsets)
+    with open(os.path.join(tmp_path, 'lexical.json'), 'w', encoding='utf-8') as f:
+        f.write('{"scale": 1.0, "num_docs": 0}')
+    index = LexicalIndex(str(tmp_path))
+
+    assert np.array_equal(index._docs(0, len(lists)), raw)
+    for term, docs in enumerate(lists):
+        assert np.array_equal(index._postings(term)[0], docs)
+    blocks = np.array([0, 3, 7])
+    decoded, _ = index._postings(1, blocks)
+    assert np.array_equal(decoded, np.concatenate([lists[1][b * POSTING_BLOCK:(b + 1) * POSTING_BLOCK] for b in blocks]))
+
+
+def test_postings_hold_the_rows_containing_each_term(catalog):
+    index = LexicalIndex(catalog.path)
+    tokens = [set(tokenize(catalog.rerank_text(row))) for row in range(len(catalog))]
+    for word in WORDS[:40] + ["sku-17", "17"]:
+        terms = index._term_ids(word)
+        if not len(terms) or index.offsets[terms[0] + 1] == index.offsets[terms[0]]:
+            continue
+        expected = [row for row in range(len(catalog)) if word in tokens[row]]
+        assert index._postings(terms[0])[0].tolist() == expected
+
+
+def test_maxscore_top_k_matches_brute_force(catalog, monkeypatch):
+    index = LexicalIndex(catalog.path)
+    block_lookups = []
+    postings = index._postings
+    def counting(term, blocks=None):
+        if blocks is not None:
+            block_lookups.append(term)
+        return postings(term, blocks)
+    monkeypatch.setattr(index, '_postings', counting)
+
+    rng = np.random.default_rng(2)
+    allowed = np.sort(rng.choice(len(catalog), 800, replace=False))
+    queries = [" ".join(rng.choice(WORDS, size)) for size in rng.integers(1, 7, 60)] + ["w0 w1 w2", "w149 w0 w1", "sku-42 w3", "nothing here"]
+    for query in queries:
+        for k in (1, 5, 20, 200):
+            for filter_rows in (None, allowed):
+                rows, scores = index.search(query, k, filter_rows)
+                expected_rows, expected_scores = brute_force(index, query, k, filter_rows)
+                assert np.array_equal(rows, expected_rows), (query, k)
+                assert np.allclose(scores, expected_scores)
+    # The pruned path (decoding only some blocks of a long posting list) was taken.
+    assert block_lookups
+
+
+def test_matching_is_the_union_of_postings(catalog):
+    index = LexicalIndex(catalog.path)
+    for query in ["w0 w1", "w5 w90 w140", "w7", "sku-9 w100", "unknown"]:
+        mask = np.zeros(len(catalog), dtype=bool)
+        for term in index._term_ids(query):
+            mask[index._postings(term)[0]] = True
+        assert np.array_equal(index.matching(query), np.flatnonzero(mask))
+
+
+def test_patch_matches_full_rebuild(catalog, tmp_path):
+    rng = np.random.default_rng(3)
+    base = LexicalIndex(catalog.path)
+    deleted = set(range(0, len(catalog), 7))
+    retitled = set(range(3, len(catalog), 11)) - deleted
+    repriced = set(range(5, len(catalog), 13)) - deleted - retitled
+
+    # Mirrors IndexUpdater: kept rows are copied in order, then the upserted and new
+    # products are appended; repriced ones keep their text (and their postings).
+    upserts, text_rows = [], []
+    for row in sorted(retitled | repriced):
+        product = catalog.get(row)
+        if row in retitled:
+            product["title"] = f"{product['title']} w0 renamed-{row}"
+        else:
+            product["price"] = 1.0
+        upserts.append(product)
+        text_rows.append(-1 if row in retitled else row)
+    added = make_products(rng, 150, first_id=100_000)
+    products = upserts + added
+    text_rows = np.array(text_rows + [-1] * len(added), dtype=np.int64)
+    kept = np.setdiff1d(np.arange(len(catalog)), sorted(deleted | retitled | repriced))
+
+    path = str(tmp_path / "patched")
+    writer = CatalogWriter(path, brands=catalog.brands)
+    writer.copy_rows(catalog, kept)
+    writer.extend(products)
+    writer.close()
+    new_rows = len(kept) + np.arange(len(products))
+    patch_lexical_index(base, catalog, ProductCatalog(path), kept, text_rows[text_rows >= 0], new_rows[text_rows >= 0],
+                        new_rows[text_rows < 0], block_postings=2000)
+    patched = LexicalIndex(path)
+
+    reference_path = str(tmp_path / "rebuilt")
+    write_catalog((ProductCatalog(path).get(row) for row in range(len(kept) + len(products))), reference_path)
+    build_lexical_index(ProductCatalog(reference_path), base.meta['k1'], base.meta['b'])
+    rebuilt = LexicalIndex(reference_path)
+
+    assert patched.num_docs == rebuilt.num_docs
+    assert patched.meta['total_length'] == rebuilt.meta['total_length']
+    assert patched.meta['avgdl'] == pytest.approx(rebuilt.meta['avgdl'])
+    assert patched.meta['patched_rows'] == len(deleted) + 2 * len(retitled) + len(added)
+    assert np.isin(rebuilt.terms, patched.terms).all()
+    positions = np.searchsorted(patched.terms, rebuilt.terms)
+    assert np.array_equal(np.asarray(patched.df)[positions], rebuilt.df)
+    for term, position in enumerate(positions):
+        expected = rebuilt._postings(term)[0]
+        if len(expected):
+            assert np.array_equal(patched._postings(position)[0], expected)
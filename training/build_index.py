@@ -1,64 +1,428 @@
+import argparse
 import faiss
 import numpy as np
 import json
+import math
 import os
+import shutil
+import sys
+import time
 from sentence_transformers import SentenceTransformer
 from tqdm import tqdm
 
-def load_jsonl(path):
-    data = []
+# The catalog format is defined by the backend, which memory-maps what we write here.
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+from app.services.catalog import ProductCatalog, write_catalog
+from app.services.filters import FilterIndex
+from app.services.lexical import build_lexical_index
+from app.services.rerank_tokens import write_rerank_tokens
+from app.services.snapshot import CATALOG_DIR, INDEX_FILE, SnapshotStore, ann_index
+from app.services.vectors import write_vectors
+
+INDEX_TYPES = ('flat', 'ivf_flat', 'ivf_pq', 'hnsw')
+# How flat, IVF and HNSW indexes store each vector: float32, float16 or 8-bit scalar-quantized.
+VECTOR_CODECS = {'none': 'Flat', 'fp16': 'SQfp16', 'sq8': 'SQ8'}
+MB = 1024 * 1024
+
+def iter_products(path, skip=0):
+    """Streams products from a JSONL file, skipping the first `skip` without parsing them."""
     with open(path, 'r', encoding='utf-8') as f:
         for line in f:
-            data.append(json.loads(line))
-    return data
+            if not line.strip():
+                continue
+            if skip:
+                skip -= 1
+                continue
+            yield json.loads(line)
+
+def iter_chunks(path, chunk_size, skip=0):
+    chunk = []
+    for product in iter_products(path, skip):
+        chunk.append(product)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def count_products(path):
+    with open(path, 'rb') as f:
+        return sum(1 for line in f if line.strip())
+
+def model_files(path):
+    """[relative path, size, mtime_ns] of every file of a model directory, so a retrained or replaced model is told apart."""
+    files = []
+    for root, _, names in os.walk(path):
+        for name in names:
+            stat = os.stat(os.path.join(root, name))
+            files.append([os.path.relpath(os.path.join(root, name), path), stat.st_size, stat.st_mtime_ns])
+    return sorted(files)
+
+class EmbeddingShard:
+    """
+    Append-only embedding and id files with a progress.json checkpoint.
+
+    Each encoded chunk is appended and fsync'ed before the checkpoint advances, so
+    after a crash the files are truncated back to the last checkpoint and encoding
+    resumes from the next unencoded product. A checkpoint written for a different
+    products.jsonl (size or mtime changed) or model (path, or size or mtime of any of
+    its files) is discarded.
+    """
+
+    def __init__(self, work_dir, source, restart=False):
+        self.work_dir = work_dir
+        self.embeddings_path = os.path.join(work_dir, 'embeddings.f32')
+        self.ids_path = os.path.join(work_dir, 'ids.i64')
+        self.progress_path = os.path.join(work_dir, 'progress.json')
+        os.makedirs(work_dir, exist_ok=True)
+
+        progress = {}
+        if not restart and os.path.exists(self.progress_path):
+            with open(self.progress_path, 'r', encoding='utf-8') as f:
+                progress = json.load(f)
+            if progress.get('source') != source:
+                print("Checkpoint was written for different input data or model; starting over.")
+                progress = {}
+        self.source = source
+        self.rows = progress.get('rows', 0)
+        self.dim = progress.get('dim')
+
+        # Anything past the checkpoint is from a chunk that never completed.
+        for path, row_bytes in ((self.embeddings_path, 4 * (self.dim or 0)), (self.ids_path, 8)):
+            with open(path, 'ab') as f:
+                f.truncate(self.rows * row_bytes)
+
+    def append(self, embeddings, ids):
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        if self.dim is None:
+            self.dim = embeddings.shape[1]
+        for path, data in ((self.embeddings_path, embeddings), (self.ids_path, np.ascontiguousarray(ids, dtype=np.int64))):
+            with open(path, 'ab') as f:
+                f.write(data.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+        self.rows += len(embeddings)
+        tmp_path = self.progress_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"source": self.source, "rows": self.rows, "dim": self.dim}, f)
+        os.replace(tmp_path, self.progress_path)
+
+    def embeddings(self):
+        return np.memmap(self.embeddings_path, dtype=np.float32, mode='r', shape=(self.rows, self.dim))
+
+    def ids(self):
+        return np.memmap(self.ids_path, dtype=np.int64, mode='r', shape=(self.rows,))
+
+def encode_products(model, data_path, shard, args):
+    """Encodes every product not yet in the shard, chunk by chunk, checkpointing after each."""
+    total = count_products(data_path)
+    if shard.rows:
+        print(f"Resuming from checkpoint: {shard.rows}/{total} products already encoded.")
+    if shard.rows >= total:
+        return
+
+    pool = None
+    if args.workers > 1:
+        print(f"Starting {args.workers} encoding processes...")
+        pool = model.start_multi_process_pool(target_devices=['cpu'] * args.workers)
+    try:
+        with tqdm(total=total, initial=shard.rows, unit='products') as progress:
+            for chunk in iter_chunks(data_path, args.chunk_size, skip=shard.rows):
+                texts = [f"{p['title']}. {p.get('description', '')}" for p in chunk]
+                if pool is not None:
+                    embeddings = model.encode_multi_process(texts, pool, batch_size=args.batch_size)
+                else:
+                    embeddings = model.encode(texts, batch_size=args.batch_size, convert_to_numpy=True)
+                shard.append(embeddings, [int(p['product_id']) for p in chunk])
+                progress.update(len(chunk))
+    finally:
+        if pool is not None:
+            model.stop_multi_process_pool(pool)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Build the FAISS product index.")
+    parser.add_argument('--index-type', choices=INDEX_TYPES, default='flat',
+                        help="flat = exact brute force, ivf_flat / ivf_pq = inverted file (optionally product-quantized), hnsw = graph index.")
+    parser.add_argument('--nlist', type=int, default=None, help="IVF: number of clusters (default: ~4*sqrt(N)).")
+    parser.add_argument('--pq-m', type=int, default=64, help="IVF-PQ: number of sub-quantizers (must divide the embedding dimension).")
+    parser.add_argument('--pq-nbits', type=int, default=8, help="IVF-PQ: bits per sub-quantizer code.")
+    parser.add_argument('--compression', choices=tuple(VECTOR_CODECS), default='none',
+                        help="Vectors stored in flat, ivf_flat and hnsw indexes: none = float32, fp16 = half precision, sq8 = 8-bit scalar-quantized.")
+    parser.add_argument('--pca', type=int, default=0, help="Reduce vectors to this many dimensions with a PCA fitted on the training sample (0 = off).")
+    parser.add_argument('--no-exact-vectors', action='store_true',
+                        help="Do not keep the float32 vectors of a compressed index for exact re-scoring of its shortlist.")
+    parser.add_argument('--rescore-factor', type=int, default=2, help="Report: shortlist size, as a multiple of k, re-scored exactly (RESCORE_FACTOR when serving).")
+    parser.add_argument('--hnsw-m', type=int, default=32, help="HNSW: neighbours per node.")
+    parser.add_argument('--ef-construction', type=int, default=200, help="HNSW: build-time search depth.")
+    parser.add_argument('--train-size', type=int, default=100_000, help="Number of sampled vectors used to train IVF/PQ.")
+    parser.add_argument('--eval-queries', type=int, default=500, help="Sampled queries for the recall-vs-latency report (0 disables it).")
+    parser.add_argument('--eval-k', type=int, default=10, help="k used for recall@k in the report.")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--chunk-size', type=int, default=10_000, help="Products read, encoded and checkpointed at a time (bounds peak memory).")
+    parser.add_argument('--batch-size', type=int, default=64, help="Encoder batch size.")
+    parser.add_argument('--workers', type=int, default=1, help="Encoding processes; >1 starts a sentence-transformers multi-process pool.")
+    parser.add_argument('--data', default=None, help="Products JSONL to index (default: training/data/products.jsonl).")
+    parser.add_argument('--models-dir', default=None, help="Directory with bi-encoder/ and cross-encoder/ (default: backend/models).")
+    parser.add_argument('--index-dir', default=None, help="Where the index, catalog and snapshots are written (default: backend/index).")
+    parser.add_argument('--work-dir', default=None, help="Where embeddings and the resume checkpoint are kept (default: backend/index/build).")
+    parser.add_argument('--restart', action='store_true', help="Ignore an existing checkpoint and re-encode everything.")
+    parser.add_argument('--rerank-max-tokens', type=int, default=256, help="Product-side cross-encoder tokens stored per product.")
+    parser.add_argument('--bm25-k1', type=float, default=1.2, help="BM25 term-frequency saturation of the lexical index.")
+    parser.add_argument('--bm25-b', type=float, default=0.75, help="BM25 document-length normalization of the lexical index.")
+    parser.add_argument('--keep-embeddings', action='store_true', help="Keep the embedding files after a successful build.")
+    return parser.parse_args()
+
+def factory_string(index_type, dim, num_vectors, args):
+    """Translates the CLI index spec into a FAISS index_factory string."""
+    codec = VECTOR_CODECS[args.compression]
+    # The PCA transform is applied to vectors and queries before anything else.
+    pca = ""
+    if args.pca:
+        if not 0 < args.pca < dim:
+            raise ValueError(f"--pca ({args.pca}) must be below the embedding dimension ({dim}).")
+        pca, dim = f"PCA{args.pca},", args.pca
+    if index_type == 'flat':
+        return f"IDMap,{pca}{codec}"
+    if index_type == 'hnsw':
+        return f"IDMap,{pca}HNSW{args.hnsw_m}" + (f"_{codec}" if args.compression != 'none' else "")
+    # A cluster needs ~39 training points, so small catalogs get fewer lists.
+    nlist = args.nlist or max(1, min(int(4 * math.sqrt(num_vectors)), num_vectors // 39))
+    # IVF stores the product ids in its inverted lists itself. It is not wrapped in an
+    # IDMap, whose id translation breaks when vectors are removed by incremental updates.
+    if index_type == 'ivf_flat':
+        return f"{pca}IVF{nlist},{codec}"
+    if args.compression != 'none':
+        raise ValueError("ivf_pq already compresses its vectors; --compression applies to flat, ivf_flat and hnsw.")
+    if dim % args.pq_m != 0:
+        raise ValueError(f"--pq-m ({args.pq_m}) must divide the embedding dimension ({dim}).")
+    return f"{pca}IVF{nlist},PQ{args.pq_m}x{args.pq_nbits}"
+
+def is_compressed(index_type, args):
+    """Whether the index holds lossy vectors, whose shortlist is worth re-scoring exactly."""
+    return args.compression != 'none' or args.pca > 0 or index_type == 'ivf_pq'
+
+def build_faiss_index(embeddings, ids_array, index_type, args):
+    num_vectors, dim = embeddings.shape
+    spec = factory_string(index_type, dim, num_vectors, args)
+    print(f"Building '{index_type}' index ({spec})...")
+    index = faiss.index_factory(dim, spec)
+
+    inner = ann_index(index)
+    if isinstance(inner, faiss.IndexHNSW):
+        inner.hnsw.efConstruction = args.ef_construction
+
+    if not index.is_trained:
+        rng = np.random.default_rng(args.seed)
+        train_size = min(args.train_size, num_vectors)
+        sample = embeddings[np.sort(rng.choice(num_vectors, size=train_size, replace=False))]
+        print(f"Training on a sample of {train_size} vectors...")
+        index.train(sample)
+
+    # Added a chunk at a time so only one chunk of the memory-mapped shard is resident.
+    for start in range(0, num_vectors, args.chunk_size):
+        end = min(start + args.chunk_size, num_vectors)
+        index.add_with_ids(np.ascontiguousarray(embeddings[start:end]), np.ascontiguousarray(ids_array[start:end]))
+    return index, spec
+
+def search_param_sweep(index):
+    """Yields (label, knob values, SearchParameters) for each setting of the index's speed/accuracy knob."""
+    inner = ann_index(index)
+    if isinstance(inner, faiss.IndexIVF):
+        nprobe = 1
+        while nprobe <= inner.nlist:
+            yield f"nprobe={nprobe}", {"nprobe": nprobe}, faiss.SearchParametersIVF(nprobe=nprobe)
+            nprobe *= 2
+    elif isinstance(inner, faiss.IndexHNSW):
+        for ef_search in (16, 32, 64, 128, 256, 512):
+            yield f"efSearch={ef_search}", {"ef_search": ef_search}, faiss.SearchParametersHNSW(efSearch=ef_search)
+    else:
+        yield "exact", {}, None
+
+def exact_neighbours(queries, embeddings, k, chunk_size):
+    """Brute-force L2 k-NN positions, scanning the (memory-mapped) embeddings a chunk at a time."""
+    heap = faiss.ResultHeap(len(queries), k)
+    for start in range(0, len(embeddings), chunk_size):
+        distances, positions = faiss.knn(queries, np.ascontiguousarray(embeddings[start:start + chunk_size]), k)
+        heap.add_result(distances, np.where(positions >= 0, positions + start, -1))
+    heap.finalize()
+    return heap.I
+
+def exact_rescore(queries, found, embeddings, ids_array, k):
+    """Re-ranks each query's FAISS results by exact L2 distance to the float32 embeddings; returns the best k ids."""
+    order = np.argsort(ids_array, kind='stable')
+    sorted_ids = np.asarray(ids_array)[order]
+    top = np.full((len(queries), k), -1, dtype=np.int64)
+    for i, ids in enumerate(found):
+        # Sorted positions read the memory-mapped embeddings front to back.
+        positions = np.sort(order[np.searchsorted(sorted_ids, ids[ids >= 0])])
+        distances = ((np.asarray(embeddings[positions]) - queries[i]) ** 2).sum(axis=1)
+        best = positions[np.argsort(distances, kind='stable')[:k]]
+        top[i, :len(best)] = np.asarray(ids_array)[best]
+    return top
+
+def recall_latency_report(index, embeddings, ids_array, num_queries, k, seed, chunk_size, rescore_factor=0):
+    """
+    Measures recall@k against exact search and per-query latency for each knob
+    setting. With a `rescore_factor`, also after exactly re-scoring the best
+    k * rescore_factor results, as the backend does for compressed indexes.
+    """
+    rng = np.random.default_rng(seed)
+    num_queries = min(num_queries, len(embeddings))
+    queries = np.ascontiguousarray(embeddings[np.sort(rng.choice(len(embeddings), size=num_queries, replace=False))])
+    k = min(k, len(embeddings))
+
+    truth = np.asarray(ids_array)[exact_neighbours(queries, embeddings, k, chunk_size)]
+
+    def recall(found):
+        return round(sum(len(np.intersect1d(found[i], truth[i])) for i in range(num_queries)) / (num_queries * k), 4)
+
+    rows = []
+    for label, knobs, params in search_param_sweep(index):
+        start = time.perf_counter()
+        _, found = index.search(queries, k, params=params) if params is not None else index.search(queries, k)
+        latency_ms = (time.perf_counter() - start) * 1000 / num_queries
+        rows.append({"setting": label, **knobs, f"recall@{k}": recall(found), "latency_ms": round(latency_ms, 4)})
+        line = f"  {label:<16} recall@{k}={rows[-1][f'recall@{k}']:.4f}  latency={latency_ms:.3f} ms/query"
+        if rescore_factor:
+            start = time.perf_counter()
+            fetch = min(k * rescore_factor, len(embeddings))
+            _, found = index.search(queries, fetch, params=params) if params is not None else index.search(queries, fetch)
+            rescored = exact_rescore(queries, found, embeddings, ids_array, k)
+            latency_ms = (time.perf_counter() - start) * 1000 / num_queries
+            rows[-1].update({f"rescored_recall@{k}": recall(rescored), "rescored_latency_ms": round(latency_ms, 4)})
+            line += f"  rescored recall@{k}={rows[-1][f'rescored_recall@{k}']:.4f}  latency={latency_ms:.3f} ms/query"
+        print(line)
+    return rows
+
+def memory_report(index_path, num_vectors, dim, exact_vectors):
+    """Size of the index file against the float32 vectors an uncompressed index holds in memory."""
+    float32_mb = num_vectors * dim * 4 / MB
+    index_mb = os.path.getsize(index_path) / MB
+    report = {
+        "float32_vectors_mb": round(float32_mb, 2),
+        "index_mb": round(index_mb, 2),
+        "saved_mb": round(float32_mb - index_mb, 2),
+        "compression_ratio": round(float32_mb / max(index_mb, 1e-9), 2),
+    }
+    if exact_vectors:
+        # Memory-mapped: on disk, and in the page cache only for re-scored rows.
+        report["exact_vectors_mb"] = round(float32_mb, 2)
+    return report
+
+def write_catalog_dir(catalog_dir, data_path, ids_array, embeddings, exact_vectors, cross_encoder_path, args):
+    """Writes the columnar catalog with its filter, BM25, vector and rerank token files; returns its version."""
+    catalog_version = write_catalog(iter_products(data_path), catalog_dir)
+    catalog = ProductCatalog(catalog_dir)
+    if not np.array_equal(catalog.ids, ids_array):
+        raise RuntimeError(f"{data_path} changed during the build; rerun with --restart.")
+    FilterIndex.from_catalog(catalog).save(catalog_dir)
+    if exact_vectors:
+        print("Writing the float32 vectors for exact re-scoring...")
+        write_vectors(catalog_dir, embeddings, args.chunk_size)
+    print("Building the BM25 lexical index...")
+    build_lexical_index(catalog, args.bm25_k1, args.bm25_b, args.chunk_size)
+    # Product texts are tokenized for the cross-encoder once here instead of per request.
+    if os.path.isdir(cross_encoder_path):
+        print("Tokenizing product texts for the cross-encoder...")
+        from transformers import AutoTokenizer
+        write_rerank_tokens(catalog, AutoTokenizer.from_pretrained(cross_encoder_path), args.rerank_max_tokens, args.chunk_size)
+    else:
+        print(f"No cross-encoder at {cross_encoder_path}; skipping rerank tokens (they are then tokenized per request).")
+    return catalog_version
 
 def main():
+    args = parse_args()
     print("--- Starting FAISS Index Build ---")
 
     # --- 1. Configuration ---
-    MODEL_PATH = os.path.join(os.path.dirname(__file__), '..', 'backend', 'models', 'bi-encoder')
-    DATA_PATH = os.path.join(os.path.dirname(__file__), 'data', 'products.jsonl')
-    INDEX_SAVE_DIR = os.path.join(os.path.dirname(__file__), '..', 'backend', 'index')
-    INDEX_FILE = os.path.join(INDEX_SAVE_DIR, 'products.faiss')
-    
+    MODELS_DIR = args.models_dir or os.path.join(os.path.dirname(__file__), '..', 'backend', 'models')
+    MODEL_PATH = os.path.join(MODELS_DIR, 'bi-encoder')
+    CROSS_ENCODER_PATH = os.path.join(MODELS_DIR, 'cross-encoder')
+    DATA_PATH = args.data or os.path.join(os.path.dirname(__file__), 'data', 'products.jsonl')
+    INDEX_SAVE_DIR = args.index_dir or os.path.join(os.path.dirname(__file__), '..', 'backend', 'index')
+    INDEX_META_FILE = os.path.join(INDEX_SAVE_DIR, 'products.index.json')
+    WORK_DIR = args.work_dir or os.path.join(INDEX_SAVE_DIR, 'build')
+
     # Ensure the save directory exists
     os.makedirs(INDEX_SAVE_DIR, exist_ok=True)
 
-    # --- 2. Load Model and Data ---
+    # --- 2. Load Model ---
     print("Loading bi-encoder model...")
     model = SentenceTransformer(MODEL_PATH)
-    
-    print("Loading product data...")
-    products = load_jsonl(DATA_PATH)
-    
-    # We need a consistent mapping from index position to product_id
-    product_ids = [p['product_id'] for p in products]
-    
-    # Create text representation for each product
-    product_texts = [f"{p['title']}. {p.get('description', '')}" for p in products]
-
-    # --- 3. Encode Products ---
-    print("Encoding all products... (This may take a while)")
-    embeddings = model.encode(product_texts, show_progress_bar=True, convert_to_numpy=True)
-    embeddings = embeddings.astype('float32') # FAISS requires float32
-    
+
+    # --- 3. Encode Products (streamed, resumable) ---
+    # Products are read and encoded a chunk at a time and appended to a memory-mapped
+    # shard, so peak memory is bounded by --chunk-size rather than the catalog size.
+    data_stat = os.stat(DATA_PATH)
+    source = {"data": os.path.abspath(DATA_PATH), "size": data_stat.st_size, "mtime_ns": data_stat.st_mtime_ns,
+              "model": os.path.abspath(MODEL_PATH), "model_files": model_files(MODEL_PATH)}
+    shard = EmbeddingShard(WORK_DIR, source, restart=args.restart)
+    encode_products(model, DATA_PATH, shard, args)
+
+    embeddings = shard.embeddings()
+    ids_array = shard.ids()
     embedding_dim = embeddings.shape[1]
     print(f"Created {len(embeddings)} embeddings of dimension {embedding_dim}.")
 
     # --- 4. Build and Save FAISS Index ---
-    index = faiss.IndexFlatL2(embedding_dim)  # Using a simple L2 distance index
-    index = faiss.IndexIDMap(index) # Map from FAISS index position to our product_id
-    
-    # FAISS requires integer IDs, so we create a mapping
-    ids_array = np.array([int(pid) for pid in product_ids])
-
-    index.add_with_ids(embeddings, ids_array)
-    
+    index, spec = build_faiss_index(embeddings, ids_array, args.index_type, args)
     print(f"Index built. Total entries: {index.ntotal}")
-    
-    faiss.write_index(index, INDEX_FILE)
-    print(f"✅ FAISS index saved to {INDEX_FILE}")
+
+    # --- 5. Recall vs. Latency Report ---
+    # A compressed index is served with its float32 vectors kept aside, so its
+    # shortlist can be re-scored exactly; the report covers both.
+    exact_vectors = is_compressed(args.index_type, args) and not args.no_exact_vectors
+    report = []
+    if args.eval_queries > 0:
+        print(f"Recall vs. latency ({args.eval_queries} sampled queries, exact search as ground truth):")
+        report = recall_latency_report(index, embeddings, ids_array, args.eval_queries, args.eval_k, args.seed, args.chunk_size,
+                                       args.rescore_factor if exact_vectors else 0)
+
+    # The index and catalog are written into a new snapshot directory and published
+    # together by pointing CURRENT at it, so running backends (which memory-map the
+    # live files) never see a half-written or mismatched index and pick it up on
+    # their next poll.
+    store = SnapshotStore(INDEX_SAVE_DIR)
+    staging = store.stage()
+    try:
+        index_file = os.path.join(staging, INDEX_FILE)
+        faiss.write_index(index, index_file)
+        memory = memory_report(index_file, index.ntotal, embedding_dim, exact_vectors)
+        print(f"Index is {memory['index_mb']} MB against {memory['float32_vectors_mb']} MB of float32 vectors "
+              f"({memory['compression_ratio']}x, {memory['saved_mb']} MB saved).")
+        # --- 6. Write the Columnar Catalog, Filter and Lexical Indexes ---
+        catalog_version = write_catalog_dir(os.path.join(staging, CATALOG_DIR), DATA_PATH, ids_array, embeddings, exact_vectors, CROSS_ENCODER_PATH, args)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    with store.lock():
+        name = store.install(staging, catalog_version)
+        store.activate(name)
+        # A base index left by an older layout is superseded; older snapshots are
+        # pruned by activate.
+        store.remove_base()
+    print(f"✅ Snapshot {name} (catalog {catalog_version}) is live in {INDEX_SAVE_DIR}")
+
+    tmp_meta_file = INDEX_META_FILE + '.tmp'
+    with open(tmp_meta_file, 'w', encoding='utf-8') as f:
+        json.dump({
+            "snapshot": name,
+            "index_type": args.index_type,
+            "factory": spec,
+            "dimension": embedding_dim,
+            "compression": args.compression,
+            "pca": args.pca,
+            "exact_vectors": exact_vectors,
+            "ntotal": int(index.ntotal),
+            "memory": memory,
+            "report": report,
+        }, f, indent=2)
+    os.replace(tmp_meta_file, INDEX_META_FILE)
+
+    if not args.keep_embeddings:
+        del embeddings, ids_array
+        shutil.rmtree(WORK_DIR, ignore_errors=True)
     print("--- FAISS Index Build Complete ---")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
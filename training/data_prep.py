@@ -1,87 +1,216 @@
+import argparse
 import json
-import pandas as pd
 import os
+from itertools import islice
+from typing import Iterator, Optional, Tuple
+
+import numpy as np
+import pandas as pd
 from tqdm import tqdm
-from sklearn.model_selection import train_test_split
 
-def load_jsonl(path):
-    data = []
+# Builds the bi-encoder triplets and cross-encoder pairs from the click logs.
+# Products and queries are loaded once into tables keyed by id; clicks are read a
+# chunk at a time, joined to them by index lookups and written out before the
+# next chunk is read, so memory is bounded by the catalog plus one chunk of clicks.
+
+OUTPUT_FILES = {
+    'bi_train': 'bi_encoder_triplets_train.jsonl',
+    'cross_train': 'cross_encoder_pairs_train.jsonl',
+    'cross_test': 'cross_encoder_pairs_test.jsonl',
+}
+
+def parse_args():
+    root = os.path.join(os.path.dirname(__file__), '..')
+    parser = argparse.ArgumentParser(description="Create training examples from products, queries and click logs.")
+    parser.add_argument('--data-dir', default=os.path.join(os.path.dirname(__file__), 'data'), help="Directory with products.jsonl, queries.jsonl and clicks.jsonl.")
+    parser.add_argument('--output-dir', default=os.path.dirname(__file__), help="Where the example files are written.")
+    parser.add_argument('--chunk-size', type=int, default=500_000, help="Click records read and processed at a time (bounds peak memory).")
+    parser.add_argument('--test-size', type=float, default=0.2, help="Fraction of clicks held out for the test pairs.")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--hard-negatives', type=int, default=0,
+                        help="Mine negatives from the top N FAISS results of each query (0 samples them uniformly from the catalog).")
+    parser.add_argument('--hard-negative-ratio', type=float, default=0.5, help="Share of examples that get a mined negative; the rest stay uniform.")
+    parser.add_argument('--index-dir', default=os.path.join(root, 'backend', 'index'), help="Index built by build_index.py, used for mining.")
+    parser.add_argument('--models-dir', default=os.path.join(root, 'backend', 'models'), help="Directory with the bi-encoder used for mining.")
+    return parser.parse_args()
+
+def iter_jsonl(path: str, fields: Tuple[str, ...], chunk_size: int) -> Iterator[pd.DataFrame]:
+    """Reads `fields` of a JSONL file a chunk of lines at a time."""
     with open(path, 'r', encoding='utf-8') as f:
-        for line in f:
-            data.append(json.loads(line))
-    return pd.DataFrame(data)
-
-def create_examples(df, all_products):
-    bi_encoder_triplets = []
-    cross_encoder_pairs = []
-    
-    # --- FIX: Add a counter for skipped clicks ---
-    skipped_clicks_count = 0
+        for lines in iter(lambda: list(islice(f, chunk_size)), []):
+            records = [json.loads(line) for line in lines if line.strip()]
+            yield pd.DataFrame({field: [record.get(field) for record in records] for field in fields})
 
-    for _, row in tqdm(df.iterrows(), total=df.shape[0]):
-        query = row['raw_query']
-        positive_pid = row['product_id']
-        
-        # --- THIS IS THE FIX ---
-        # 1. Search for the product
-        product_search_result = all_products[all_products['product_id'] == positive_pid]
-        
-        # 2. Check if the search returned any results
-        if not product_search_result.empty:
-            # 3. Only if the product exists, proceed with creating examples
-            positive_product = product_search_result.iloc[0]
-            positive_text = positive_product['text']
-            
-            cross_encoder_pairs.append({"query": query, "product_text": positive_text, "label": 1, "query_id": row['query_id']})
-            
-            negative_sample = all_products[all_products['product_id'] != positive_pid].sample(1).iloc[0]
-            negative_text = negative_sample['text']
-
-            bi_encoder_triplets.append({"query": query, "positive": positive_text, "negative": negative_text})
-            cross_encoder_pairs.append({"query": query, "product_text": negative_text, "label": 0, "query_id": row['query_id']})
-        else:
-            # If the product_id from the click was not found in products.jsonl, skip it.
-            skipped_clicks_count += 1
-            
-    # --- FIX: Report how many clicks were skipped ---
-    if skipped_clicks_count > 0:
-        print(f"\n⚠️  Warning: Skipped {skipped_clicks_count} click records because their product_id was not found in the product catalog.")
-        
-    return bi_encoder_triplets, cross_encoder_pairs
+def load_products(path: str, chunk_size: int) -> pd.Series:
+    """Product text ("title. description") keyed by product_id; the first record of a duplicated id wins."""
+    texts = [pd.Series((chunk['title'].fillna('') + ". " + chunk['description'].fillna('')).values, index=chunk['product_id'].astype(str).values)
+             for chunk in iter_jsonl(path, ('product_id', 'title', 'description'), chunk_size)]
+    products = pd.concat(texts) if texts else pd.Series(dtype=object)
+    return products[~products.index.duplicated(keep='first')]
+
+def load_queries(path: str, chunk_size: int) -> pd.Series:
+    """Raw query text keyed by query_id."""
+    queries = pd.concat([pd.Series(chunk['raw_query'].values, index=chunk['query_id'].astype(str).values)
+                         for chunk in iter_jsonl(path, ('query_id', 'raw_query'), chunk_size)])
+    return queries[~queries.index.duplicated(keep='first')]
+
+def iter_clicks(path: str, queries: pd.Series, products: pd.Series, chunk_size: int) -> Iterator[Tuple[pd.DataFrame, int]]:
+    """
+    Yields the clicks of each chunk as (query row, product row) pairs, joined on
+    the keyed query and product tables, with the number of clicks whose product is
+    not in the catalog. Clicks on unknown queries are dropped, as in an inner join.
+    """
+    for chunk in iter_jsonl(path, ('query_id', 'product_id', 'clicked'), chunk_size):
+        clicked = chunk[chunk['clicked'] == True]
+        joined = pd.DataFrame({
+            'query': queries.index.get_indexer(clicked['query_id'].astype(str)),
+            'row': products.index.get_indexer(clicked['product_id'].astype(str)),
+        })
+        joined = joined[joined['query'].values >= 0]
+        found = joined['row'].values >= 0
+        yield joined[found].reset_index(drop=True), int((~found).sum())
+
+def load_clicked_pairs(path: str, queries: pd.Series, products: pd.Series, chunk_size: int) -> np.ndarray:
+    """Sorted keys (query row * len(products) + product row) of every (query, product) pair clicked anywhere in the log."""
+    clicked = np.zeros(0, dtype=np.int64)
+    for clicks, _ in iter_clicks(path, queries, products, chunk_size):
+        clicked = np.union1d(clicked, clicks['query'].values.astype(np.int64) * len(products) + clicks['row'].values)
+    return clicked
+
+class HardNegativeMiner:
+    """
+    Picks, for each click, a random product among the top `depth` FAISS results of
+    its query that was never clicked for that query anywhere in the log (`clicked`,
+    from load_clicked_pairs). Each distinct query is encoded once per chunk.
+    """
+
+    def __init__(self, model, index, products: pd.Series, queries: pd.Series, clicked: np.ndarray, depth: int, rng: np.random.Generator):
+        self.model = model
+        self.index = index
+        self.products = products
+        self.queries = queries
+        self.clicked = clicked
+        self.depth = depth
+        self.rng = rng
+
+    def __call__(self, clicks: pd.DataFrame) -> np.ndarray:
+        codes, unique_queries = pd.factorize(clicks['query'])
+        embeddings = self.model.encode(list(self.queries.values[unique_queries]), batch_size=256, convert_to_numpy=True)
+        _, ids = self.index.search(np.ascontiguousarray(embeddings, dtype=np.float32), self.depth)
+        # FAISS ids are int(product_id); -1 pads results shorter than `depth`.
+        rows = self.products.index.get_indexer(ids.ravel().astype(str)).reshape(ids.shape)
+        rows[ids < 0] = -1
+        candidates = rows[codes]
+
+        candidate_keys = clicks['query'].values[:, None].astype(np.int64) * len(self.products) + candidates
+        positions = np.minimum(np.searchsorted(self.clicked, candidate_keys), max(len(self.clicked) - 1, 0))
+        clicked = self.clicked[positions] == candidate_keys if len(self.clicked) else np.zeros(candidates.shape, dtype=bool)
+        valid = (candidates >= 0) & ~clicked
+
+        # A random valid column per click: the largest random key among the valid ones.
+        keys = np.where(valid, self.rng.random(candidates.shape), -1.0)
+        hard = candidates[np.arange(len(candidates)), keys.argmax(axis=1)]
+        hard[~valid.any(axis=1)] = -1
+        return hard
+
+def sample_negatives(positives: np.ndarray, num_products: int, rng: np.random.Generator,
+                     miner: Optional[HardNegativeMiner] = None, clicks: Optional[pd.DataFrame] = None, ratio: float = 0.0) -> np.ndarray:
+    """A negative product row per positive: uniform over the other products, or mined for a `ratio` share of them."""
+    # Drawing from num_products - 1 rows and shifting the ones at or past the
+    # positive skips it without rejection sampling.
+    negatives = rng.integers(num_products - 1, size=len(positives))
+    negatives += negatives >= positives
+    if miner is not None and len(positives):
+        hard = miner(clicks)
+        use = (hard >= 0) & (rng.random(len(positives)) < ratio)
+        negatives[use] = hard[use]
+    return negatives
+
+def encode_json(values) -> np.ndarray:
+    """JSON literals of `values`, so repeated texts are escaped once rather than per example."""
+    return np.array([json.dumps(value) for value in values], dtype=object)
+
+def write_triplets(f, query: np.ndarray, positive: np.ndarray, negative: np.ndarray):
+    f.write("".join(f'{{"query": {q}, "positive": {p}, "negative": {n}}}\n' for q, p, n in zip(query, positive, negative)))
+
+def write_pairs(f, query: np.ndarray, positive: np.ndarray, negative: np.ndarray, query_id: np.ndarray):
+    """Each click's positive pair, followed by its negative one."""
+    f.write("".join(
+        f'{{"query": {q}, "product_text": {p}, "label": 1, "query_id": {i}}}\n{{"query": {q}, "product_text": {n}, "label": 0, "query_id": {i}}}\n'
+        for q, p, n, i in zip(query, positive, negative, query_id)
+    ))
+
+def load_miner(args, products: pd.Series, queries: pd.Series, rng: np.random.Generator) -> HardNegativeMiner:
+    import faiss
+    from sentence_transformers import SentenceTransformer
+
+    # The live index is the snapshot named in CURRENT (see backend/app/services/snapshot.py).
+    index_dir = args.index_dir
+    pointer = os.path.join(args.index_dir, 'CURRENT')
+    if os.path.exists(pointer):
+        with open(pointer, 'r', encoding='utf-8') as f:
+            index_dir = os.path.join(args.index_dir, 'snapshots', f.read().strip())
+    index_path = os.path.join(index_dir, 'products.faiss')
+    print(f"Loading {index_path} and the bi-encoder for hard-negative mining...")
+    index = faiss.read_index(index_path)
+    model = SentenceTransformer(os.path.join(args.models_dir, 'bi-encoder'))
+    # A pre-pass over the whole log, so a product clicked for a query in any chunk
+    # is never mined as a negative for it.
+    print("Collecting the products clicked for each query...")
+    clicked = load_clicked_pairs(os.path.join(args.data_dir, 'clicks.jsonl'), queries, products, args.chunk_size)
+    return HardNegativeMiner(model, index, products, queries, clicked, args.hard_negatives, rng)
 
 def main():
+    args = parse_args()
     print("--- Starting Data Preparation with Train/Test Split ---")
-    DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
-    
-    products_df = load_jsonl(os.path.join(DATA_DIR, 'products.jsonl'))
-    queries_df = load_jsonl(os.path.join(DATA_DIR, 'queries.jsonl'))
-    clicks_df = load_jsonl(os.path.join(DATA_DIR, 'clicks.jsonl'))
-
-    merged_df = pd.merge(clicks_df, queries_df, on='query_id')
-    positive_interactions = merged_df[merged_df['clicked'] == True].copy()
-    
-    train_df, test_df = train_test_split(positive_interactions, test_size=0.2, random_state=42)
-
-    all_products = products_df.copy()
-    all_products['text'] = all_products['title'] + ". " + all_products['description'].fillna('')
-    
-    print("Generating training examples...")
-    bi_train, cross_train = create_examples(train_df, all_products)
-    
-    print("Generating testing examples...")
-    _, cross_test = create_examples(test_df, all_products)
-
-    output_dir = os.path.dirname(__file__)
-    for name, data in [
-        ('bi_encoder_triplets_train.jsonl', bi_train),
-        ('cross_encoder_pairs_train.jsonl', cross_train),
-        ('cross_encoder_pairs_test.jsonl', cross_test)
-    ]:
-        path = os.path.join(output_dir, name)
-        with open(path, 'w', encoding='utf-8') as f:
-            for item in data:
-                f.write(json.dumps(item) + '\n')
-        print(f"✅ Saved {len(data)} examples to {path}")
+    rng = np.random.default_rng(args.seed)
+
+    # --- 1. Load the Keyed Product and Query Tables ---
+    products = load_products(os.path.join(args.data_dir, 'products.jsonl'), args.chunk_size)
+    queries = load_queries(os.path.join(args.data_dir, 'queries.jsonl'), args.chunk_size)
+    if len(products) < 2:
+        raise ValueError("Need at least two products to sample negatives.")
+    product_json = encode_json(products.values)
+    query_json, query_id_json = encode_json(queries.values), encode_json(queries.index)
+    print(f"Loaded {len(products)} products and {len(queries)} queries.")
+
+    miner = load_miner(args, products, queries, rng) if args.hard_negatives > 0 else None
+
+    # --- 2. Stream Clicks into Train/Test Examples ---
+    # Each click is assigned to the test split with probability --test-size, so the
+    # split is reproducible for a given seed and chunk size.
+    os.makedirs(args.output_dir, exist_ok=True)
+    paths = {key: os.path.join(args.output_dir, name) for key, name in OUTPUT_FILES.items()}
+    counts = dict.fromkeys(OUTPUT_FILES, 0)
+    skipped_clicks_count = 0
+    files = {key: open(path, 'w', encoding='utf-8') for key, path in paths.items()}
+    try:
+        progress = tqdm(unit=" clicks")
+        for clicks, skipped in iter_clicks(os.path.join(args.data_dir, 'clicks.jsonl'), queries, products, args.chunk_size):
+            skipped_clicks_count += skipped
+            positives = clicks['row'].values
+            negatives = sample_negatives(positives, len(products), rng, miner, clicks, args.hard_negative_ratio)
+            test = rng.random(len(clicks)) < args.test_size
+
+            query, query_id = query_json[clicks['query'].values], query_id_json[clicks['query'].values]
+            positive, negative = product_json[positives], product_json[negatives]
+            train = ~test
+            write_triplets(files['bi_train'], query[train], positive[train], negative[train])
+            write_pairs(files['cross_train'], query[train], positive[train], negative[train], query_id[train])
+            write_pairs(files['cross_test'], query[test], positive[test], negative[test], query_id[test])
+            counts['bi_train'] += int(train.sum())
+            counts['cross_train'] += 2 * int(train.sum())
+            counts['cross_test'] += 2 * int(test.sum())
+            progress.update(len(clicks) + skipped)
+        progress.close()
+    finally:
+        for f in files.values():
+            f.close()
+
+    if skipped_clicks_count > 0:
+        print(f"\n⚠️  Warning: Skipped {skipped_clicks_count} click records because their product_id was not found in the product catalog.")
+    for key, path in paths.items():
+        print(f"✅ Saved {counts[key]} examples to {path}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,162 @@
+import argparse
+import json
+import os
+import shutil
+import sys
+
+import numpy as np
+
+# The ONNX wrappers used for the parity check are the ones the backend serves with.
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+from app.services.inference import OnnxBiEncoder, OnnxCrossEncoder, load_ner_pipeline
+
+QUANTIZATION_TARGETS = ('none', 'avx2', 'avx512', 'avx512_vnni', 'arm64')
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Export the bi-encoder, cross-encoder and NER models to ONNX.")
+    parser.add_argument('--quantize', choices=QUANTIZATION_TARGETS, default='avx512_vnni',
+                        help="Dynamic int8 quantization target CPU (writes model_quantized.onnx next to model.onnx).")
+    parser.add_argument('--ner-model', default='dslim/bert-base-NER')
+    parser.add_argument('--light-cross-encoder', default=None,
+                        help="Also export this smaller cross-encoder (the RERANK_LIGHT_MODEL) to onnx/cross-encoder-light.")
+    parser.add_argument('--skip-parity', action='store_true', help="Skip the PyTorch vs. ONNX parity check.")
+    parser.add_argument('--parity-queries', type=int, default=50)
+    parser.add_argument('--parity-products', type=int, default=200)
+    return parser.parse_args()
+
+def load_jsonl(path, limit=None):
+    data = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            data.append(json.loads(line))
+            if limit and len(data) >= limit:
+                break
+    return data
+
+def quantize(model_dir, target):
+    """Applies dynamic int8 quantization (no calibration data needed) to model.onnx."""
+    from optimum.onnxruntime import ORTQuantizer
+    from optimum.onnxruntime.configuration import AutoQuantizationConfig
+
+    config_factory = getattr(AutoQuantizationConfig, target)
+    qconfig = config_factory(is_static=False, per_channel=False)
+    quantizer = ORTQuantizer.from_pretrained(model_dir, file_name='model.onnx')
+    quantizer.quantize(save_dir=model_dir, quantization_config=qconfig)
+    print(f"  int8 model written to {os.path.join(model_dir, 'model_quantized.onnx')}")
+
+def export(model_cls, source, save_dir, quantize_target):
+    print(f"Exporting {source} -> {save_dir}")
+    from transformers import AutoTokenizer
+
+    model = model_cls.from_pretrained(source, export=True)
+    model.save_pretrained(save_dir)
+    AutoTokenizer.from_pretrained(source).save_pretrained(save_dir)
+    if quantize_target != 'none':
+        quantize(save_dir, quantize_target)
+
+def spearman(a, b):
+    if len(a) < 2:
+        return 1.0
+    ra = np.argsort(np.argsort(a))
+    rb = np.argsort(np.argsort(b))
+    return float(np.corrcoef(ra, rb)[0, 1])
+
+def entity_key(entities):
+    return sorted((e['entity_group'], e['word']) for e in entities)
+
+def parity_check(paths, ner_model, num_queries, num_products):
+    """Compares the ONNX models (as served) against the PyTorch originals on the sample data."""
+    from sentence_transformers import SentenceTransformer, CrossEncoder
+    from transformers import pipeline
+
+    queries = [q['raw_query'] for q in load_jsonl(paths['queries'], num_queries)]
+    products = load_jsonl(paths['products'], num_products)
+    texts = [f"{p['title']}. {p.get('description', '')}" for p in products]
+    report = {}
+
+    # Reference outputs from the PyTorch models, computed once.
+    torch_embeddings = SentenceTransformer(paths['bi'], device='cpu').encode(texts + queries, convert_to_numpy=True)
+    torch_ce = CrossEncoder(paths['cross'], device='cpu')
+    torch_scores = [np.asarray(torch_ce.predict([[query, text] for text in texts])) for query in queries]
+    torch_ner = pipeline("ner", model=ner_model, aggregation_strategy="simple", device='cpu')
+    torch_entities = [entity_key(torch_ner(q)) for q in queries]
+
+    for quantized in (False, True):
+        label = 'int8' if quantized else 'fp32'
+        if quantized and not os.path.exists(os.path.join(paths['onnx_bi'], 'model_quantized.onnx')):
+            continue
+        print(f"Parity check ({label})...")
+
+        onnx_embeddings = OnnxBiEncoder(paths['onnx_bi'], quantized=quantized).encode(texts + queries)
+        a, b = torch_embeddings, onnx_embeddings
+        cosine = (a * b).sum(axis=1) / (np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1) + 1e-12)
+
+        onnx_ce = OnnxCrossEncoder(paths['onnx_cross'], quantized=quantized)
+        correlations, top10_overlap, max_diff = [], [], 0.0
+        for query, s_torch in zip(queries, torch_scores):
+            s_onnx = np.asarray(onnx_ce.predict([[query, text] for text in texts]))
+            max_diff = max(max_diff, float(np.abs(s_torch - s_onnx).max()))
+            correlations.append(spearman(s_torch, s_onnx))
+            k = min(10, len(texts))
+            top10_overlap.append(len(set(np.argsort(-s_torch)[:k]) & set(np.argsort(-s_onnx)[:k])) / k)
+
+        onnx_ner = load_ner_pipeline(ner_model, paths['onnx_ner'], backend='onnx', device='cpu', quantized=quantized, intra_op_threads=0)
+        ner_agreement = float(np.mean([expected == entity_key(onnx_ner(q)) for q, expected in zip(queries, torch_entities)])) if queries else 1.0
+
+        report[label] = {
+            "bi_encoder_min_cosine": round(float(cosine.min()), 5),
+            "bi_encoder_mean_cosine": round(float(cosine.mean()), 5),
+            "cross_encoder_max_abs_diff": round(max_diff, 5),
+            "cross_encoder_mean_spearman": round(float(np.mean(correlations)), 5) if correlations else 1.0,
+            "cross_encoder_mean_top10_overlap": round(float(np.mean(top10_overlap)), 5) if top10_overlap else 1.0,
+            "ner_exact_agreement": round(ner_agreement, 5),
+        }
+        for key, value in report[label].items():
+            print(f"  {key:<34} {value}")
+    return report
+
+def main():
+    args = parse_args()
+    print("--- Starting ONNX Export ---")
+    from optimum.onnxruntime import ORTModelForFeatureExtraction, ORTModelForSequenceClassification, ORTModelForTokenClassification
+
+    # --- 1. Configuration ---
+    ROOT = os.path.join(os.path.dirname(__file__), '..')
+    paths = {
+        'bi': os.path.join(ROOT, 'backend', 'models', 'bi-encoder'),
+        'cross': os.path.join(ROOT, 'backend', 'models', 'cross-encoder'),
+        'onnx_bi': os.path.join(ROOT, 'backend', 'models', 'onnx', 'bi-encoder'),
+        'onnx_cross': os.path.join(ROOT, 'backend', 'models', 'onnx', 'cross-encoder'),
+        'onnx_ner': os.path.join(ROOT, 'backend', 'models', 'onnx', 'ner'),
+        'onnx_cross_light': os.path.join(ROOT, 'backend', 'models', 'onnx', 'cross-encoder-light'),
+        'products': os.path.join(os.path.dirname(__file__), 'data', 'products.jsonl'),
+        'queries': os.path.join(os.path.dirname(__file__), 'data', 'queries.jsonl'),
+    }
+
+    # --- 2. Export (and Quantize) ---
+    export(ORTModelForFeatureExtraction, paths['bi'], paths['onnx_bi'], args.quantize)
+    # The pooling settings live in sentence-transformers' own config files.
+    for extra in ('sentence_bert_config.json', '1_Pooling'):
+        src = os.path.join(paths['bi'], extra)
+        dst = os.path.join(paths['onnx_bi'], extra)
+        if os.path.isdir(src):
+            shutil.copytree(src, dst, dirs_exist_ok=True)
+        elif os.path.exists(src):
+            shutil.copy(src, dst)
+    export(ORTModelForSequenceClassification, paths['cross'], paths['onnx_cross'], args.quantize)
+    export(ORTModelForTokenClassification, args.ner_model, paths['onnx_ner'], args.quantize)
+    if args.light_cross_encoder:
+        export(ORTModelForSequenceClassification, args.light_cross_encoder, paths['onnx_cross_light'], args.quantize)
+
+    # --- 3. Parity Check ---
+    if not args.skip_parity:
+        report = parity_check(paths, args.ner_model, args.parity_queries, args.parity_products)
+        report_path = os.path.join(ROOT, 'backend', 'models', 'onnx', 'parity.json')
+        with open(report_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"✅ Parity report saved to {report_path}")
+
+    print("--- ONNX Export Complete ---")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+import argparse
+import json
+import os
+import sys
+
+# Updates are applied with the backend's own snapshot code, so a running backend
+# picks them up (it polls backend/index/CURRENT) without a restart.
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
+from app.core.config import settings
+from app.services.inference import load_bi_encoder
+from app.services.snapshot import SnapshotStore
+from app.services.updates import IndexUpdater, UpdateError
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Upsert or delete products in the live index without a full rebuild.")
+    parser.add_argument('--upserts', help="JSONL file of products to add or update (partial records keep their other fields).")
+    parser.add_argument('--deletes', help="File with one product_id per line to delete.")
+    parser.add_argument('--delete', nargs='*', default=[], help="Product ids to delete.")
+    parser.add_argument('--batch-size', type=int, default=50_000, help="Changes applied per snapshot.")
+    return parser.parse_args()
+
+def read_upserts(path):
+    if not path:
+        return []
+    with open(path, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def read_deletes(path):
+    if not path:
+        return []
+    with open(path, 'r', encoding='utf-8') as f:
+        return [line.strip() for line in f if line.strip()]
+
+def main():
+    args = parse_args()
+    print("--- Starting Incremental Index Update ---")
+
+    # --- 1. Configuration ---
+    INDEX_DIR = settings.INDEX_DIR
+    MODEL_PATH = os.path.join(settings.MODELS_DIR, 'bi-encoder')
+    CROSS_ENCODER_PATH = os.path.join(settings.MODELS_DIR, 'cross-encoder')
+    ONNX_MODEL_PATH = os.path.join(settings.MODELS_DIR, 'onnx', 'bi-encoder')
+
+    upserts = read_upserts(args.upserts)
+    deletes = read_deletes(args.deletes) + list(args.delete)
+    if not upserts and not deletes:
+        print("Nothing to do.")
+        return
+
+    # --- 2. Load Model ---
+    print(f"Loading bi-encoder model ({settings.INFERENCE_BACKEND} backend)...")
+    model = load_bi_encoder(MODEL_PATH, ONNX_MODEL_PATH, backend=settings.INFERENCE_BACKEND, device=settings.TORCH_DEVICE,
+                            quantized=settings.ONNX_QUANTIZED, intra_op_threads=settings.ONNX_INTRA_OP_THREADS)
+    encode = lambda texts: model.encode(texts, batch_size=64, convert_to_numpy=True)
+    # Needed to carry the pre-tokenized rerank texts over to the new snapshots.
+    tokenizer = None
+    if os.path.isdir(CROSS_ENCODER_PATH):
+        from transformers import AutoTokenizer
+        tokenizer = AutoTokenizer.from_pretrained(CROSS_ENCODER_PATH)
+
+    # --- 3. Apply in Batches ---
+    store = SnapshotStore(INDEX_DIR, settings.DATA_PATH, retention=settings.SNAPSHOT_RETENTION)
+    facet_options = dict(price_boundaries=settings.PRICE_FACET_BOUNDARIES, rating_boundaries=settings.RATING_FACET_BOUNDARIES,
+                         brand_facet_size=settings.BRAND_FACET_SIZE)
+    updater = IndexUpdater(store, encode, facet_options, tokenizer)
+    with store.lock():
+        snapshot = store.load(facet_options, updater.token_fingerprint)
+        for start in range(0, max(len(upserts), len(deletes)), args.batch_size):
+            try:
+                snapshot, summary = updater.apply(snapshot, upserts[start:start + args.batch_size], deletes[start:start + args.batch_size])
+            except UpdateError as e:
+                sys.exit(f"Update rejected: {e}")
+            print(f"Applied snapshot {summary['snapshot']}: {summary['upserted']} upserted "
+                  f"({summary['embedded']} re-embedded), {summary['deleted']} deleted, {len(summary['not_found'])} not found.")
+    print(f"✅ Live index now has {len(snapshot.catalog)} products.")
+    print("--- Incremental Index Update Complete ---")
+
+if __name__ == "__main__":
+    main()